@@ -3,325 +3,4009 @@ Barco ICMP Multi-Hall Control - Web Interface
 Веб-интерфейс для управления несколькими залами одновременно
 """
 
-from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context
-from flask_socketio import SocketIO, emit
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context, has_request_context
+from flask_socketio import SocketIO, emit, join_room, leave_room
+from socketio import PubSubManager
 import socket
 import threading
 import time
 import json
 import random
-from datetime import datetime
+import queue
+from datetime import datetime, timedelta
+from collections import deque
+import atexit
 import os
+import sys
+import asyncio
+import contextvars
+import hashlib
+import gzip
+import functools
+from concurrent.futures import (ThreadPoolExecutor, as_completed, Future, TimeoutError as FutureTimeout,
+                                wait as wait_futures, FIRST_COMPLETED)
+import itertools
+import string
+import fcntl
+import weakref
+import bisect
+import heapq
+import glob
+import sqlite3
+from urllib.parse import urlsplit
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from werkzeug.http import unquote_etag
 
+try:
+    import aiohttp  # опционально: нужен только для CONTROLLER_ENGINE=async
+except ImportError:
+    aiohttp = None
 
-# Базовый URL внешнего TMS API (можно переопределить через TMS_API_BASE)
+
+# Базовый URL внешнего TMS API (можно переопределить через TMS_API_BASE);
+# зал со своим TMS указывает tms_base в halls_config.json
 EXTERNAL_API_BASE = os.environ.get('TMS_API_BASE', 'http://192.168.198.21:8089')
 
+# Пул соединений к TMS: размер пула и таймауты (секунды; для адаптивных таймаутов — потолки)
+TMS_POOL_SIZE = int(os.environ.get('TMS_POOL_SIZE', '10'))
+TMS_CONNECT_TIMEOUT = float(os.environ.get('TMS_CONNECT_TIMEOUT', '3'))
+TMS_TIMEOUT = float(os.environ.get('TMS_TIMEOUT', '5'))
+TMS_COMMAND_TIMEOUT = float(os.environ.get('TMS_COMMAND_TIMEOUT', '10'))
 
-class BarcoController:
-    """Класс для управления одним залом Barco ICMP"""
-    
-    def __init__(self, hall_id, host='192.168.1.100', port=43748, tms_id=None):
-        self.hall_id = hall_id
-        self.tms_id = tms_id or hall_id  # ID устройства во внешнем TMS (если отличается)
-        self.host = host
-        self.port = port
-        self.socket = None
-        self.connected = False
-        self.ack_enabled = False
-        self.lock = threading.Lock()
-        
-    def connect(self):
-        """Подключение к Barco ICMP"""
-        acquired = self.lock.acquire(timeout=10)
-        if not acquired:
-            return False, "Не удалось получить блокировку (timeout)"
-        
-        try:
-            print(f"[{self.hall_id}] Попытка подключения к {self.host}:{self.port}")
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(5)
-            self.socket.connect((self.host, self.port))
-            self.connected = True
-            
-            print(f"[{self.hall_id}] Подключено к {self.host}:{self.port}")
-            
-            # Включаем подтверждения (ACK)
-            success, response = self._send_command_internal("ACK,1")
-            if success:
-                self.ack_enabled = True
-                print(f"[{self.hall_id}] ACK режим включен: {response}")
-            
-            return True, f"Подключено к {self.host}:{self.port}"
-        except Exception as e:
-            print(f"[{self.hall_id}] Ошибка подключения: {str(e)}")
-            self.connected = False
-            return False, f"Ошибка подключения: {str(e)}"
-        finally:
-            self.lock.release()
-    
-    def disconnect(self):
-        """Отключение от Barco ICMP"""
-        acquired = self.lock.acquire(timeout=10)
-        if not acquired:
-            return
-        
-        try:
-            if self.socket:
-                try:
-                    self.socket.close()
-                except:
-                    pass
-            self.connected = False
-            self.socket = None
-            self.ack_enabled = False
-            print(f"[{self.hall_id}] Отключено")
-        finally:
-            self.lock.release()
-    
-    def _send_command_internal(self, command):
-        """Внутренний метод отправки команды (без блокировки)"""
-        if not self.connected or not self.socket:
-            return False, "Не подключено к устройству"
-        
+# Залы с tms_base в halls_config.json обслуживает свой хост TMS (у каждого — свой пул,
+# таймауты и breaker). Сводные маршруты опрашивают все хосты параллельно и ждут
+# не дольше TMS_FANOUT_TIMEOUT секунд: опоздавший хост попадает в сводку
+# последним известным снимком или ошибкой
+TMS_FANOUT_TIMEOUT = float(os.environ.get('TMS_FANOUT_TIMEOUT', '1.5'))
+TMS_FANOUT_WORKERS = int(os.environ.get('TMS_FANOUT_WORKERS', '16'))
+
+# Кеш агрегированного статуса: время жизни снимка и простой фонового обновления (секунды)
+STATUS_CACHE_TTL = float(os.environ.get('STATUS_CACHE_TTL', '1.0'))
+STATUS_CACHE_IDLE = float(os.environ.get('STATUS_CACHE_IDLE', '30'))
+
+# Прокси-маршруты TMS отдают тело как есть; gzip для клиентов, которые его принимают,
+# если тело не меньше PROXY_GZIP_MIN_SIZE байт ('0' в PROXY_GZIP — без сжатия)
+PROXY_GZIP = os.environ.get('PROXY_GZIP', '1') != '0'
+PROXY_GZIP_MIN_SIZE = int(os.environ.get('PROXY_GZIP_MIN_SIZE', '1024'))
+PROXY_GZIP_LEVEL = int(os.environ.get('PROXY_GZIP_LEVEL', '5'))
+
+# SSE-хаб: размер очереди клиента, допустимое число пропусков подряд,
+# heartbeat, пауза до закрытия апстрима без подписчиков и backoff переподключения
+SSE_QUEUE_SIZE = int(os.environ.get('SSE_QUEUE_SIZE', '8'))
+SSE_MAX_SKIPS = int(os.environ.get('SSE_MAX_SKIPS', '30'))
+SSE_HEARTBEAT = float(os.environ.get('SSE_HEARTBEAT', '15'))
+SSE_IDLE_GRACE = float(os.environ.get('SSE_IDLE_GRACE', '10'))
+SSE_RECONNECT_MIN = float(os.environ.get('SSE_RECONNECT_MIN', '1'))
+SSE_RECONNECT_MAX = float(os.environ.get('SSE_RECONNECT_MAX', '30'))
+
+# Адаптивные таймауты: таймаут класса вызовов = p99 недавних задержек × множитель
+# в пределах [нижняя граница, потолок]; пока замеров меньше минимума — потолок.
+# Окно — за сколько секунд учитываются замеры (ADAPTIVE_TIMEOUTS=0 — всегда потолок)
+ADAPTIVE_TIMEOUTS = os.environ.get('ADAPTIVE_TIMEOUTS', '1') == '1'
+LATENCY_MULTIPLIER = float(os.environ.get('LATENCY_MULTIPLIER', '3'))
+LATENCY_MIN_SAMPLES = int(os.environ.get('LATENCY_MIN_SAMPLES', '20'))
+LATENCY_WINDOW = float(os.environ.get('LATENCY_WINDOW', '300'))
+LOCK_WAIT_TIMEOUT = float(os.environ.get('LOCK_WAIT_TIMEOUT', '10'))
+
+# /metrics без входа (для сборщика Prometheus) — только при METRICS_PUBLIC=1;
+# иначе, как и остальная статистика, только для вошедшего администратора
+METRICS_PUBLIC = os.environ.get('METRICS_PUBLIC', '0') == '1'
+
+
+def blocking_call(func, *args, **kwargs):
+    """Блокирующий вызов (SQLite, fsync), не останавливающий цикл событий.
+
+    Под воркером eventlet (monkey patching) потоки приложения — зелёные, и
+    вызов в C-коде задержал бы все соединения процесса: он выполняется в пуле
+    ОС-потоков eventlet.tpool. Иначе — как есть. Внутри func нельзя брать
+    блокировки threading (под eventlet они зелёные).
+    """
+    eventlet = sys.modules.get('eventlet')
+    if eventlet is not None and eventlet.patcher.is_monkey_patched('thread'):
+        from eventlet import tpool
+        return tpool.execute(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными геометрическими корзинами (секунды).
+
+    Хранит накопительные счётчики за всё время (для экспорта) и скользящее
+    окно из двух половин по window/2 секунд — по нему считаются перцентили,
+    чтобы таймауты следовали за текущим состоянием сети.
+    """
+
+    BOUNDS = tuple(round(0.001 * 1.5 ** k, 6) for k in range(28))  # 1 мс .. ~57 с
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.BOUNDS) + 1)  # последняя корзина — +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._current = [0] * len(self._counts)
+        self._previous = [0] * len(self._counts)
+        self._rotated_at = time.monotonic()
+
+    def _bucket(self, seconds):
+        return bisect.bisect_left(self.BOUNDS, seconds)
+
+    def _rotate(self, now):
+        if now - self._rotated_at >= self.window / 2:
+            stale = now - self._rotated_at >= self.window
+            self._previous = [0] * len(self._counts) if stale else self._current
+            self._current = [0] * len(self._counts)
+            self._rotated_at = now
+
+    def observe(self, seconds):
+        i = self._bucket(seconds)
+        with self._lock:
+            self._rotate(time.monotonic())
+            self._counts[i] += 1
+            self._current[i] += 1
+            self._sum += seconds
+            self._count += 1
+
+    def recent(self):
+        """Счётчики корзин за окно"""
+        with self._lock:
+            self._rotate(time.monotonic())
+            return [a + b for a, b in zip(self._current, self._previous)]
+
+    def quantile(self, q, counts=None):
+        """Верхняя граница корзины, в которую попадает q-квантиль окна (None — нет замеров)"""
+        counts = self.recent() if counts is None else counts
+        total = sum(counts)
+        if not total:
+            return None
+        target = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= target:
+                return self.BOUNDS[min(i, len(self.BOUNDS) - 1)]
+        return self.BOUNDS[-1]
+
+    def totals(self):
+        """(счётчики корзин, сумма, количество) за всё время"""
+        with self._lock:
+            return list(self._counts), self._sum, self._count
+
+
+class LatencyRegistry:
+    """Гистограммы задержек по классам вызовов и адаптивные таймауты для них.
+
+    timeout(name) = clamp(p99 окна × multiplier, floor, ceiling). Пока в окне
+    меньше min_samples замеров, используется потолок — прежний фиксированный
+    таймаут. Вызовы, оборвавшиеся по таймауту, тоже записываются (длительностью
+    до обрыва), поэтому при деградации таймаут растёт обратно к потолку.
+    """
+
+    def __init__(self, multiplier=LATENCY_MULTIPLIER, min_samples=LATENCY_MIN_SAMPLES,
+                 adaptive=ADAPTIVE_TIMEOUTS):
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self.adaptive = adaptive
+        self._classes = {}
+
+    def register(self, name, floor, ceiling):
+        self._classes[name] = (LatencyHistogram(), floor, ceiling)
+
+    def histogram(self, name):
+        return self._classes[name][0]
+
+    def observe(self, name, seconds):
+        self._classes[name][0].observe(seconds)
+
+    def timeout(self, name):
+        histogram, floor, ceiling = self._classes[name]
+        if not self.adaptive:
+            return ceiling
+        counts = histogram.recent()
+        if sum(counts) < self.min_samples:
+            return ceiling
+        p99 = histogram.quantile(0.99, counts)
+        return min(max(p99 * self.multiplier, floor), ceiling)
+
+    def names(self):
+        return list(self._classes)
+
+    def stats(self, name=None, buckets=False):
+        result = {}
+        for cls in ([name] if name else self._classes):
+            histogram, floor, ceiling = self._classes[cls]
+            counts = histogram.recent()
+            _, total_sum, total_count = histogram.totals()
+            item = {
+                'window_count': sum(counts),
+                'count': total_count,
+                'avg_ms': round(total_sum / total_count * 1000, 2) if total_count else None,
+                'timeout': round(self.timeout(cls), 3),
+                'floor': floor,
+                'ceiling': ceiling,
+            }
+            for q in (0.5, 0.9, 0.99):
+                value = histogram.quantile(q, counts)
+                item[f'p{int(q * 100)}_ms'] = round(value * 1000, 2) if value is not None else None
+            if buckets:
+                item['buckets'] = [
+                    {'le': histogram.BOUNDS[i] if i < len(histogram.BOUNDS) else '+Inf', 'count': n}
+                    for i, n in enumerate(counts) if n
+                ]
+            result[cls] = item
+        return result
+
+
+# Задержки вызовов по классам: TMS (connect, команды, статус), ICMP, ожидание блокировок
+latency = LatencyRegistry()
+latency.register('tms.connect', 0.2, TMS_CONNECT_TIMEOUT)
+latency.register('tms.command', 1.0, TMS_COMMAND_TIMEOUT)
+latency.register('tms.control', 1.0, TMS_TIMEOUT)
+latency.register('tms.status', 0.5, TMS_TIMEOUT)
+# Ожидание блокировки не адаптивное (нижняя граница = потолок): обычно оно ~0 с, но
+# connect() держит блокировку до таймаута соединения плюс ACK, и команда, пришедшая
+# во время переподключения, должна его дождаться. Замеры остаются в статистике
+latency.register('lock.wait', LOCK_WAIT_TIMEOUT, LOCK_WAIT_TIMEOUT)
+
+
+class _Metric:
+    """Метрика с метками: значения хранятся по кортежу значений меток"""
+
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _label_text(self, key, extra=None):
+        pairs = list(zip(self.labels, key)) + ([extra] if extra else [])
+        if not pairs:
+            return ''
+        escape = lambda v: v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}'
+
+    def samples(self):
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for key, value in sorted(self.samples()):
+            lines.append(f'{self.name}{self._label_text(key)} {value}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Gauge: значение задаётся set()/inc() или вычисляется collect() при выдаче"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=(), collect=None):
+        super().__init__(name, help_text, labels)
+        self.collect = collect  # f() -> {кортеж значений меток: значение}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        if self.collect is None:
+            return super().samples()
         try:
-            if not command.endswith(';'):
-                command = command + ';'
-            
-            self.socket.sendall(command.encode('ascii'))
-            print(f"[{self.hall_id}] Отправлено: {command}")
-            
-            if self.ack_enabled or command.startswith('ACK'):
-                time.sleep(0.1)
-                try:
-                    response = self.socket.recv(1024).decode('ascii').strip()
-                    if response:
-                        print(f"[{self.hall_id}] Ответ: {response}")
-                        if 'ACK' in response:
-                            return True, "ACK"
-                        elif 'NACK' in response:
-                            return False, "NACK"
-                        return True, response
-                    return True, "OK"
-                except socket.timeout:
-                    return True, "OK (timeout)"
-            else:
-                return True, "Отправлено"
-            
+            return [(tuple(str(v) for v in key), value) for key, value in self.collect().items()]
         except Exception as e:
-            print(f"[{self.hall_id}] Ошибка отправки команды: {str(e)}")
-            return False, f"Ошибка: {str(e)}"
-    
-    def send_command(self, command):
-        """Публичный метод отправки команды (с блокировкой)"""
-        acquired = self.lock.acquire(timeout=10)
-        if not acquired:
-            return False, "Не удалось получить блокировку (timeout)"
-        
+            print(f"[metrics] Ошибка сбора {self.name}: {e}")
+            return []
+
+
+class Histogram(_Metric):
+    """Гистограмма в секундах на корзинах LatencyHistogram"""
+
+    kind = 'histogram'
+
+    def observe(self, seconds, **labels):
+        key = self._key(labels)
+        histogram = self._values.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._values.setdefault(key, LatencyHistogram())
+        histogram.observe(seconds)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for key, histogram in sorted(self.samples(), key=lambda item: item[0]):
+            counts, total_sum, total_count = histogram.totals()
+            cumulative = 0
+            for bound, n in zip(LatencyHistogram.BOUNDS + ('+Inf',), counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{self._label_text(key, ("le", str(bound)))} {cumulative}')
+            lines.append(f'{self.name}_sum{self._label_text(key)} {round(total_sum, 6)}')
+            lines.append(f'{self.name}_count{self._label_text(key)} {total_count}')
+        return lines
+
+
+class MetricsRegistry:
+    """Метрики процесса в текстовом формате Prometheus (GET /metrics).
+
+    Обновление метрики — короткая блокировка словаря без ввода-вывода;
+    значения, которые дёшево посчитать при выдаче (подписчики, очереди),
+    собираются колбэками Gauge.collect только при запросе /metrics.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=(), collect=None):
+        return self.add(Gauge(name, help_text, labels, collect))
+
+    def histogram(self, name, help_text, labels=()):
+        return self.add(Histogram(name, help_text, labels))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+metric_tms_request = metrics.histogram(
+    'barco_tms_request_duration_seconds', 'Длительность запросов к TMS по маршрутам-источникам',
+    ('host', 'route', 'method', 'outcome'))
+metric_operation = metrics.histogram(
+    'barco_operation_duration_seconds', 'Длительность команд зала (stop/play/lamp_off) по пути выполнения',
+    ('hall', 'operation', 'path'))
+metric_fallback = metrics.counter(
+    'barco_fallback_total', 'Переходы с TMS на ICMP по причинам', ('hall', 'operation', 'reason'))
+metric_icmp_command = metrics.histogram(
+    'barco_icmp_command_duration_seconds', 'Длительность команд ICMP (с ожиданием блокировки)',
+    ('hall', 'command'))
+metric_scheduled = metrics.counter(
+    'barco_scheduled_actions_total', 'Действия планировщика сеансов', ('hall', 'action', 'outcome'))
+metric_icmp_nack = metrics.counter('barco_icmp_nack_total', 'Ответы NACK на команды ICMP', ('hall', 'command'))
+metric_icmp_reply_timeout = metrics.counter(
+    'barco_icmp_reply_timeout_total', 'Команды ICMP без ответа в пределах таймаута', ('hall',))
+metric_lock_wait = metrics.histogram(
+    'barco_lock_wait_seconds', 'Ожидание блокировки соединения зала', ('hall',))
+metric_lock_timeout = metrics.counter(
+    'barco_lock_timeout_total', 'Неудачные попытки захватить блокировку соединения зала', ('hall',))
+metric_audit_write = metrics.histogram(
+    'barco_audit_write_seconds', 'Запись пачки журнала действий на диск')
+metric_audit_lag = metrics.histogram(
+    'barco_audit_lag_seconds', 'Задержка от log_action до записи на диск (самая старая запись пачки)')
+metric_socketio_clients = metrics.gauge('barco_socketio_clients', 'Подключённые клиенты Socket.IO')
+metric_socketio_clients.set(0)
+metrics.gauge('barco_adaptive_timeout_seconds', 'Текущие адаптивные таймауты по классам вызовов', ('class',),
+              collect=lambda: {(name,): latency.timeout(name) for name in latency.names()})
+
+
+def _command_name(command):
+    """Имя команды ICMP для метки метрик: без аргументов ('tm8710.Send Text,...' -> 'tm8710.Send Text')"""
+    return command.split(',', 1)[0].rstrip(';').strip()
+
+
+class TmsClient:
+    """HTTP-клиент внешнего TMS с пулом keep-alive соединений.
+
+    Один экземпляр на хост TMS: все запросы идут через общий requests.Session,
+    TCP-соединения переиспользуются между запросами. Статистика пула
+    (занятые соединения, доля переиспользования, время connect) — в stats().
+    Адаптивные таймауты у каждого хоста свои: классы задержек
+    <latency_prefix>.connect/.status/.command/.control. Команды проектора
+    (stop/lamp/dowser) ждут до TMS_COMMAND_TIMEOUT, команды управления залом
+    (stop/play/lamp_off контроллера, CP750) — до таймаута чтения, как и статус.
+    """
+
+    def __init__(self, base_url, pool_size=TMS_POOL_SIZE,
+                 connect_timeout=TMS_CONNECT_TIMEOUT, read_timeout=TMS_TIMEOUT, latency_prefix='tms'):
+        self.base_url = base_url.rstrip('/')
+        self.host = urlsplit(self.base_url).netloc or self.base_url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.connect_class = f'{latency_prefix}.connect'
+        self.status_class = f'{latency_prefix}.status'
+        self.command_class = f'{latency_prefix}.command'
+        self.control_class = f'{latency_prefix}.control'
+        if self.connect_class not in latency.names():
+            latency.register(self.connect_class, 0.2, connect_timeout)
+            latency.register(self.command_class, 1.0, TMS_COMMAND_TIMEOUT)
+            latency.register(self.control_class, 1.0, read_timeout)
+            latency.register(self.status_class, 0.5, read_timeout)
+
+        self._stats_lock = threading.Lock()
+        self._pools = weakref.WeakSet()
+        self._connects = 0
+        self._connect_errors = 0
+        self._connect_time_total = 0.0
+        self._connect_time_max = 0.0
+        self._connect_time_last = 0.0
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        adapter.poolmanager.pool_classes_by_scheme = {
+            'http': self._pool_class(HTTPConnectionPool, HTTPConnection),
+            'https': self._pool_class(HTTPSConnectionPool, HTTPSConnection),
+        }
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _pool_class(self, pool_base, conn_base):
+        """Классы пула/соединения urllib3 с замером времени установки соединения"""
+        client = self
+
+        def connect(conn):
+            client._timed_connect(lambda: conn_base.connect(conn))
+
+        def init_pool(pool, *args, **kwargs):
+            pool_base.__init__(pool, *args, **kwargs)
+            client._pools.add(pool)
+
+        conn_cls = type(f'Timed{conn_base.__name__}', (conn_base,), {'connect': connect})
+        return type(f'Timed{pool_base.__name__}', (pool_base,), {
+            'ConnectionCls': conn_cls,
+            '__init__': init_pool,
+        })
+
+    def _timed_connect(self, connect):
+        started = time.perf_counter()
         try:
-            return self._send_command_internal(command)
-        finally:
-            self.lock.release()
-    
-    def stop(self):
-        """Остановка воспроизведения через внешний TMS API с fallback на ICMP.
+            connect()
+        except Exception:
+            latency.observe(self.connect_class, time.perf_counter() - started)
+            with self._stats_lock:
+                self._connect_errors += 1
+            raise
+        elapsed = time.perf_counter() - started
+        latency.observe(self.connect_class, elapsed)
+        with self._stats_lock:
+            self._connects += 1
+            self._connect_time_total += elapsed
+            self._connect_time_last = elapsed
+            self._connect_time_max = max(self._connect_time_max, elapsed)
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
 
-        Попытка: POST {EXTERNAL_API_BASE}/api/{device_id}/stop
-        В случае сетевой ошибки или некорректного ответа — выполняется внутренняя остановка.
-        Возвращает (success: bool, message: str).
+    def request(self, method, path, timeout=None, latency_class=None, **kwargs):
+        """Запрос к TMS через пул. timeout — таймаут чтения (секунды) или кортеж (connect, read).
+
+        Без явного timeout таймауты адаптивные: GET — класс <prefix>.status, остальное —
+        <prefix>.command, если latency_class не задан (см. LatencyRegistry).
+        Потоковые запросы (stream=True) не замеряются.
         """
-        url = f"{EXTERNAL_API_BASE}/api/{self.tms_id}/stop"
+        if latency_class is None:
+            latency_class = self.status_class if method == 'GET' else self.command_class
+        if timeout is None:
+            timeout = latency.timeout(latency_class)
+        if not isinstance(timeout, tuple):
+            timeout = (min(latency.timeout(self.connect_class), timeout), timeout)
+        if kwargs.get('stream'):
+            return self.session.request(method, self.url(path), timeout=timeout, **kwargs)
+        started = time.perf_counter()
+        outcome = 'error'
         try:
-            resp = requests.post(url, timeout=5)
-        except Exception as e:
-            print(f"[{self.hall_id}] Внешний TMS API недоступен при stop: {e}. Применяем внутренний стоп.")
-            return self.send_command("PLAYER.Stop")
+            resp = self.session.request(method, self.url(path), timeout=timeout, **kwargs)
+            outcome = str(resp.status_code)
+            return resp
+        finally:
+            self.observe(method, latency_class, time.perf_counter() - started, outcome)
 
-        if resp.status_code == 200:
+    def observe(self, method, latency_class, elapsed, outcome, route=None):
+        """Замер запроса к хосту: адаптивный таймаут класса и метрика barco_tms_request.
+        route по умолчанию — маршрут текущего HTTP-запроса или 'background'"""
+        if route is None:
+            route = request.url_rule.rule if has_request_context() and request.url_rule else 'background'
+        latency.observe(latency_class, elapsed)
+        metric_tms_request.observe(elapsed, host=self.host, route=route, method=method, outcome=outcome)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def control(self, path, **kwargs):
+        """POST команды управления залом: класс <prefix>.control (потолок — таймаут чтения)"""
+        return self.request('POST', path, latency_class=self.control_class, **kwargs)
+
+    def stats(self):
+        """Статистика пула соединений"""
+        requests_total = 0
+        connections_total = 0
+        in_use = 0
+        idle = 0
+        for pool in list(self._pools):
+            requests_total += pool.num_requests
+            connections_total += pool.num_connections
+            if pool.pool is not None:
+                free = pool.pool.qsize()
+                in_use += pool.pool.maxsize - free
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+
+        with self._stats_lock:
+            connects = self._connects
+            connect_errors = self._connect_errors
+            connect_total = self._connect_time_total
+            connect_last = self._connect_time_last
+            connect_max = self._connect_time_max
+
+        reused = max(0, requests_total - connections_total)
+        return {
+            'base_url': self.base_url,
+            'pool_size': self.pool_size,
+            'timeouts': {
+                'connect': round(latency.timeout(self.connect_class), 3),
+                'status': round(latency.timeout(self.status_class), 3),
+                'command': round(latency.timeout(self.command_class), 3),
+                'control': round(latency.timeout(self.control_class), 3),
+            },
+            'in_use': in_use,
+            'idle': idle,
+            'requests': requests_total,
+            'connections_opened': connections_total,
+            'reuse_ratio': round(reused / requests_total, 3) if requests_total else 0.0,
+            'connect_errors': connect_errors,
+            'connect_time_ms': {
+                'avg': round(connect_total / connects * 1000, 2) if connects else 0.0,
+                'last': round(connect_last * 1000, 2),
+                'max': round(connect_max * 1000, 2),
+            },
+        }
+
+
+class StatusSnapshot:
+    """Снимок агрегированного статуса TMS: тело ответа как есть и его ETag.
+
+    JSON разбирается только при первом обращении к data (насос статуса,
+    ожидание состояния устройства); /api/status/live отдаёт байты тела без
+    разбора, а сжатое тело считается один раз на снимок.
+    """
+
+    __slots__ = ('status_code', 'body', 'content_type', 'etag', 'fetched_at', '_data', '_gzipped')
+
+    _UNPARSED = object()
+
+    def __init__(self, status_code, body, fetched_at, content_type='application/json'):
+        self.status_code = status_code
+        self.body = body
+        self.content_type = content_type
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.fetched_at = fetched_at
+        self._data = self._UNPARSED
+        self._gzipped = None
+
+    @classmethod
+    def from_data(cls, status_code, data, fetched_at):
+        return cls(status_code, json.dumps(data, ensure_ascii=False).encode('utf-8'), fetched_at)
+
+    @property
+    def ok(self):
+        return self.status_code == 200
+
+    @property
+    def data(self):
+        if self._data is self._UNPARSED:
             try:
-                data = resp.json()
-                ok = data.get('ok', True) if isinstance(data, dict) else True
-                return bool(ok), resp.text
+                self._data = json.loads(self.body)
             except ValueError:
-                return True, resp.text
-        else:
-            print(f"[{self.hall_id}] TMS API stop вернул HTTP {resp.status_code}, тело: {resp.text}. Применяем внутренний стоп.")
-            return self.send_command("PLAYER.Stop")
-    
-    def play(self):
-        """Запуск воспроизведения через внешний TMS API с фолбэком на ICMP.
+                self._data = None
+        return self._data
 
-        POST {EXTERNAL_API_BASE}/api/{device_id}/play
-        """
-        url = f"{EXTERNAL_API_BASE}/api/{self.tms_id}/play"
+    def gzipped(self):
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, PROXY_GZIP_LEVEL)
+        return self._gzipped
+
+
+class _Flight:
+    """Один выполняющийся запрос к TMS, которого ждут остальные"""
+
+    __slots__ = ('done', 'snapshot')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.snapshot = None
+
+
+class StatusCache:
+    """Общий серверный кеш статуса TMS с объединением одновременных запросов.
+
+    Снимок считается свежим ttl секунд. Пока есть читатели, фоновый поток
+    обновляет снимок заранее; при промахе одновременные запросы ждут один
+    общий запрос к TMS (singleflight). Поток останавливается, если к кешу
+    не обращались idle_timeout секунд, и запускается снова при обращении.
+    """
+
+    def __init__(self, fetch, ttl=STATUS_CACHE_TTL, idle_timeout=STATUS_CACHE_IDLE, latency_prefix='tms'):
+        self._fetch = fetch
+        self._wait_classes = (f'{latency_prefix}.connect', f'{latency_prefix}.status')
+        self.ttl = ttl
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._flight = None
+        self._last_access = 0.0
+        self._refresher = None
+        self._hits = 0
+        self._coalesced = 0
+        self._upstream_fetches = 0
+
+    def get(self, max_age=None):
+        """Вернуть снимок не старше max_age (по умолчанию ttl)"""
+        return self._get(self.ttl if max_age is None else max_age, touch=True)
+
+    def _get(self, max_age, touch):
+        now = time.monotonic()
+        with self._lock:
+            if touch:
+                self._last_access = now
+                if self._refresher is None:
+                    self._refresher = threading.Thread(
+                        target=self._refresh_loop, name='status-cache', daemon=True)
+                    self._refresher.start()
+            snapshot = self._snapshot
+            if snapshot is not None and now - snapshot.fetched_at < max_age:
+                self._hits += 1
+                return snapshot
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight()
+                self._upstream_fetches += 1
+            else:
+                self._coalesced += 1
+
+        if leader:
+            snapshot = self._load()
+            with self._lock:
+                self._snapshot = snapshot
+                self._flight = None
+            flight.snapshot = snapshot
+            flight.done.set()
+            return snapshot
+
+        if flight.done.wait(sum(latency.timeout(name) for name in self._wait_classes)):
+            return flight.snapshot
+        with self._lock:
+            snapshot = self._snapshot
+        return snapshot or StatusSnapshot.from_data(
+            504, {'ok': False, 'error': 'TMS status timeout'}, time.monotonic())
+
+    def peek(self):
+        """Последний снимок без запроса к TMS (None, если его ещё нет)"""
+        with self._lock:
+            return self._snapshot
+
+    def _load(self):
         try:
-            resp = requests.post(url, timeout=5)
+            r = self._fetch()
+            return StatusSnapshot(r.status_code, r.content, time.monotonic(),
+                                  r.headers.get('Content-Type', 'application/json'))
         except Exception as e:
-            print(f"[{self.hall_id}] Внешний TMS API недоступен при play: {e}. Применяем внутренний запуск.")
-            return self.send_command("PLAYER.Play")
+            return StatusSnapshot.from_data(502, {'ok': False, 'error': str(e)}, time.monotonic())
 
-        if resp.status_code == 200:
-            try:
-                data = resp.json()
-                ok = data.get('ok', True) if isinstance(data, dict) else True
-                return bool(ok), resp.text
-            except ValueError:
-                return True, resp.text
-        else:
-            print(f"[{self.hall_id}] TMS API play вернул HTTP {resp.status_code}, тело: {resp.text}. Применяем внутренний запуск.")
-            return self.send_command("PLAYER.Play")
-    
-    def lamp_off(self):
-        """Выключение лампы через внешний TMS API с фолбэком на ICMP"""
-        url = f"{EXTERNAL_API_BASE}/api/{self.tms_id}/projector/lamp/off"
+    def _refresh_loop(self):
+        """Фоновое обновление снимка до истечения ttl, пока есть читатели"""
+        ahead = self.ttl * 0.8
+        while True:
+            with self._lock:
+                if time.monotonic() - self._last_access > self.idle_timeout:
+                    self._refresher = None
+                    return
+            snapshot = self._get(ahead, touch=False)
+            age = time.monotonic() - snapshot.fetched_at
+            time.sleep(max(ahead - age, 0.05))
+
+    def stats(self):
+        with self._lock:
+            snapshot = self._snapshot
+            return {
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'coalesced': self._coalesced,
+                'upstream_fetches': self._upstream_fetches,
+                'refresher_running': self._refresher is not None,
+                'snapshot_age': round(time.monotonic() - snapshot.fetched_at, 3) if snapshot else None,
+                'etag': snapshot.etag if snapshot else None,
+            }
+
+
+class StreamSubscriber:
+    """Локальный подписчик SSE-хаба с ограниченной очередью событий"""
+
+    __slots__ = ('queue', 'skipped', 'dropped')
+
+    def __init__(self, size):
+        self.queue = queue.Queue(maxsize=size)
+        self.skipped = 0
+        self.dropped = False
+
+
+class StatusStreamHub:
+    """Одна подписка на SSE-стрим TMS, раздаваемая всем локальным клиентам.
+
+    Читатель апстрима работает в отдельном потоке, разбирает поток на
+    события и кладёт их в очереди подписчиков. Новый подписчик сразу
+    получает последнее событие. Если очередь клиента полна, самое старое
+    событие выбрасывается; клиент, пропустивший max_skips событий подряд,
+    отключается. Апстрим переподключается с экспоненциальной паузой и
+    закрывается, когда подписчиков нет дольше idle_grace секунд.
+    """
+
+    def __init__(self, open_stream, queue_size=SSE_QUEUE_SIZE, max_skips=SSE_MAX_SKIPS,
+                 idle_grace=SSE_IDLE_GRACE, name='tms'):
+        self._open_stream = open_stream
+        self.name = name
+        self.queue_size = queue_size
+        self.max_skips = max_skips
+        self.idle_grace = idle_grace
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._latest = None
+        self._reader = None
+        self._empty_since = time.monotonic()
+        self._upstream_connected = False
+        self._events = 0
+        self._reconnects = 0
+        self._dropped_clients = 0
+
+    def subscribe(self, sub=None):
+        """Подписать клиента; sub — общий подписчик нескольких хабов (одна очередь на клиента)"""
+        sub = sub or StreamSubscriber(self.queue_size)
+        with self._lock:
+            self._subscribers.add(sub)
+            if self._latest is not None:
+                sub.queue.put_nowait(self._latest)
+            if self._reader is None:
+                self._reader = threading.Thread(target=self._read_loop, name=f'sse-hub-{self.name}', daemon=True)
+                self._reader.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+            if not self._subscribers:
+                self._empty_since = time.monotonic()
+
+    def _idle(self):
+        with self._lock:
+            if self._subscribers or time.monotonic() - self._empty_since < self.idle_grace:
+                return False
+            self._reader = None
+            self._latest = None
+            return True
+
+    def _publish(self, event):
+        with self._lock:
+            self._events += 1
+            self._latest = event
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            self._offer(sub, event)
+
+    def _offer(self, sub, event):
         try:
-            resp = requests.post(url, timeout=5)
-        except Exception as e:
-            print(f"[{self.hall_id}] Внешний TMS API недоступен при lamp_off: {e}. Применяем внутреннюю команду.")
-            return self.send_command("PROJECTOR.Turn Lamp Off")
+            sub.queue.put_nowait(event)
+            sub.skipped = 0
+            return
+        except queue.Full:
+            pass
+        # Медленный клиент: выбрасываем самое старое событие
+        try:
+            sub.queue.get_nowait()
+        except queue.Empty:
+            pass
+        sub.skipped += 1
+        if sub.skipped > self.max_skips:
+            sub.dropped = True
+            with self._lock:
+                self._dropped_clients += 1
+            self.unsubscribe(sub)
+            event = None  # сигнал генератору завершить ответ
+        try:
+            sub.queue.put_nowait(event)
+        except queue.Full:
+            pass
 
-        if resp.status_code == 200:
+    @staticmethod
+    def _iter_events(upstream):
+        """Разбор байтового SSE-потока на целые события (разделитель — пустая строка)"""
+        buffer = b''
+        for chunk in upstream.iter_content(chunk_size=None):
+            if not chunk:
+                continue
+            buffer += chunk.replace(b'\r\n', b'\n')
+            while b'\n\n' in buffer:
+                event, buffer = buffer.split(b'\n\n', 1)
+                if event.strip():
+                    yield event + b'\n\n'
+
+    def _read_loop(self):
+        delay = SSE_RECONNECT_MIN
+        while not self._idle():
+            upstream = None
             try:
-                data = resp.json()
-                ok = data.get('ok', True) if isinstance(data, dict) else True
-                return bool(ok), resp.text
-            except ValueError:
-                return True, resp.text
-        else:
-            print(f"[{self.hall_id}] TMS API lamp_off вернул HTTP {resp.status_code}, тело: {resp.text}. Применяем внутреннюю команду.")
-            return self.send_command("PROJECTOR.Turn Lamp Off")
-    
-    def clear(self):
-        """Очистка плейлиста"""
-        return self.send_command("PLAYER.Clear")
-    
-    def light_on(self):
-        """Включение света через EKOS"""
-        return self.send_command('EKOS.Send Text,"$KE,WR,4,1\\0D\\0A"')
-    
-    def light_off(self):
-        """Выключение света через EKOS"""
-        return self.send_command('EKOS.Send Text,"$KE,WR,1,1\\0D\\0A"')
-    
-    def set_volume(self, level):
-        """Установка громкости через tm8710 (0-5.5)"""
-        fader_value = int(float(level) * 10)
-        return self.send_command(f'tm8710.Send Text,"tm8710.sys.fader {fader_value}"')
-    
-    def shutdown_session(self):
-        """Полное завершение сеанса: Stop -> Lamp OFF -> Clear -> Lights ON"""
-        results = []
-        
-        # 1. Остановка (через TMS при наличии)
-        success, response = self.stop()
-        results.append(('stop', success, response))
-        time.sleep(0.5)
-        
-        # 2. Выключение лампы (через TMS при наличии)
-        success, response = self.lamp_off()
-        results.append(('lamp_off', success, response))
-        time.sleep(0.5)
+                upstream = self._open_stream()
+                if upstream.status_code != 200:
+                    raise RuntimeError(f"HTTP {upstream.status_code}")
+                self._upstream_connected = True
+                delay = SSE_RECONNECT_MIN
+                print(f"[SSE] Подключено к стриму статусов TMS {self.name}")
+                for event in self._iter_events(upstream):
+                    self._publish(event)
+                    if self._idle():
+                        return
+            except Exception as e:
+                print(f"[SSE] Стрим статусов TMS {self.name} недоступен: {e}")
+            finally:
+                self._upstream_connected = False
+                if upstream is not None:
+                    try:
+                        upstream.close()
+                    except Exception:
+                        pass
+
+            with self._lock:
+                self._reconnects += 1
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, SSE_RECONNECT_MAX)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'upstream_connected': self._upstream_connected,
+                'events': self._events,
+                'reconnects': self._reconnects,
+                'dropped_clients': self._dropped_clients,
+            }
+
+
+class TmsHost:
+    """Один хост TMS: пул соединений с собственными адаптивными таймаутами,
+    кеш статуса и SSE-хаб. Здоровье хоста — его host-breaker в tms_breakers.
+    """
+
+    def __init__(self, base_url, latency_prefix='tms'):
+        self.client = TmsClient(base_url, latency_prefix=latency_prefix)
+        self.base_url = self.client.base_url
+        self.status_cache = StatusCache(lambda: self.client.get("/api/status/live"),
+                                        latency_prefix=latency_prefix)
+        self.status_hub = StatusStreamHub(
+            lambda: self.client.get("/api/status/stream", stream=True, timeout=TMS_TIMEOUT),
+            name=self.client.host)
+        self.pending_status = None  # опрос статуса для сводки, не больше одного на хост
+
+    def stats(self):
+        stats = self.client.stats()
+        stats['status_cache'] = self.status_cache.stats()
+        stats['status_stream'] = self.status_hub.stats()
+        stats['breaker'] = tms_breakers.stats()['hosts'].get(self.base_url)
+        return stats
+
+
+class TmsRegistry:
+    """Хосты TMS по базовому URL: TMS_API_BASE и tms_base залов.
+
+    Хост создаётся при первом обращении и живёт до конца процесса; залы без
+    tms_base обслуживает основной хост. Сводные запросы расходятся по
+    активным хостам (на которые ссылается конфигурация залов) параллельно,
+    в общем пуле потоков, и ждут не дольше TMS_FANOUT_TIMEOUT.
+    """
+
+    def __init__(self, default_base, fanout_workers=TMS_FANOUT_WORKERS):
+        self.default_base = default_base.rstrip('/')
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._pool = ThreadPoolExecutor(max_workers=fanout_workers, thread_name_prefix='tms-fanout')
+        self.default = self.host()
+
+    def host(self, base=None):
+        base = (base or self.default_base).rstrip('/')
+        with self._lock:
+            host = self._hosts.get(base)
+            if host is None:
+                # Основной хост сохраняет прежние классы задержек tms.*
+                prefix = 'tms' if base == self.default_base else f'tms@{urlsplit(base).netloc or base}'
+                host = self._hosts[base] = TmsHost(base, prefix)
+            return host
+
+    def for_hall(self, hall):
+        return self.host(hall.get('tms_base'))
+
+    def for_device(self, device_id):
+        """Хост TMS устройства (tms_id или cp750_id зала); неизвестное устройство — основной хост"""
+        for hall in load_halls_config():
+            if device_id in (hall.get('tms_id', hall['id']), hall.get('cp750_id')):
+                return self.for_hall(hall)
+        return self.default
+
+    def active(self):
+        """Различные хосты TMS залов в порядке конфигурации"""
+        hosts = []
+        for hall in load_halls_config():
+            host = self.for_hall(hall)
+            if host not in hosts:
+                hosts.append(host)
+        return hosts or [self.default]
+
+    def all(self):
+        with self._lock:
+            return list(self._hosts.values())
+
+    def gather(self, call, hosts=None, timeout=TMS_FANOUT_TIMEOUT):
+        """call(host) на всех хостах параллельно; [(host, future)] после ожидания не дольше timeout.
+
+        Незавершённый future продолжает работу в фоне; чем заменить его
+        результат, решает вызывающий.
+        """
+        futures = [(host, self._pool.submit(call, host)) for host in hosts or self.active()]
+        wait_futures([future for _, future in futures], timeout=timeout)
+        return futures
+
+    def status_snapshots(self, hosts, max_age=None, timeout=TMS_FANOUT_TIMEOUT):
+        """[(host, снимок статуса)]; хост, не ответивший за timeout, — последний снимок или None"""
+        futures = []
+        for host in hosts:
+            with self._lock:
+                future = host.pending_status
+                if future is None or future.done():
+                    future = host.pending_status = self._pool.submit(host.status_cache.get, max_age)
+            futures.append((host, future))
+        wait_futures([future for _, future in futures], timeout=timeout)
+        return [(host, future.result() if future.done() else host.status_cache.peek())
+                for host, future in futures]
+
+    def stats(self):
+        return {host.base_url: host.stats() for host in self.all()}
+
+
+def merge_tms_devices(parts):
+    """Свести ответы хостов TMS вида {'ok', 'devices'}: [(host, status_code, data или None)].
+
+    Устройства получают пометку tms_base, ошибки хостов собираются в errors.
+    Ответ ok, если ответил хотя бы один хост.
+    """
+    devices = []
+    errors = {}
+    for host, status_code, data in parts:
+        if status_code != 200 or not isinstance(data, dict):
+            error = data.get('error') if isinstance(data, dict) else None
+            errors[host.base_url] = error or (f"HTTP {status_code}" if status_code else 'timeout')
+            continue
+        devices.extend(dict(device, tms_base=host.base_url) for device in data.get('devices') or [])
+    merged = {'ok': len(errors) < len(parts), 'devices': devices}
+    if errors:
+        merged['errors'] = errors
+    return merged
+
+
+class MergedStatusCache:
+    """Сводный статус всех хостов TMS для /api/status/live и насоса статуса залов.
+
+    С одним хостом — его снимок как есть (тело TMS без разбора). С несколькими
+    снимки хостов запрашиваются параллельно и сводятся merge_tms_devices;
+    сводный снимок пересобирается, только когда меняется снимок какого-либо
+    хоста, поэтому его ETag стабилен между изменениями.
+    """
+
+    def __init__(self, hosts, ttl=STATUS_CACHE_TTL):
+        self._hosts = hosts
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._key = None
+        self._merged = None
+
+    def get(self, max_age=None):
+        hosts = self._hosts.active()
+        if len(hosts) == 1:
+            return hosts[0].status_cache.get(max_age)
+        parts = self._hosts.status_snapshots(hosts, max_age)
+        key = tuple((host.base_url, snapshot.etag if snapshot else None) for host, snapshot in parts)
+        with self._lock:
+            if key == self._key:
+                return self._merged
+        merged = merge_tms_devices([
+            (host, snapshot.status_code, snapshot.data) if snapshot else (host, None, None)
+            for host, snapshot in parts])
+        fetched = [snapshot.fetched_at for _, snapshot in parts if snapshot]
+        snapshot = StatusSnapshot.from_data(200 if merged['ok'] else 502, merged,
+                                            min(fetched) if fetched else time.monotonic())
+        with self._lock:
+            self._key = key
+            self._merged = snapshot
+        return snapshot
+
+
+class MergedStatusStream:
+    """SSE-стримы статусов всех активных хостов TMS в одной очереди клиента.
+
+    События хостов идут как есть (у каждого — только устройства своего TMS);
+    медленного клиента отключает любой из хабов, и ответ завершается.
+    """
+
+    def __init__(self, hosts):
+        self._hosts = hosts
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self):
+        sub = StreamSubscriber(SSE_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(sub)
+        for host in self._hosts.active():
+            host.status_hub.subscribe(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+        for host in self._hosts.all():
+            host.status_hub.unsubscribe(sub)
+
+    def stats(self):
+        with self._lock:
+            subscribers = len(self._subscribers)
+        return {'subscribers': subscribers}
+
+
+# Хосты TMS; tms — клиент основного хоста (TMS_API_BASE)
+tms_hosts = TmsRegistry(EXTERNAL_API_BASE)
+tms = tms_hosts.default.client
+
+# Снимок /api/status/live и SSE-стрим статусов, общие для всех вкладок браузера
+status_cache = MergedStatusCache(tms_hosts)
+status_hub = MergedStatusStream(tms_hosts)
+
+
+def device_status(tms_id, max_age=None, base=None):
+    """Статус устройства из снимка его хоста TMS (None, если TMS или устройство недоступны)"""
+    snapshot = tms_hosts.host(base).status_cache.get(max_age)
+    if not snapshot.ok or not isinstance(snapshot.data, dict):
+        return None
+    return next((d for d in snapshot.data.get('devices') or [] if d.get('id') == tms_id), None)
+
+
+def tms_for(device_id):
+    """Клиент хоста TMS, обслуживающего устройство (проектор или CP750)"""
+    return tms_hosts.for_device(device_id).client
+
+
+_MISSING = object()
+
+
+def diff_status(old, new):
+    """Разница двух словарей статуса: (изменённые поля, удалённые пути).
+
+    Вложенные словари сравниваются рекурсивно, в changed попадают только
+    изменившиеся ключи; списки и скаляры заменяются целиком. Удалённые
+    ключи возвращаются как списки сегментов пути.
+    """
+    changed = {}
+    removed = []
+    for key, value in new.items():
+        previous = old.get(key, _MISSING)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            sub_changed, sub_removed = diff_status(previous, value)
+            if sub_changed:
+                changed[key] = sub_changed
+            removed.extend([key] + path for path in sub_removed)
+        elif previous is _MISSING or previous != value:
+            changed[key] = value
+    removed.extend([key] for key in old if key not in new)
+    return changed, removed
+
+
+class HallStatusPublisher:
+    """Push статуса по залам через комнаты Socket.IO ("hall:<id>").
+
+    Клиент входит в комнату выбранного зала и сразу получает полный статус
+    ('status_full'). Пока в комнатах есть участники, фоновый поток читает
+    общий снимок из StatusCache и при его изменении рассылает в каждую
+    комнату только изменившиеся поля устройства ('status_delta').
+    """
+
+    def __init__(self, cache, socketio):
+        self._cache = cache
+        self._socketio = socketio
+        self._lock = threading.Lock()
+        self._members = {}      # sid -> hall_id
+        self._devices = {}      # hall_id -> последний отправленный статус устройства
+        self._versions = {}     # hall_id -> номер версии статуса
+        self._etag = None
+        self._pump = None
+
+    @staticmethod
+    def room(hall_id):
+        return f'hall:{hall_id}'
+
+    @staticmethod
+    def _hall_devices(snapshot):
+        """Статус устройства для каждого зала из снимка (по tms_id или имени).
+
+        В сводке нескольких TMS устройство ищется только среди устройств хоста зала.
+        """
+        devices = snapshot.data.get('devices') if snapshot.ok and isinstance(snapshot.data, dict) else None
+        result = {}
+        for hall in load_halls_config():
+            tms_id = hall.get('tms_id', hall['id'])
+            base = tms_hosts.for_hall(hall).base_url
+            result[hall['id']] = next(
+                (d for d in devices or [] if d.get('tms_base', base) == base
+                 and (d.get('id') == tms_id or d.get('name') == hall['name'])),
+                None)
+        return result
+
+    def join(self, sid, hall_id):
+        """Перевести клиента в комнату зала; возвращает полный статус для отправки"""
+        with self._lock:
+            previous = self._members.get(sid)
+            self._members[sid] = hall_id
+            if self._pump is None:
+                self._pump = threading.Thread(target=self._pump_loop, name='hall-status', daemon=True)
+                self._pump.start()
+        if previous and previous != hall_id:
+            leave_room(self.room(previous))
+        join_room(self.room(hall_id))
+
+        with self._lock:
+            if hall_id in self._devices:
+                # Состояние, с которым согласованы версии последующих дельт
+                return {'hall_id': hall_id, 'device': self._devices[hall_id],
+                        'version': self._versions[hall_id]}
+        device = self._hall_devices(self._cache.get()).get(hall_id)
+        return {'hall_id': hall_id, 'device': device, 'version': 0}
+
+    def leave(self, sid):
+        with self._lock:
+            hall_id = self._members.pop(sid, None)
+        if hall_id:
+            leave_room(self.room(hall_id))
+
+    def _pump_loop(self):
+        while True:
+            with self._lock:
+                if not self._members:
+                    self._pump = None
+                    self._etag = None
+                    return
+            snapshot = self._cache.get()
+            if snapshot.etag != self._etag:
+                self._etag = snapshot.etag
+                self._publish(snapshot)
+            time.sleep(self._cache.ttl)
+
+    def _publish(self, snapshot):
+        with self._lock:
+            watched = set(self._members.values())
+        for hall_id, device in self._hall_devices(snapshot).items():
+            previous = self._devices.get(hall_id)
+            if hall_id in self._devices and device == previous:
+                continue
+            with self._lock:
+                self._devices[hall_id] = device
+                version = self._versions[hall_id] = self._versions.get(hall_id, 0) + 1
+            if hall_id not in watched:
+                continue
+            # Статус рассылается мимо общей шины: у каждого процесса свой насос и своя
+            # нумерация версий, а клиенты комнаты подключены к этому же процессу
+            if device is None or previous is None:
+                self._socketio.emit('status_full', {'hall_id': hall_id, 'device': device, 'version': version},
+                                    to=self.room(hall_id), ignore_queue=True)
+            else:
+                changed, removed = diff_status(previous, device)
+                self._socketio.emit('status_delta', {
+                    'hall_id': hall_id,
+                    'changed': changed,
+                    'removed': removed,
+                    'version': version,
+                }, to=self.room(hall_id), ignore_queue=True)
+
+    def stats(self):
+        with self._lock:
+            rooms = {}
+            for hall_id in self._members.values():
+                rooms[hall_id] = rooms.get(hall_id, 0) + 1
+            return {'clients': len(self._members), 'rooms': rooms, 'running': self._pump is not None}
+
+
+# Журнал зала в браузере (emit_log): записи копятся LOG_BATCH_INTERVAL секунд или до
+# LOG_BATCH_SIZE штук и уходят одним событием 'log_batch'; последние LOG_BACKLOG записей
+# каждого зала хранятся для переподключившихся клиентов
+LOG_BATCH_INTERVAL = float(os.environ.get('LOG_BATCH_INTERVAL', '0.075'))
+LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', '50'))
+LOG_BACKLOG = int(os.environ.get('LOG_BACKLOG', '100'))
+
+
+class LogBroadcaster:
+    """Доставка журнала залов в браузеры пачками, по комнатам залов.
+
+    emit() только кладёт запись в очередь. Поток-рассыльщик раз в interval
+    секунд (или сразу, набрав max_batch записей) отправляет по одному
+    'log_batch' на зал — в комнату зала (общую со статусом) и в комнату
+    всех залов. Записи нумеруются (seq) в пределах эпохи процесса;
+    catch_up() отдаёт пропущенное из backlog. В консоль записи не
+    дублируются: команды и ошибки контроллеры печатают сами.
+    """
+
+    ALL_ROOM = 'halls:all'
+
+    def __init__(self, socketio, interval=LOG_BATCH_INTERVAL, max_batch=LOG_BATCH_SIZE, backlog=LOG_BACKLOG):
+        self._socketio = socketio
+        self.interval = interval
+        self.max_batch = max_batch
+        self.backlog = backlog
+        self.epoch = f'{os.getpid()}-{int(time.time())}'
+        self._cond = threading.Condition()
+        self._pending = []
+        self._backlogs = {}     # hall_id -> deque последних записей
+        self._seq = 0
+        self._thread = None
+        self._batches = 0
+        self._entries = 0
+
+    def emit(self, hall_id, message, level='info'):
+        with self._cond:
+            self._seq += 1
+            entry = {
+                'hall_id': hall_id,
+                'message': message,
+                'level': level,
+                'timestamp': datetime.now().strftime("%H:%M:%S"),
+                'seq': self._seq,
+            }
+            self._backlogs.setdefault(hall_id, deque(maxlen=self.backlog)).append(entry)
+            self._pending.append(entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='log-broadcast', daemon=True)
+                self._thread.start()
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+    def catch_up(self, hall_id=None, since=None, epoch=None):
+        """Записи зала (None — всех залов) после since; всё хранимое, если эпоха клиента другая"""
+        with self._cond:
+            if hall_id is None:
+                entries = sorted((e for b in self._backlogs.values() for e in b), key=lambda e: e['seq'])
+            else:
+                entries = list(self._backlogs.get(hall_id, ()))
+        if since is not None and epoch == self.epoch:
+            entries = [e for e in entries if e['seq'] > since]
+        return {'epoch': self.epoch, 'hall_id': hall_id, 'entries': entries}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.interval
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, []
+            self._flush(batch)
+
+    def _flush(self, batch):
+        by_hall = {}
+        for entry in batch:
+            by_hall.setdefault(entry['hall_id'], []).append(entry)
+        for hall_id, entries in by_hall.items():
+            try:
+                self._socketio.emit('log_batch', {'epoch': self.epoch, 'hall_id': hall_id, 'entries': entries},
+                                    to=[HallStatusPublisher.room(hall_id), self.ALL_ROOM])
+            except Exception as e:
+                print(f"Ошибка рассылки журнала зала {hall_id}: {e}")
+        with self._cond:
+            self._batches += len(by_hall)
+            self._entries += len(batch)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'entries': self._entries,
+                'batches': self._batches,
+                'pending': len(self._pending),
+                'backlog': {hall_id: len(b) for hall_id, b in self._backlogs.items()},
+            }
+
+
+# Barco ICMP: таймаут сокета (connect/send) и крайний срок ожидания ответа на команду, сек
+ICMP_SOCKET_TIMEOUT = float(os.environ.get('ICMP_SOCKET_TIMEOUT', '5'))
+ICMP_REPLY_TIMEOUT = float(os.environ.get('ICMP_REPLY_TIMEOUT', '2'))
+
+# Адаптивные таймауты ICMP (значения выше — их потолки). Ответ ждём не меньше секунды:
+# единичный поздний ответ пропускается, но два подряд означают переподключение
+latency.register('icmp.connect', 0.5, ICMP_SOCKET_TIMEOUT)
+latency.register('icmp.rtt', min(1.0, ICMP_REPLY_TIMEOUT), ICMP_REPLY_TIMEOUT)
+
+# Очередь команд зала: размер, крайний срок выполнения команды (включая ожидание
+# в очереди) и через сколько секунд простоя останавливать поток-исполнитель
+ICMP_QUEUE_SIZE = int(os.environ.get('ICMP_QUEUE_SIZE', '32'))
+ICMP_COMMAND_DEADLINE = float(os.environ.get('ICMP_COMMAND_DEADLINE', '10'))
+ICMP_WORKER_IDLE = float(os.environ.get('ICMP_WORKER_IDLE', '60'))
+
+# Завершение сеанса: крайние сроки ожидания состояния устройства после stop и lamp off,
+# период опроса статуса и пауза, если состояние устройства недоступно (секунды)
+SHUTDOWN_STOP_TIMEOUT = float(os.environ.get('SHUTDOWN_STOP_TIMEOUT', '5'))
+SHUTDOWN_LAMP_TIMEOUT = float(os.environ.get('SHUTDOWN_LAMP_TIMEOUT', '5'))
+SHUTDOWN_POLL_INTERVAL = float(os.environ.get('SHUTDOWN_POLL_INTERVAL', '0.2'))
+SHUTDOWN_FALLBACK_DELAY = float(os.environ.get('SHUTDOWN_FALLBACK_DELAY', '0.5'))
+
+# Последовательности команд: сколько независимых шагов одного зала выполнять одновременно
+SEQUENCE_PARALLELISM = int(os.environ.get('SEQUENCE_PARALLELISM', '4'))
+
+# Менеджер ICMP-соединений: автоподключение, keepalive простаивающих соединений,
+# границы jittered backoff переподключения (секунды)
+ICMP_AUTOCONNECT = os.environ.get('ICMP_AUTOCONNECT', '1') == '1'
+ICMP_KEEPALIVE_INTERVAL = float(os.environ.get('ICMP_KEEPALIVE_INTERVAL', '30'))
+ICMP_RECONNECT_MIN = float(os.environ.get('ICMP_RECONNECT_MIN', '1'))
+ICMP_RECONNECT_MAX = float(os.environ.get('ICMP_RECONNECT_MAX', '60'))
+
+# Движок контроллеров: 'thread' (BarcoController) или 'async' (один asyncio-цикл на все залы)
+CONTROLLER_ENGINE = os.environ.get('CONTROLLER_ENGINE', 'thread')
+
+# Конфигурация залов: путь к файлу и как часто проверять его изменение (секунды)
+HALLS_CONFIG_PATH = os.environ.get('HALLS_CONFIG', 'halls_config.json')
+HALLS_CONFIG_CHECK_INTERVAL = float(os.environ.get('HALLS_CONFIG_CHECK_INTERVAL', '2'))
+
+# Групповые операции: сколько залов обрабатывать одновременно
+BULK_CONCURRENCY = int(os.environ.get('BULK_CONCURRENCY', '6'))
+
+# Планировщик сеансов (SCHEDULER_ENABLED=1): окончания сеансов из SCHEDULE_PATH или, если
+# файла нет, из TMS (SCHEDULE_TMS_PATH); перечитывание раз в SCHEDULE_REFRESH секунд.
+# Событие, опоздавшее больше чем на SCHEDULE_MISFIRE_GRACE секунд, пропускается; окончание,
+# за которым в том же зале через SCHEDULE_OVERLAP_GAP секунд начинается сеанс, — тоже.
+# Время 'HH:MM' раньше SCHEDULE_DAY_START относится к следующим суткам (ночные сеансы)
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', '0') == '1'
+SCHEDULE_PATH = os.environ.get('SCHEDULE_PATH', 'schedule.json')
+SCHEDULE_TMS_PATH = os.environ.get('SCHEDULE_TMS_PATH', '/api/schedule/day')
+SCHEDULE_REFRESH = float(os.environ.get('SCHEDULE_REFRESH', '300'))
+SCHEDULE_MISFIRE_GRACE = float(os.environ.get('SCHEDULE_MISFIRE_GRACE', '120'))
+SCHEDULE_OVERLAP_GAP = float(os.environ.get('SCHEDULE_OVERLAP_GAP', '60'))
+SCHEDULE_DAY_START = os.environ.get('SCHEDULE_DAY_START', '06:00')
+SCHEDULE_ACTION = os.environ.get('SCHEDULE_ACTION', 'shutdown-session')
+SCHEDULER_LOCK = os.environ.get('SCHEDULER_LOCK', '/tmp/barco-scheduler.lock')
+SCHEDULER_IDENTITY = 'Планировщик'
+
+# Журнал действий администраторов: каталог, формат (text | jsonl | both),
+# интервал fsync (сек, 0 — после каждой пачки) и максимальный размер пачки
+AUDIT_LOG_DIR = os.environ.get('AUDIT_LOG_DIR', 'logs')
+AUDIT_LOG_FORMAT = os.environ.get('AUDIT_LOG_FORMAT', 'text')
+AUDIT_FSYNC_INTERVAL = float(os.environ.get('AUDIT_FSYNC_INTERVAL', '5'))
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', '200'))
+
+# Индексированная копия журнала в SQLite для /api/audit ('' — не вести);
+# размер страницы ответа по умолчанию и максимум
+AUDIT_DB = os.environ.get('AUDIT_DB', os.path.join(AUDIT_LOG_DIR, 'audit.db'))
+AUDIT_PAGE_SIZE = int(os.environ.get('AUDIT_PAGE_SIZE', '100'))
+AUDIT_PAGE_MAX = int(os.environ.get('AUDIT_PAGE_MAX', '1000'))
+
+# Громкость (CP750 fader и ICMP volume): минимальный интервал между командами
+# одному устройству, секунды; промежуточные значения заменяются последним
+VOLUME_MIN_INTERVAL = float(os.environ.get('VOLUME_MIN_INTERVAL', '0.25'))
+
+# Сервер Socket.IO: режим (threading | eventlet | gevent | auto), шина событий между
+# процессами ('' — внутри процесса, unix:///path.sock — через UNIX-сокет, redis://...,
+# amqp://..., kafka://... — встроенные менеджеры python-socketio), разрешённые
+# транспорты ('websocket' — не нужны sticky sessions) и порт встроенного сервера
+SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE', 'threading')
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
+SOCKETIO_TRANSPORTS = [t.strip() for t in os.environ.get('SOCKETIO_TRANSPORTS', 'polling,websocket').split(',')
+                       if t.strip()]
+# Шина unix://: сообщений в очереди брокера на одного подписчика (воркера);
+# подписчик с переполненной очередью отключается и переподключается сам
+SOCKETIO_BUS_QUEUE = int(os.environ.get('SOCKETIO_BUS_QUEUE', '256'))
+PORT = int(os.environ.get('PORT', '5059'))
+
+# Circuit breaker пути TMS -> ICMP: сколько ошибок подряд размыкают цепь
+# и через сколько секунд пробовать TMS снова (half-open)
+TMS_BREAKER_FAILURES = int(os.environ.get('TMS_BREAKER_FAILURES', '3'))
+TMS_BREAKER_RESET = float(os.environ.get('TMS_BREAKER_RESET', '10'))
+
+
+class IcmpReader:
+    """Буферизованное чтение ответов Barco ICMP, разделённых ';'.
+
+    Возвращает ответ, как только в буфере появился полный кадр. Байты,
+    пришедшие после кадра, остаются в буфере до следующего чтения.
+    """
+
+    TERMINATOR = b';'
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b''
+
+    def read_frame(self, timeout):
+        """Прочитать один кадр (без ';'); socket.timeout, если не успели до крайнего срока"""
+        deadline = time.monotonic() + timeout
+        while True:
+            end = self.buffer.find(self.TERMINATOR)
+            if end >= 0:
+                frame = self.buffer[:end].strip()
+                self.buffer = self.buffer[end + 1:]
+                if frame:
+                    return frame.decode('ascii', errors='replace')
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout('Нет ответа от устройства')
+            self.sock.settimeout(remaining)
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise ConnectionError('Соединение закрыто устройством')
+            self.buffer += chunk
+
+
+# Состояния плеера TMS, при которых воспроизведение ещё не остановлено
+PLAYING_STATES = {'play', 'playing', 'pause', 'paused'}
+
+
+def player_stopped(device):
+    """Плеер остановлен? None — состояние плеера в статусе отсутствует"""
+    state = device.get('state') or (device.get('status') or {}).get('State')
+    if not state:
+        return None
+    return str(state).lower() not in PLAYING_STATES
+
+
+def lamp_dark(device):
+    """Лампа выключена? None — в статусе нет данных о лампе.
+
+    Закрытая шторка не в счёт: она закрывается параллельно с выключением лампы
+    и не говорит о том, что лампа погасла.
+    """
+    lamp = device.get('lamp') or (device.get('status') or {}).get('Lamp')
+    if not lamp:
+        return None
+    return str(lamp).lower() == 'off'
+
+
+class CircuitBreaker:
+    """Circuit breaker одного направления вызовов (хост TMS или устройство на нём).
+
+    closed — вызовы идут как обычно; после failure_threshold ошибок подряд
+    цепь размыкается (open) и вызовы сразу уходят в fallback. Через
+    reset_timeout секунд пропускается один пробный вызов (half_open):
+    успех замыкает цепь, ошибка снова размыкает её.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=TMS_BREAKER_FAILURES,
+                 reset_timeout=TMS_BREAKER_RESET, on_change=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_change = on_change  # f(snapshot) при смене состояния
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._changed_at = time.time()
+        self._trips = 0
+        self._short_circuited = 0
+        self._last_error = None
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow(self):
+        """Можно ли выполнить вызов сейчас (в half_open — только один пробный)"""
+        changed = False
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self._short_circuited += 1
+                    return False
+                changed = self._set_state(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self._short_circuited += 1
+                    allowed = False
+                else:
+                    self._probe_in_flight = allowed = True
+            else:
+                allowed = True
+        if changed:
+            self._notify()
+        return allowed
+
+    def cancel_probe(self):
+        """Вернуть разрешение на пробу, если вызов так и не был выполнен"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            changed = self._set_state(self.CLOSED)
+        if changed:
+            self._notify()
+
+    def failure(self, error):
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error)
+            self._probe_in_flight = False
+            changed = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                if self._state != self.OPEN:
+                    self._trips += 1
+                changed = self._set_state(self.OPEN)
+        if changed:
+            self._notify()
+
+    def _set_state(self, state):
+        if self._state == state:
+            return False
+        self._state = state
+        self._changed_at = time.time()
+        return True
+
+    def _notify(self):
+        if self.on_change:
+            try:
+                self.on_change(self.snapshot())
+            except Exception as e:
+                print(f"[breaker {self.name}] Ошибка уведомления: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            retry_in = None
+            if self._state == self.OPEN:
+                retry_in = round(max(self._opened_at + self.reset_timeout - time.monotonic(), 0), 1)
+            return {
+                'name': self.name,
+                'state': self._state,
+                'failures': self._failures,
+                'trips': self._trips,
+                'short_circuited': self._short_circuited,
+                'last_error': self._last_error,
+                'since': datetime.fromtimestamp(self._changed_at).strftime('%Y-%m-%d %H:%M:%S'),
+                'retry_in': retry_in,
+            }
+
+
+class TmsBreakerRegistry:
+    """Breakers пути TMS: один на хост TMS и по одному на устройство.
+
+    Ошибки соединения и таймауты размыкают breaker хоста — тогда в fallback
+    сразу уходят все устройства этого TMS. HTTP-ошибки конкретного
+    устройства размыкают только его breaker.
+    """
+
+    def __init__(self, failure_threshold=TMS_BREAKER_FAILURES, reset_timeout=TMS_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_change = None  # f(snapshot), подключается после создания socketio
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def _get(self, kind, base, device_id=None):
+        key = (kind, base, device_id)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                name = base if device_id is None else f"{device_id}@{base}"
+                breaker = self._breakers[key] = CircuitBreaker(
+                    name, self.failure_threshold, self.reset_timeout, self._changed)
+            return breaker
+
+    def _changed(self, snapshot):
+        if self.on_change:
+            self.on_change(snapshot)
+
+    def allow(self, base, device_id):
+        """Пропустить ли вызов устройства device_id на TMS base"""
+        host = self._get('host', base)
+        if not host.allow():
+            return False
+        if not self._get('device', base, device_id).allow():
+            host.cancel_probe()
+            return False
+        return True
+
+    def success(self, base, device_id):
+        self._get('host', base).success()
+        self._get('device', base, device_id).success()
+
+    def failure(self, base, device_id, error, host_down):
+        """Учесть ошибку: host_down — TMS недоступен (соединение/таймаут), иначе ошибка устройства"""
+        if host_down:
+            self._get('host', base).failure(error)
+            self._get('device', base, device_id).cancel_probe()
+        else:
+            self._get('host', base).success()
+            self._get('device', base, device_id).failure(error)
+
+    def stats(self):
+        with self._lock:
+            items = list(self._breakers.items())
+        result = {'hosts': {}, 'devices': {}}
+        for (kind, base, device_id), breaker in items:
+            snapshot = breaker.snapshot()
+            if kind == 'host':
+                result['hosts'][base] = snapshot
+            else:
+                snapshot['host'] = base
+                result['devices'][snapshot['name']] = snapshot
+        return result
+
+
+# Breakers пути TMS -> ICMP, общие для всех контроллеров (потоковых и asyncio)
+tms_breakers = TmsBreakerRegistry()
+
+
+# Приоритеты команд ICMP: меньше — раньше. Остановка не ждёт серий громкости и света
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+COMMAND_PRIORITIES = {
+    'PLAYER.Stop': PRIORITY_URGENT,
+    'PROJECTOR.Turn Lamp Off': PRIORITY_URGENT,
+    'tm8710.Send Text': PRIORITY_BULK,
+    'EKOS.Send Text': PRIORITY_BULK,
+}
+
+
+def command_priority(command):
+    return COMMAND_PRIORITIES.get(_command_name(command), PRIORITY_NORMAL)
+
+
+class _QueuedCommand:
+    """Команда в очереди CommandActor/AsyncCommandQueue (сортируется по приоритету, затем по порядку)"""
+
+    __slots__ = ('priority', 'seq', 'command', 'future', 'enqueued_at', 'deadline')
+
+    def __init__(self, priority, seq, command, deadline, future=None):
+        self.priority = priority
+        self.seq = seq
+        self.command = command
+        self.future = future if future is not None else Future()
+        self.enqueued_at = time.monotonic()
+        self.deadline = deadline
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+metric_queue_wait = metrics.histogram(
+    'barco_command_queue_wait_seconds', 'Ожидание команды в очереди зала', ('hall', 'priority'))
+metric_queue_dropped = metrics.counter(
+    'barco_command_queue_dropped_total', 'Команды, не выполненные из-за переполнения очереди или крайнего срока',
+    ('hall', 'reason'))
+
+
+class CommandActor:
+    """Очередь команд одного зала с единственным потоком-исполнителем.
+
+    submit() сразу возвращает Future; исполнитель выполняет команды по
+    приоритету (PLAYER.Stop раньше громкости и света), команды с истёкшим
+    крайним сроком не отправляются. Очередь ограничена: при переполнении
+    команда сразу завершается ошибкой. Поток запускается при первой команде
+    и останавливается после idle_timeout секунд простоя.
+    """
+
+    def __init__(self, name, execute, maxsize=ICMP_QUEUE_SIZE, idle_timeout=ICMP_WORKER_IDLE):
+        self.name = name
+        self._execute = execute  # f(command) -> (success, message), вызывается только исполнителем
+        self.idle_timeout = idle_timeout
+        self._queue = queue.PriorityQueue(maxsize)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._executed = 0
+        self._rejected = 0
+        self._expired = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def submit(self, command, priority=None, deadline=None):
+        """Поставить команду в очередь; deadline — time.monotonic(), после которого не отправлять"""
+        if priority is None:
+            priority = command_priority(command)
+        if deadline is None:
+            deadline = time.monotonic() + ICMP_COMMAND_DEADLINE
+        item = _QueuedCommand(priority, next(self._seq), command, deadline)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            metric_queue_dropped.inc(hall=self.name, reason='queue_full')
+            item.future.set_result((False, "Очередь команд зала переполнена"))
+            return item.future
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f'icmp-actor-{self.name}', daemon=True)
+                self._worker.start()
+        return item.future
+
+    def call(self, command, priority=None, timeout=ICMP_COMMAND_DEADLINE):
+        """Выполнить команду и дождаться результата не дольше timeout секунд"""
+        future = self.submit(command, priority, time.monotonic() + timeout)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            return False, "Команда не выполнена за отведённое время"
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._worker = None
+                        return
+                continue
+
+            now = time.monotonic()
+            waited = now - item.enqueued_at
+            metric_queue_wait.observe(waited, hall=self.name, priority=item.priority)
+            with self._lock:
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            if not item.future.set_running_or_notify_cancel():
+                continue
+            if now > item.deadline:
+                with self._lock:
+                    self._expired += 1
+                metric_queue_dropped.inc(hall=self.name, reason='deadline')
+                item.future.set_result((False, "Команда не выполнена: истёк крайний срок в очереди"))
+                continue
+            try:
+                result = self._execute(item.command)
+            except Exception as e:
+                item.future.set_exception(e)
+            else:
+                item.future.set_result(result)
+            with self._lock:
+                self._executed += 1
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            waited = self._executed + self._expired
+            return {
+                'depth': self._queue.qsize(),
+                'worker_running': self._worker is not None,
+                'executed': self._executed,
+                'rejected': self._rejected,
+                'expired': self._expired,
+                'wait_ms': {
+                    'avg': round(self._wait_total / waited * 1000, 2) if waited else 0.0,
+                    'max': round(self._wait_max * 1000, 2),
+                },
+            }
+
+
+class AsyncCommandQueue:
+    """Очередь команд зала для асинхронного движка: те же приоритеты, крайний
+    срок и ограничение размера, что у CommandActor, но без потока ОС.
+
+    Команды ждут в asyncio.PriorityQueue, исполнитель — задача в цикле
+    AsyncEngine: запускается при первой команде и завершается после
+    idle_timeout секунд простоя. submit() вызывается только из этого цикла;
+    stats() и depth() — из любого потока.
+    """
+
+    def __init__(self, name, execute, maxsize=ICMP_QUEUE_SIZE, idle_timeout=ICMP_WORKER_IDLE):
+        self.name = name
+        self._execute = execute  # корутина f(command) -> (success, message)
+        self.idle_timeout = idle_timeout
+        self._maxsize = maxsize
+        self._queue = None       # создаётся в цикле движка при первой команде
+        self._seq = itertools.count()
+        self._worker = None
+        self._executed = 0
+        self._rejected = 0
+        self._expired = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def submit(self, command, priority=None, deadline=None):
+        """Поставить команду в очередь; возвращает asyncio.Future с (success, message)"""
+        if priority is None:
+            priority = command_priority(command)
+        if deadline is None:
+            deadline = time.monotonic() + ICMP_COMMAND_DEADLINE
+        loop = asyncio.get_running_loop()
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue(self._maxsize)
+        item = _QueuedCommand(priority, next(self._seq), command, deadline, loop.create_future())
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self._rejected += 1
+            metric_queue_dropped.inc(hall=self.name, reason='queue_full')
+            item.future.set_result((False, "Очередь команд зала переполнена"))
+            return item.future
+        if self._worker is None:
+            self._worker = loop.create_task(self._run())
+        return item.future
+
+    async def _run(self):
+        while True:
+            try:
+                item = await asyncio.wait_for(self._queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                if self._queue.empty():
+                    self._worker = None
+                    return
+                continue
+
+            now = time.monotonic()
+            waited = now - item.enqueued_at
+            metric_queue_wait.observe(waited, hall=self.name, priority=item.priority)
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            if item.future.done():
+                continue  # вызывающий перестал ждать
+            if now > item.deadline:
+                self._expired += 1
+                metric_queue_dropped.inc(hall=self.name, reason='deadline')
+                item.future.set_result((False, "Команда не выполнена: истёк крайний срок в очереди"))
+                continue
+            try:
+                result = await self._execute(item.command)
+            except Exception as e:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            else:
+                if not item.future.done():
+                    item.future.set_result(result)
+            self._executed += 1
+
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self):
+        waited = self._executed + self._expired
+        return {
+            'depth': self.depth(),
+            'worker_running': self._worker is not None,
+            'executed': self._executed,
+            'rejected': self._rejected,
+            'expired': self._expired,
+            'wait_ms': {
+                'avg': round(self._wait_total / waited * 1000, 2) if waited else 0.0,
+                'max': round(self._wait_max * 1000, 2),
+            },
+        }
+
+
+class BarcoController:
+    """Класс для управления одним залом Barco ICMP"""
+    
+    def __init__(self, hall_id, host='192.168.1.100', port=43748, tms_id=None, status_source=None,
+                 tms_client=None):
+        self.hall_id = hall_id
+        self.tms_id = tms_id or hall_id  # ID устройства во внешнем TMS (если отличается)
+        self.tms = tms_client or tms    # клиент хоста TMS зала (tms_base)
+        self.host = host
+        self.port = port
+        self.status_source = status_source  # f(tms_id, max_age) -> статус устройства из TMS или None
+        self.socket = None
+        self.reader = None
+        self.connected = False
+        self.ack_enabled = False
+        self.late_replies = 0  # ответы на команды, не дождавшиеся их: пропускаются при следующем чтении
+        self.lock = threading.Lock()
+        self.last_error = None
+        self.last_activity = 0.0
+        self.on_connection_lost = None  # колбэк менеджера соединений: f(hall_id)
+        self.actor = CommandActor(hall_id, self._execute_command)
+        
+    def _acquire_lock(self):
+        """Захват блокировки соединения с адаптивным таймаутом (класс lock.wait)"""
+        started = time.monotonic()
+        acquired = self.lock.acquire(timeout=latency.timeout('lock.wait'))
+        waited = time.monotonic() - started
+        latency.observe('lock.wait', waited)
+        metric_lock_wait.observe(waited, hall=self.hall_id)
+        if not acquired:
+            metric_lock_timeout.inc(hall=self.hall_id)
+        return acquired
+    
+    def connect(self, if_disconnected=False):
+        """Подключение к Barco ICMP. if_disconnected — не трогать уже открытое соединение
+        (проверяется под блокировкой, поэтому не разрывает соединение супервизора)"""
+        acquired = self._acquire_lock()
+        if not acquired:
+            return False, "Не удалось получить блокировку (timeout)"
+        
+        try:
+            if if_disconnected and self.connected:
+                return True, "Уже подключено"
+            self._close_socket()
+            print(f"[{self.hall_id}] Попытка подключения к {self.host}:{self.port}")
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.settimeout(latency.timeout('icmp.connect'))
+            started = time.monotonic()
+            try:
+                self.socket.connect((self.host, self.port))
+            finally:
+                latency.observe('icmp.connect', time.monotonic() - started)
+            self.reader = IcmpReader(self.socket)
+            self.connected = True
+            self.last_error = None
+            self.last_activity = time.monotonic()
+            
+            print(f"[{self.hall_id}] Подключено к {self.host}:{self.port}")
+            
+            # Включаем подтверждения (ACK)
+            success, response = self._send_command_internal("ACK,1")
+            if self.late_replies:
+                # Устройство не ответило на ACK,1 — соединение не считается установленным
+                self.last_error = response
+                self._close_socket()
+            if not self.connected:
+                return False, f"Ошибка подключения: {response}"
+            if success:
+                self.ack_enabled = True
+                print(f"[{self.hall_id}] ACK режим включен: {response}")
+            
+            return True, f"Подключено к {self.host}:{self.port}"
+        except Exception as e:
+            print(f"[{self.hall_id}] Ошибка подключения: {str(e)}")
+            self.last_error = str(e)
+            self._close_socket()
+            return False, f"Ошибка подключения: {str(e)}"
+        finally:
+            self.lock.release()
+    
+    def disconnect(self):
+        """Отключение от Barco ICMP"""
+        acquired = self._acquire_lock()
+        if not acquired:
+            return
         
-        # 3. Очистка (внутренняя команда ICMP)
-        success, response = self.clear()
-        results.append(('clear', success, response))
-        time.sleep(0.5)
+        try:
+            self._close_socket()
+            print(f"[{self.hall_id}] Отключено")
+        finally:
+            self.lock.release()
+    
+    def _close_socket(self):
+        """Закрыть сокет и сбросить состояние соединения (вызывается под блокировкой)"""
+        if self.socket:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+        self.connected = False
+        self.socket = None
+        self.reader = None
+        self.ack_enabled = False
+        self.late_replies = 0
+    
+    def _connection_lost(self, error):
+        """Обрыв соединения: закрываем сокет и сообщаем менеджеру соединений"""
+        print(f"[{self.hall_id}] Соединение потеряно: {error}")
+        self.last_error = str(error)
+        self._close_socket()
+        callback = self.on_connection_lost
+        if callback:
+            callback(self.hall_id)
+    
+    def keepalive(self):
+        """Проверка простаивающего соединения командой ACK,1 (заодно повторно включает ACK)"""
+        acquired = self._acquire_lock()
+        if not acquired:
+            return False
         
-        # 4. Включение света (EKOS внутренняя команда)
-        success, response = self.send_command('EKOS.Send Text,"$KE,WR,4,1\\0D\\0A"')
-        results.append(('lights_on', success, response))
+        try:
+            if not self.connected or not self.socket:
+                return False
+            try:
+                self.socket.settimeout(ICMP_SOCKET_TIMEOUT)
+                self.socket.sendall(b"ACK,1;")
+                response = self._read_reply()
+            except socket.timeout:
+                metric_icmp_reply_timeout.inc(hall=self.hall_id)
+                self._reply_timeout()
+                return False
+            except OSError as e:
+                self._connection_lost(e)
+                return False
+            self.ack_enabled, _ = self._parse_reply(response)
+            self.last_activity = time.monotonic()
+            return True
+        finally:
+            self.lock.release()
+    
+    def _send_command_internal(self, command):
+        """Внутренний метод отправки команды (без блокировки)"""
+        if not self.connected or not self.socket:
+            return False, "Не подключено к устройству"
         
-        all_success = all(r[1] for r in results)
-        return all_success, results
+        try:
+            if not command.endswith(';'):
+                command = command + ';'
+            
+            self.socket.settimeout(ICMP_SOCKET_TIMEOUT)
+            self.socket.sendall(command.encode('ascii'))
+            self.last_activity = time.monotonic()
+            print(f"[{self.hall_id}] Отправлено: {command}")
+            
+            if self.ack_enabled or command.startswith('ACK'):
+                try:
+                    response = self._read_reply()
+                except socket.timeout:
+                    metric_icmp_reply_timeout.inc(hall=self.hall_id)
+                    self._reply_timeout()
+                    return False, "Нет ответа от устройства (таймаут)"
+                print(f"[{self.hall_id}] Ответ: {response}")
+                success, response = self._parse_reply(response)
+                if not success:
+                    metric_icmp_nack.inc(hall=self.hall_id, command=_command_name(command))
+                return success, response
+            else:
+                return True, "Отправлено"
+            
+        except Exception as e:
+            print(f"[{self.hall_id}] Ошибка отправки команды: {str(e)}")
+            if isinstance(e, OSError):
+                self._connection_lost(e)
+            return False, f"Ошибка: {str(e)}"
+    
+    def _read_reply(self):
+        """Ответ на только что отправленную команду; время ответа — в класс icmp.rtt.
+
+        Сначала пропускаются поздние ответы на прошлые команды (late_replies),
+        иначе они были бы прочитаны как ответ на эту.
+        """
+        started = time.monotonic()
+        deadline = started + latency.timeout('icmp.rtt')
+        try:
+            while True:
+                frame = self.reader.read_frame(deadline - time.monotonic())
+                if not self.late_replies:
+                    return frame
+                self.late_replies -= 1
+                print(f"[{self.hall_id}] Пропущен поздний ответ: {frame}")
+        finally:
+            latency.observe('icmp.rtt', time.monotonic() - started)
+
+    def _reply_timeout(self):
+        """Ответ не пришёл за icmp.rtt (вызывается под блокировкой).
+
+        Один поздний ответ допустим: он будет пропущен перед ответом на следующую
+        команду. Если не дождались и его, связь с устройством считается потерянной.
+        """
+        if self.late_replies:
+            self._connection_lost('нет ответов на команды, переподключение')
+        else:
+            self.late_replies += 1
+            print(f"[{self.hall_id}] Нет ответа за {latency.timeout('icmp.rtt'):.1f} с, поздний ответ будет пропущен")
+    
+    @staticmethod
+    def _parse_reply(response):
+        """Разбор кадра ответа: ACK / NACK[,код] / произвольный ответ"""
+        head = response.split(',', 1)[0].strip().upper()
+        if head == 'NACK':
+            return False, response
+        if head == 'ACK':
+            return True, "ACK"
+        return True, response
+    
+    def send_command(self, command, priority=None):
+        """Публичный метод отправки команды: через очередь команд зала (CommandActor)"""
+        started = time.monotonic()
+        try:
+            return self.actor.call(command, priority)
+        finally:
+            metric_icmp_command.observe(time.monotonic() - started,
+                                        hall=self.hall_id, command=_command_name(command))
+    
+    def _execute_command(self, command):
+        """Выполнение команды исполнителем очереди (блокировка — против connect/keepalive)"""
+        acquired = self._acquire_lock()
+        if not acquired:
+            return False, "Не удалось получить блокировку (timeout)"
+        
+        try:
+            return self._send_command_internal(command)
+        finally:
+            self.lock.release()
+    
+    def _icmp_fallback(self, action, reason, fallback_command, started):
+        """Выполнить команду по ICMP вместо TMS и учесть это в метриках"""
+        metric_fallback.inc(hall=self.hall_id, operation=action, reason=reason)
+        result = self.send_command(fallback_command)
+        metric_operation.observe(time.monotonic() - started, hall=self.hall_id, operation=action, path='icmp')
+        return result
+    
+    def _tms_command(self, action, path, fallback_command):
+        """POST в TMS; при недоступности, ошибке HTTP или разомкнутом breaker — ICMP.
+
+        Пока breaker хоста TMS или устройства разомкнут, команда сразу уходит
+        по ICMP, не дожидаясь таймаута HTTP. Возвращает (success: bool, message: str).
+        """
+        started = time.monotonic()
+        if not tms_breakers.allow(self.tms.base_url, self.tms_id):
+            print(f"[{self.hall_id}] TMS API недоступен (breaker разомкнут), {action} по ICMP.")
+            return self._icmp_fallback(action, 'breaker_open', fallback_command, started)
+
+        try:
+            resp = self.tms.control(path)
+        except Exception as e:
+            host_down = isinstance(e, (requests.ConnectionError, requests.Timeout))
+            tms_breakers.failure(self.tms.base_url, self.tms_id, e, host_down=host_down)
+            print(f"[{self.hall_id}] Внешний TMS API недоступен при {action}: {e}. Применяем внутреннюю команду.")
+            return self._icmp_fallback(action, 'tms_error', fallback_command, started)
+
+        if resp.status_code == 200:
+            tms_breakers.success(self.tms.base_url, self.tms_id)
+            metric_operation.observe(time.monotonic() - started, hall=self.hall_id, operation=action, path='tms')
+            try:
+                data = resp.json()
+                ok = data.get('ok', True) if isinstance(data, dict) else True
+                return bool(ok), resp.text
+            except ValueError:
+                return True, resp.text
+        tms_breakers.failure(self.tms.base_url, self.tms_id, f"HTTP {resp.status_code}",
+                             host_down=False)
+        print(f"[{self.hall_id}] TMS API {action} вернул HTTP {resp.status_code}, тело: {resp.text}. Применяем внутреннюю команду.")
+        return self._icmp_fallback(action, 'http_error', fallback_command, started)
+
+    def stop(self):
+        """Остановка воспроизведения через внешний TMS API с fallback на ICMP.
+
+        POST {tms_base}/api/{device_id}/stop
+        """
+        return self._tms_command('stop', f"/api/{self.tms_id}/stop", "PLAYER.Stop")
+    
+    def play(self):
+        """Запуск воспроизведения через внешний TMS API с фолбэком на ICMP.
+
+        POST {tms_base}/api/{device_id}/play
+        """
+        return self._tms_command('play', f"/api/{self.tms_id}/play", "PLAYER.Play")
+    
+    def lamp_off(self):
+        """Выключение лампы через внешний TMS API с фолбэком на ICMP"""
+        return self._tms_command('lamp_off', f"/api/{self.tms_id}/projector/lamp/off",
+                                 "PROJECTOR.Turn Lamp Off")
+    
+    def clear(self):
+        """Очистка плейлиста"""
+        return self.send_command("PLAYER.Clear")
+    
+    def light_on(self):
+        """Включение света через EKOS"""
+        return self.send_command('EKOS.Send Text,"$KE,WR,4,1\\0D\\0A"')
+    
+    def light_off(self):
+        """Выключение света через EKOS"""
+        return self.send_command('EKOS.Send Text,"$KE,WR,1,1\\0D\\0A"')
+    
+    def set_volume(self, level):
+        """Установка громкости через tm8710 (0-5.5)"""
+        fader_value = int(float(level) * 10)
+        return self.send_command(f'tm8710.Send Text,"tm8710.sys.fader {fader_value}"')
+    
+    def _wait_state(self, step, predicate, timeout):
+        """Ожидание состояния устройства после шага завершения сеанса.
+
+        Состояние берётся из снимка статуса TMS. Если состояние недоступно,
+        выдерживается пауза SHUTDOWN_FALLBACK_DELAY; по истечении timeout
+        следующий шаг выполняется без подтверждения. Возвращает запись
+        {'step', 'outcome': reached | timeout | fallback, 'waited'}.
+        """
+        started = time.monotonic()
+        deadline = started + timeout
+        outcome = 'fallback'
+        while self.status_source is not None:
+            device = self.status_source(self.tms_id, SHUTDOWN_POLL_INTERVAL)
+            reached = predicate(device) if device else None
+            if reached is None:
+                break
+            if reached:
+                outcome = 'reached'
+                break
+            if time.monotonic() >= deadline:
+                outcome = 'timeout'
+                break
+            time.sleep(SHUTDOWN_POLL_INTERVAL)
+        if outcome == 'fallback':
+            time.sleep(max(0.0, SHUTDOWN_FALLBACK_DELAY - (time.monotonic() - started)))
+        return {'step': step, 'outcome': outcome, 'waited': round(time.monotonic() - started, 3)}
+
+
+class IcmpConnectionManager:
+    """Постоянные самовосстанавливающиеся ICMP-соединения с залами.
+
+    Для каждого зала работает поток-супервизор: он держит соединение
+    открытым, при обрыве переподключается с jittered backoff (ACK-режим
+    включается заново в connect()) и проверяет простаивающее соединение
+    keepalive-запросом. Состояние и счётчики переподключений — в stats().
+    """
+
+    def __init__(self, controllers):
+        self._controllers = controllers
+        self._lock = threading.Lock()
+        self._halls = {}  # hall_id -> состояние супервизора
+        self.started = False
+
+    def start(self):
+        self.started = True
+        for hall_id in list(self._controllers):
+            self.ensure(hall_id)
+
+    def ensure(self, hall_id):
+        """Включить автоподключение зала и сразу попытаться подключиться"""
+        controller = self._controllers.get(hall_id)
+        if controller is None:
+            return False
+        with self._lock:
+            hall = self._halls.get(hall_id)
+            if hall is None or hall['controller'] is not controller or hall['stop'].is_set():
+                if hall is not None:
+                    hall['stop'].set()
+                    hall['wake'].set()
+                hall = self._halls[hall_id] = {
+                    'controller': controller,
+                    'state': 'connecting',
+                    'wake': threading.Event(),
+                    'stop': threading.Event(),
+                    'connects': 0,
+                    'reconnects': 0,
+                    'failures': 0,
+                    'keepalives': 0,
+                    'next_attempt': None,
+                }
+                controller.on_connection_lost = self.wake
+                threading.Thread(target=self._supervise, args=(hall_id, hall),
+                                 name=f'icmp-{hall_id}', daemon=True).start()
+            else:
+                hall['wake'].set()
+        return True
+
+    def pause(self, hall_id):
+        """Отключить автоподключение зала и закрыть соединение"""
+        with self._lock:
+            hall = self._halls.get(hall_id)
+            if hall is not None:
+                hall['stop'].set()
+                hall['wake'].set()
+                hall['state'] = 'paused'
+        controller = self._controllers.get(hall_id)
+        if controller is not None:
+            controller.on_connection_lost = None
+            controller.disconnect()
+
+    def forget(self, hall_id):
+        """Остановить супервизор удалённого зала"""
+        with self._lock:
+            hall = self._halls.pop(hall_id, None)
+        if hall is not None:
+            hall['stop'].set()
+            hall['wake'].set()
+
+    def wake(self, hall_id):
+        with self._lock:
+            hall = self._halls.get(hall_id)
+        if hall is not None:
+            hall['wake'].set()
+
+    def _supervise(self, hall_id, hall):
+        controller = hall['controller']
+        wake, stop = hall['wake'], hall['stop']
+        delay = ICMP_RECONNECT_MIN
+        while not stop.is_set():
+            if not controller.connected:
+                hall['state'] = 'connecting'
+                success, _ = controller.connect()
+                if stop.is_set():
+                    break
+                if not success:
+                    hall['failures'] += 1
+                    hall['state'] = 'backoff'
+                    pause = delay * random.uniform(0.5, 1.5)
+                    hall['next_attempt'] = time.time() + pause
+                    delay = min(delay * 2, ICMP_RECONNECT_MAX)
+                    wake.wait(pause)
+                    wake.clear()
+                    continue
+                if hall['connects']:
+                    hall['reconnects'] += 1
+                hall['connects'] += 1
+                hall['next_attempt'] = None
+                delay = ICMP_RECONNECT_MIN
+                hall['state'] = 'connected'
+
+            idle = time.monotonic() - controller.last_activity
+            if idle >= ICMP_KEEPALIVE_INTERVAL:
+                hall['keepalives'] += 1
+                if not controller.keepalive():
+                    continue
+                idle = 0
+            wake.wait(max(ICMP_KEEPALIVE_INTERVAL - idle, 1))
+            wake.clear()
+        controller.disconnect()
+
+    def stats(self):
+        with self._lock:
+            halls = dict(self._halls)
+        result = {}
+        for hall_id, hall in halls.items():
+            controller = hall['controller']
+            result[hall_id] = {
+                'state': 'connected' if controller.connected else hall['state'],
+                'host': f"{controller.host}:{controller.port}",
+                'ack_enabled': controller.ack_enabled,
+                'connects': hall['connects'],
+                'reconnects': hall['reconnects'],
+                'failures': hall['failures'],
+                'keepalives': hall['keepalives'],
+                'last_error': controller.last_error,
+                'next_attempt': hall['next_attempt'],
+            }
+            actor = getattr(controller, 'actor', None)
+            if actor is not None:
+                result[hall_id]['queue'] = actor.stats()
+        return result
+
+
+# Маршрут Flask, из которого вызвана корутина AsyncEngine.run (метка route метрик TMS)
+async_route = contextvars.ContextVar('async_route', default='background')
+
+
+class AsyncEngine:
+    """Общий asyncio event loop для всех залов в отдельном потоке.
+
+    Loop и HTTP-сессия к TMS (aiohttp, пул keep-alive) создаются при первом
+    вызове run(). Синхронный код (Flask-маршруты, менеджер соединений)
+    вызывает корутины через run() и ждёт результат.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loop = None
+        self.http = None
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='async-engine', daemon=True).start()
+                self.http = asyncio.run_coroutine_threadsafe(self._open_http(), loop).result()
+                self.loop = loop
+        return self.loop
+
+    @staticmethod
+    async def _open_http():
+        connector = aiohttp.TCPConnector(limit_per_host=TMS_POOL_SIZE, keepalive_timeout=30)
+        timeout = aiohttp.ClientTimeout(connect=TMS_CONNECT_TIMEOUT, sock_read=TMS_TIMEOUT)
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    def run(self, coro, timeout=None):
+        """Выполнить корутину в цикле движка и дождаться результата.
+        Маршрут вызывающего HTTP-запроса доступен корутине через async_route"""
+        loop = self._ensure_loop()
+        route = request.url_rule.rule if has_request_context() and request.url_rule else 'background'
+        return asyncio.run_coroutine_threadsafe(self._with_route(coro, route), loop).result(timeout)
+
+    @staticmethod
+    async def _with_route(coro, route):
+        async_route.set(route)
+        return await coro
+
+
+class AsyncBarcoController:
+    """Асинхронный вариант BarcoController: ICMP через asyncio streams, TMS через aiohttp.
+
+    Все экземпляры работают в одном цикле AsyncEngine, поэтому команды в
+    разные залы выполняются параллельно без отдельного потока на команду.
+    Команды ICMP одного зала идут через ту же очередь с приоритетами
+    (AsyncCommandQueue — в цикле, без потока ОС), что и у BarcoController:
+    PLAYER.Stop не ждёт громкость и свет.
+    """
+
+    def __init__(self, engine, hall_id, host='192.168.1.100', port=43748, tms_id=None, status_source=None,
+                 tms_client=None):
+        self.engine = engine
+        self.hall_id = hall_id
+        self.tms_id = tms_id or hall_id
+        self.tms = tms_client or tms
+        self.host = host
+        self.port = port
+        self.status_source = status_source
+        self.connected = False
+        self.ack_enabled = False
+        self.late_replies = 0
+        self.last_error = None
+        self.last_activity = 0.0
+        self.on_connection_lost = None
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+        self.actor = AsyncCommandQueue(hall_id, self._execute)
+
+    async def _acquire(self):
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._lock.acquire(), latency.timeout('lock.wait'))
+            return True
+        except asyncio.TimeoutError:
+            metric_lock_timeout.inc(hall=self.hall_id)
+            return False
+        finally:
+            waited = time.monotonic() - started
+            latency.observe('lock.wait', waited)
+            metric_lock_wait.observe(waited, hall=self.hall_id)
+
+    async def connect(self, if_disconnected=False):
+        """Подключение к Barco ICMP (см. BarcoController.connect)"""
+        if not await self._acquire():
+            return False, "Не удалось получить блокировку (timeout)"
+        try:
+            if if_disconnected and self.connected:
+                return True, "Уже подключено"
+            self._close()
+            print(f"[{self.hall_id}] Попытка подключения к {self.host}:{self.port}")
+            started = time.monotonic()
+            try:
+                self._reader, self._writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), latency.timeout('icmp.connect'))
+            finally:
+                latency.observe('icmp.connect', time.monotonic() - started)
+            self.connected = True
+            self.last_error = None
+            self.last_activity = time.monotonic()
+            print(f"[{self.hall_id}] Подключено к {self.host}:{self.port}")
+
+            success, response = await self._send_command_internal("ACK,1")
+            if self.late_replies:
+                self.last_error = response
+                self._close()
+            if not self.connected:
+                return False, f"Ошибка подключения: {response}"
+            if success:
+                self.ack_enabled = True
+                print(f"[{self.hall_id}] ACK режим включен: {response}")
+            return True, f"Подключено к {self.host}:{self.port}"
+        except Exception as e:
+            print(f"[{self.hall_id}] Ошибка подключения: {str(e)}")
+            self.last_error = str(e)
+            self._close()
+            return False, f"Ошибка подключения: {str(e)}"
+        finally:
+            self._lock.release()
+
+    async def disconnect(self):
+        """Отключение от Barco ICMP"""
+        if not await self._acquire():
+            return
+        try:
+            self._close()
+            print(f"[{self.hall_id}] Отключено")
+        finally:
+            self._lock.release()
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = None
+        self._writer = None
+        self.connected = False
+        self.ack_enabled = False
+        self.late_replies = 0
+
+    def _connection_lost(self, error):
+        print(f"[{self.hall_id}] Соединение потеряно: {error}")
+        self.last_error = str(error)
+        self._close()
+        callback = self.on_connection_lost
+        if callback:
+            callback(self.hall_id)
+
+    async def _read_frame(self):
+        """Один ответ до ';' (остаток буфера остаётся в StreamReader); время ответа — в icmp.rtt.
+        Поздние ответы на прошлые команды пропускаются (см. BarcoController._read_reply)."""
+        started = time.monotonic()
+        deadline = started + latency.timeout('icmp.rtt')
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    frame = await asyncio.wait_for(self._reader.readuntil(IcmpReader.TERMINATOR), remaining)
+                except asyncio.IncompleteReadError:
+                    raise ConnectionError('Соединение закрыто устройством')
+                frame = frame[:-1].strip()
+                if not frame:
+                    continue
+                frame = frame.decode('ascii', errors='replace')
+                if not self.late_replies:
+                    return frame
+                self.late_replies -= 1
+                print(f"[{self.hall_id}] Пропущен поздний ответ: {frame}")
+        finally:
+            latency.observe('icmp.rtt', time.monotonic() - started)
+
+    def _reply_timeout(self):
+        """См. BarcoController._reply_timeout"""
+        if self.late_replies:
+            self._connection_lost('нет ответов на команды, переподключение')
+        else:
+            self.late_replies += 1
+            print(f"[{self.hall_id}] Нет ответа за {latency.timeout('icmp.rtt'):.1f} с, поздний ответ будет пропущен")
+
+    async def _send_command_internal(self, command):
+        if not self.connected or self._writer is None:
+            return False, "Не подключено к устройству"
+
+        try:
+            if not command.endswith(';'):
+                command = command + ';'
+            self._writer.write(command.encode('ascii'))
+            await asyncio.wait_for(self._writer.drain(), ICMP_SOCKET_TIMEOUT)
+            self.last_activity = time.monotonic()
+            print(f"[{self.hall_id}] Отправлено: {command}")
+
+            if self.ack_enabled or command.startswith('ACK'):
+                try:
+                    response = await self._read_frame()
+                except asyncio.TimeoutError:
+                    metric_icmp_reply_timeout.inc(hall=self.hall_id)
+                    self._reply_timeout()
+                    return False, "Нет ответа от устройства (таймаут)"
+                print(f"[{self.hall_id}] Ответ: {response}")
+                success, response = BarcoController._parse_reply(response)
+                if not success:
+                    metric_icmp_nack.inc(hall=self.hall_id, command=_command_name(command))
+                return success, response
+            return True, "Отправлено"
+        except Exception as e:
+            print(f"[{self.hall_id}] Ошибка отправки команды: {str(e)}")
+            if isinstance(e, OSError):
+                self._connection_lost(e)
+            return False, f"Ошибка: {str(e)}"
+
+    async def send_command(self, command, priority=None):
+        """Отправка команды через очередь команд зала (см. BarcoController.send_command)"""
+        started = time.monotonic()
+        future = self.actor.submit(command, priority, started + ICMP_COMMAND_DEADLINE)
+        try:
+            return await asyncio.wait_for(future, ICMP_COMMAND_DEADLINE)
+        except asyncio.TimeoutError:
+            return False, "Команда не выполнена за отведённое время"
+        finally:
+            metric_icmp_command.observe(time.monotonic() - started,
+                                        hall=self.hall_id, command=_command_name(command))
+
+    async def _execute(self, command):
+        """Выполнение команды исполнителем очереди зала"""
+        if not await self._acquire():
+            return False, "Не удалось получить блокировку (timeout)"
+        try:
+            return await self._send_command_internal(command)
+        finally:
+            self._lock.release()
+
+    async def _icmp_fallback(self, action, reason, fallback_command, started):
+        metric_fallback.inc(hall=self.hall_id, operation=action, reason=reason)
+        result = await self.send_command(fallback_command)
+        metric_operation.observe(time.monotonic() - started, hall=self.hall_id, operation=action, path='icmp')
+        return result
+
+    async def keepalive(self):
+        """Проверка простаивающего соединения командой ACK,1"""
+        if not await self._acquire():
+            return False
+        try:
+            if not self.connected:
+                return False
+            try:
+                self._writer.write(b"ACK,1;")
+                await asyncio.wait_for(self._writer.drain(), ICMP_SOCKET_TIMEOUT)
+                response = await self._read_frame()
+            except asyncio.TimeoutError:
+                metric_icmp_reply_timeout.inc(hall=self.hall_id)
+                self._reply_timeout()
+                return False
+            except OSError as e:
+                self._connection_lost(e)
+                return False
+            self.ack_enabled, _ = BarcoController._parse_reply(response)
+            self.last_activity = time.monotonic()
+            return True
+        finally:
+            self._lock.release()
+
+    async def _tms_command(self, action, path, fallback_command, json_body=None):
+        """POST в TMS; при недоступности, ошибке HTTP или разомкнутом breaker — fallback-команда ICMP"""
+        started = time.monotonic()
+        if not tms_breakers.allow(self.tms.base_url, self.tms_id):
+            print(f"[{self.hall_id}] TMS API недоступен (breaker разомкнут), {action} по ICMP.")
+            return await self._icmp_fallback(action, 'breaker_open', fallback_command, started)
+
+        try:
+            async with self.engine.http.post(
+                    self.tms.url(path), json=json_body,
+                    timeout=aiohttp.ClientTimeout(connect=latency.timeout(self.tms.connect_class),
+                                                  total=latency.timeout(self.tms.control_class))) as resp:
+                status = resp.status
+                text = await resp.text()
+        except Exception as e:
+            self.tms.observe('POST', self.tms.control_class, time.monotonic() - started, 'error',
+                             route=async_route.get())
+            host_down = isinstance(e, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+            tms_breakers.failure(self.tms.base_url, self.tms_id, e, host_down=host_down)
+            print(f"[{self.hall_id}] Внешний TMS API недоступен при {action}: {e}. Применяем внутреннюю команду.")
+            return await self._icmp_fallback(action, 'tms_error', fallback_command, started)
+
+        self.tms.observe('POST', self.tms.control_class, time.monotonic() - started, str(status),
+                         route=async_route.get())
+        if status == 200:
+            tms_breakers.success(self.tms.base_url, self.tms_id)
+            metric_operation.observe(time.monotonic() - started, hall=self.hall_id, operation=action, path='tms')
+            try:
+                data = json.loads(text)
+                ok = data.get('ok', True) if isinstance(data, dict) else True
+                return bool(ok), text
+            except ValueError:
+                return True, text
+        tms_breakers.failure(self.tms.base_url, self.tms_id, f"HTTP {status}", host_down=False)
+        print(f"[{self.hall_id}] TMS API {action} вернул HTTP {status}, тело: {text}. Применяем внутреннюю команду.")
+        return await self._icmp_fallback(action, 'http_error', fallback_command, started)
+
+    async def stop(self):
+        return await self._tms_command('stop', f"/api/{self.tms_id}/stop", "PLAYER.Stop")
+
+    async def play(self):
+        return await self._tms_command('play', f"/api/{self.tms_id}/play", "PLAYER.Play")
+
+    async def lamp_off(self):
+        return await self._tms_command('lamp_off', f"/api/{self.tms_id}/projector/lamp/off",
+                                       "PROJECTOR.Turn Lamp Off")
+
+    async def clear(self):
+        return await self.send_command("PLAYER.Clear")
+
+    async def light_on(self):
+        return await self.send_command('EKOS.Send Text,"$KE,WR,4,1\\0D\\0A"')
+
+    async def light_off(self):
+        return await self.send_command('EKOS.Send Text,"$KE,WR,1,1\\0D\\0A"')
+
+    async def set_volume(self, level):
+        fader_value = int(float(level) * 10)
+        return await self.send_command(f'tm8710.Send Text,"tm8710.sys.fader {fader_value}"')
+
+    async def _wait_state(self, step, predicate, timeout):
+        """Ожидание состояния устройства (см. BarcoController._wait_state)"""
+        started = time.monotonic()
+        deadline = started + timeout
+        outcome = 'fallback'
+        while self.status_source is not None:
+            device = await asyncio.to_thread(self.status_source, self.tms_id, SHUTDOWN_POLL_INTERVAL)
+            reached = predicate(device) if device else None
+            if reached is None:
+                break
+            if reached:
+                outcome = 'reached'
+                break
+            if time.monotonic() >= deadline:
+                outcome = 'timeout'
+                break
+            await asyncio.sleep(SHUTDOWN_POLL_INTERVAL)
+        if outcome == 'fallback':
+            await asyncio.sleep(max(0.0, SHUTDOWN_FALLBACK_DELAY - (time.monotonic() - started)))
+        return {'step': step, 'outcome': outcome, 'waited': round(time.monotonic() - started, 3)}
+
+
+class AsyncControllerBridge:
+    """Синхронный фасад AsyncBarcoController с интерфейсом BarcoController.
+
+    Flask-маршруты и IcmpConnectionManager работают с ним так же, как с
+    BarcoController; каждый вызов выполняется в общем цикле AsyncEngine.
+    """
+
+    def __init__(self, engine, controller):
+        self._engine = engine
+        self._controller = controller
+
+    def __getattr__(self, name):
+        return getattr(self._controller, name)
+
+    @property
+    def on_connection_lost(self):
+        return self._controller.on_connection_lost
+
+    @on_connection_lost.setter
+    def on_connection_lost(self, callback):
+        self._controller.on_connection_lost = callback
+
+    def connect(self, if_disconnected=False):
+        return self._engine.run(self._controller.connect(if_disconnected))
+
+    def disconnect(self):
+        return self._engine.run(self._controller.disconnect())
+
+    def keepalive(self):
+        return self._engine.run(self._controller.keepalive())
+
+    def send_command(self, command, priority=None):
+        return self._engine.run(self._controller.send_command(command, priority))
+
+    def stop(self):
+        return self._engine.run(self._controller.stop())
+
+    def play(self):
+        return self._engine.run(self._controller.play())
+
+    def lamp_off(self):
+        return self._engine.run(self._controller.lamp_off())
+
+    def clear(self):
+        return self._engine.run(self._controller.clear())
+
+    def light_on(self):
+        return self._engine.run(self._controller.light_on())
+
+    def light_off(self):
+        return self._engine.run(self._controller.light_off())
+
+    def set_volume(self, level):
+        return self._engine.run(self._controller.set_volume(level))
+
+    def _wait_state(self, step, predicate, timeout):
+        return self._engine.run(self._controller._wait_state(step, predicate, timeout))
+
+
+# Общий asyncio-цикл (используется при CONTROLLER_ENGINE=async)
+async_engine = AsyncEngine()
+
+
+# Мемные приветствия для администраторов
+def load_greetings():
+    """Загружает приветствия из файла"""
+    try:
+        with open('greetings.txt', 'r', encoding='utf-8') as f:
+            greetings = [line.strip() for line in f if line.strip()]
+            return greetings if greetings else ["Добро пожаловать! 🎬"]
+    except FileNotFoundError:
+        print("Предупреждение: Файл greetings.txt не найден. Используются приветствия по умолчанию.")
+        return [
+            "Приветствую, повелитель пикселей! 🎬",
+            "О великий киномеханик, ваше величество! 👑",
+            "Добро пожаловать в царство 24 кадров в секунду! 🎞️"
+        ]
+
+_greetings = None
+
+
+def random_greeting():
+    """Случайное приветствие; файл читается при первом показе страницы входа"""
+    global _greetings
+    if _greetings is None:
+        _greetings = load_greetings()
+    return random.choice(_greetings)
+
+class AuditStore:
+    """Журнал действий в SQLite (WAL) с индексами по времени, админу, залу и действию.
+
+    Пишет только поток AuditLogWriter (insert), запросы открывают своё
+    соединение только для чтения и читают строки курсором, не загружая
+    выборку целиком. При создании базы в фоне один раз импортируются
+    существующие дневные файлы журнала (import_logs). У импортированной
+    записи source — «файл:номер строки» (уникален), у записанной на лету — NULL.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS audit (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,
+            admin TEXT NOT NULL,
+            hall TEXT NOT NULL,
+            action TEXT NOT NULL,
+            details TEXT NOT NULL DEFAULT '',
+            source TEXT
+        );
+        CREATE INDEX IF NOT EXISTS audit_ts ON audit (ts);
+        CREATE INDEX IF NOT EXISTS audit_admin_ts ON audit (admin, ts);
+        CREATE INDEX IF NOT EXISTS audit_hall_ts ON audit (hall, ts);
+        CREATE INDEX IF NOT EXISTS audit_action_ts ON audit (action, ts);
+        CREATE TABLE IF NOT EXISTS audit_meta (key TEXT PRIMARY KEY, value TEXT);
+    """
+
+    # Записи из файлов не моложе этого запаса до начала записи на лету сверяются
+    # с записями в базе: воркер мог записать их в файл до создания базы, а в базу — после
+    IMPORT_OVERLAP = 5.0
+
+    FILTERS = ('admin', 'hall', 'action')
+
+    def __init__(self, path=AUDIT_DB, log_dir=AUDIT_LOG_DIR):
+        self.path = path
+        self.log_dir = log_dir
+        self._lock = threading.Lock()
+        self._ready = False
+        self._writer = None
+        self.import_state = {'running': False}
+
+    def _connect(self, readonly=False):
+        # check_same_thread=False: под eventlet запросы идут в потоках tpool (blocking_call),
+        # а соединением в каждый момент пользуется один вызывающий
+        if readonly:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, timeout=10, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            # WAL: чтение не блокирует запись; NORMAL — fsync при контрольных точках
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def ensure(self):
+        """Создать базу и схему; для новой базы — запустить импорт старых файлов.
+
+        Импорт запускает только процесс, первым записавший отметку в audit_meta
+        (несколько воркеров gunicorn открывают одну базу).
+        """
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            claimed = blocking_call(self._create_schema)
+            self._ready = True
+        if claimed:
+            self.start_import()
+
+    def _create_schema(self):
+        """Схема и отметки audit_meta; True — этот процесс первым отметил импорт файлов"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(self.SCHEMA)
+            columns = [row['name'] for row in conn.execute('PRAGMA table_info(audit)')]
+            if 'source' not in columns:
+                # База без source: всё, что в ней уже есть, считается перенесённым из файлов
+                conn.execute('ALTER TABLE audit ADD COLUMN source TEXT')
+                with conn:
+                    conn.execute("INSERT OR IGNORE INTO audit_meta (key, value) "
+                                 "SELECT 'live_since', min(ts) FROM audit HAVING count(*) > 0")
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS audit_source ON audit (source)')
+            with conn:
+                claimed = conn.execute(
+                    "INSERT OR IGNORE INTO audit_meta (key, value) VALUES ('logs_import', 'started')").rowcount
+                # Граница «файлы / запись на лету»: позже неё записи попадают в базу из AuditLogWriter
+                conn.execute("INSERT OR IGNORE INTO audit_meta (key, value) VALUES ('live_since', ?)",
+                             (repr(time.time()),))
+        finally:
+            conn.close()
+        return bool(claimed)
+
+    def insert(self, records):
+        """Записать пачку (вызывается из потока-писателя журнала внутри blocking_call)"""
+        if self._writer is None:
+            self._writer = self._connect()
+        with self._writer:
+            self._writer.executemany(
+                'INSERT INTO audit (ts, admin, hall, action, details) VALUES (?, ?, ?, ?, ?)',
+                [(r['ts'], str(r['admin']), str(r['hall']), str(r['action']), str(r['details'] or ''))
+                 for r in records])
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def query(self, admin=None, hall=None, action=None, since=None, until=None, text=None,
+              cursor=None, limit=None):
+        """Записи от новых к старым: генератор dict; cursor — (ts, id) последней выданной записи"""
+        self.ensure()
+        where, params = [], []
+        for column, value in zip(self.FILTERS, (admin, hall, action)):
+            if value:
+                where.append(f'{column} = ?')
+                params.append(value)
+        if since is not None:
+            where.append('ts >= ?')
+            params.append(since)
+        if until is not None:
+            where.append('ts < ?')
+            params.append(until)
+        if text:
+            where.append("details LIKE ? ESCAPE '\\'")
+            params.append('%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if cursor is not None:
+            where.append('(ts < ? OR (ts = ? AND id < ?))')
+            params.extend((cursor[0], cursor[0], cursor[1]))
+        sql = 'SELECT id, ts, admin, hall, action, details FROM audit'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY ts DESC, id DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        conn = blocking_call(self._connect, readonly=True)
+        try:
+            rows = blocking_call(conn.execute, sql, params)
+            while True:
+                chunk = blocking_call(rows.fetchmany, 500)
+                if not chunk:
+                    return
+                for row in chunk:
+                    item = dict(row)
+                    item['time'] = datetime.fromtimestamp(row['ts']).isoformat(timespec='seconds')
+                    yield item
+        finally:
+            conn.close()
+
+    def stats(self):
+        self.ensure()
+        count, first, last = blocking_call(self._totals)
+        return {
+            'path': self.path,
+            'entries': count,
+            'first': datetime.fromtimestamp(first).isoformat(timespec='seconds') if first else None,
+            'last': datetime.fromtimestamp(last).isoformat(timespec='seconds') if last else None,
+            'import': dict(self.import_state),
+        }
+
+    def _totals(self):
+        conn = self._connect(readonly=True)
+        try:
+            return conn.execute('SELECT count(*), min(ts), max(ts) FROM audit').fetchone()
+        finally:
+            conn.close()
+
+    def start_import(self):
+        """Импорт дневных файлов журнала в фоне; False, если импорт уже идёт"""
+        self.ensure()
+        with self._lock:
+            if self.import_state.get('running'):
+                return False
+            self.import_state = {'running': True, 'files': 0, 'imported': 0, 'duplicates': 0}
+        threading.Thread(target=blocking_call, args=(self.import_logs,), name='audit-import', daemon=True).start()
+        return True
+
+    @staticmethod
+    def _parse_line(line, jsonl):
+        """Запись журнала из строки файла (.log или .jsonl); None — не запись журнала"""
+        if jsonl:
+            try:
+                record = json.loads(line)
+                return (float(record['ts']), record['admin'], record['hall'], record['action'],
+                        record.get('details') or '')
+            except (ValueError, KeyError, TypeError):
+                return None
+        if not line.startswith('[') or '] Админ: ' not in line:
+            return None
+        stamp, rest = line[1:].split('] Админ: ', 1)
+        parts = rest.rstrip('\n').split(' | ', 3)
+        if len(parts) < 3 or not parts[1].startswith('Зал: ') or not parts[2].startswith('Действие: '):
+            return None
+        try:
+            ts = time.mktime(time.strptime(stamp, '%Y-%m-%d %H:%M:%S'))
+        except ValueError:
+            return None
+        return (ts, parts[0], parts[1][len('Зал: '):], parts[2][len('Действие: '):],
+                parts[3] if len(parts) > 3 else '')
+
+    def _log_paths(self):
+        """Файлы журнала по дням; если за день есть и .jsonl, и .log — только .jsonl (в нём точное время)"""
+        days = {}
+        for path in glob.glob(os.path.join(self.log_dir, 'admin_actions_*.log')) \
+                + glob.glob(os.path.join(self.log_dir, 'admin_actions_*.jsonl')):
+            day, ext = os.path.splitext(os.path.basename(path))
+            if ext == '.jsonl' or day not in days:
+                days[day] = path
+        return [days[day] for day in sorted(days)]
+
+    def import_logs(self):
+        """Перенести admin_actions_*.log/.jsonl в базу построчно, без повторов.
+
+        Источник записи — имя файла и номер строки (столбец source, UNIQUE):
+        повторный запуск пропускает уже импортированные строки, а одинаковые
+        действия в одну секунду остаются разными записями. Строки не старше
+        live_since уже есть в базе (их записал AuditLogWriter) и не импортируются;
+        в окне IMPORT_OVERLAP перед границей строка пропускается, если в базе
+        есть такая же запись, сделанная на лету.
+        """
+        state = self.import_state
+        conn = None
+        try:
+            conn = self._connect()
+            live_since = float(conn.execute(
+                "SELECT value FROM audit_meta WHERE key = 'live_since'").fetchone()['value'])
+            for path in self._log_paths():
+                jsonl = path.endswith('.jsonl')
+                name = os.path.basename(path)
+                pending = 0
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    for line_no, line in enumerate(f, 1):
+                        if not line.endswith('\n'):
+                            continue  # строка дописывается прямо сейчас
+                        record = self._parse_line(line, jsonl)
+                        if record is None:
+                            continue
+                        ts, admin, hall, action, details = record
+                        if ts >= live_since:
+                            continue
+                        source = f'{name}:{line_no}'
+                        if ts >= live_since - self.IMPORT_OVERLAP:
+                            second = float(int(ts))
+                            inserted = conn.execute(
+                                'INSERT OR IGNORE INTO audit (ts, admin, hall, action, details, source) '
+                                'SELECT ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM audit '
+                                'WHERE source IS NULL AND admin = ? AND ts >= ? AND ts < ? '
+                                'AND hall = ? AND action = ? AND details = ?)',
+                                (ts, admin, hall, action, details, source,
+                                 admin, second, second + 1, hall, action, details),
+                            ).rowcount
+                        else:
+                            inserted = conn.execute(
+                                'INSERT OR IGNORE INTO audit (ts, admin, hall, action, details, source) '
+                                'VALUES (?, ?, ?, ?, ?, ?)',
+                                (ts, admin, hall, action, details, source),
+                            ).rowcount
+                        state['imported' if inserted else 'duplicates'] += 1
+                        pending += 1
+                        if pending >= 2000:
+                            conn.commit()
+                            pending = 0
+                conn.commit()
+                state['files'] += 1
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO audit_meta (key, value) VALUES ('logs_import', ?)",
+                             (datetime.now().isoformat(timespec='seconds'),))
+            print(f"Журнал действий: импортировано записей {state['imported']} из файлов: {state['files']}")
+        except (OSError, sqlite3.Error) as e:
+            state['error'] = str(e)
+            print(f"Ошибка импорта журнала действий: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+            state['running'] = False
+            state['finished_at'] = datetime.now().isoformat(timespec='seconds')
+
+
+class AuditLogWriter:
+    """Фоновая запись журнала действий администраторов.
+
+    log_action() только кладёт запись в очередь. Поток-писатель забирает
+    записи пачками, пишет их в открытый дневной файл (текст и/или JSON Lines)
+    и в AuditStore, переключается на новый файл в полночь, делает fsync раз
+    в fsync_interval секунд и дописывает очередь при завершении процесса.
+    В консоль записи не дублируются: вывод построчно в stdout стоил бы
+    писателю больше, чем запись пачки в файл.
+    """
+
+    def __init__(self, log_dir=AUDIT_LOG_DIR, fmt=AUDIT_LOG_FORMAT,
+                 fsync_interval=AUDIT_FSYNC_INTERVAL, batch_size=AUDIT_BATCH_SIZE, store=None):
+        self.log_dir = log_dir
+        self.store = store
+        self.formats = ('text', 'jsonl') if fmt == 'both' else (fmt,)
+        self.fsync_interval = fsync_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._files = {}
+        self._day_start = 0.0
+        self._next_midnight = 0.0
+        self._dirty = False
+        self._last_fsync = time.monotonic()
+
+    def write(self, record):
+        """Поставить запись в очередь (record: ts, admin, hall, action, details)"""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='audit-log', daemon=True)
+                    self._thread.start()
+        self._queue.put(record)
+
+    def pending(self):
+        """Сколько записей ждут записи на диск"""
+        return self._queue.qsize()
+
+    def close(self, timeout=5):
+        """Дописать очередь, fsync и закрыть файлы"""
+        with self._lock:
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                timeout = self.fsync_interval if self._dirty and self.fsync_interval > 0 else None
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []  # пора сделать отложенный fsync
+            while batch and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            records = [r for r in batch if r is not None]
+            # Файлы, fsync и SQLite — через blocking_call: под eventlet не задерживают цикл событий
+            try:
+                if records:
+                    if self.store is not None:
+                        self.store.ensure()
+                    started = time.monotonic()
+                    blocking_call(self._write_batch, records)
+                    metric_audit_write.observe(time.monotonic() - started)
+                    metric_audit_lag.observe(max(time.time() - records[0]['ts'], 0.0))
+                if stop or time.monotonic() - self._last_fsync >= self.fsync_interval:
+                    blocking_call(self._sync)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Ошибка записи журнала действий: {e}")
+            if stop:
+                blocking_call(self._close_files)
+                if self.store is not None:
+                    blocking_call(self.store.close)
+                return
+
+    def _write_batch(self, records):
+        lines = {fmt: [] for fmt in self.formats}
+        for record in records:
+            if not self._day_start <= record['ts'] < self._next_midnight:
+                self._flush_lines(lines)
+                self._open_day(record['ts'])
+            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['ts']))
+            text = f"[{timestamp}] Админ: {record['admin']} | Зал: {record['hall']} | Действие: {record['action']}"
+            if record['details']:
+                text += f" | {record['details']}"
+            if 'text' in lines:
+                lines['text'].append(text + '\n')
+            if 'jsonl' in lines:
+                lines['jsonl'].append(json.dumps(dict(record, time=timestamp), ensure_ascii=False) + '\n')
+        self._flush_lines(lines)
+        if self.store is not None:
+            self.store.insert(records)
+
+    def _flush_lines(self, lines):
+        for fmt, chunk in lines.items():
+            if chunk:
+                f = self._files[fmt]
+                f.write(''.join(chunk))
+                f.flush()
+                chunk.clear()
+                self._dirty = True
+
+    def _open_day(self, ts):
+        """Открыть файлы дня, к которому относится ts, и запомнить начало следующих суток"""
+        self._close_files()
+        day = datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+        self._day_start = day.timestamp()
+        self._next_midnight = (day + timedelta(days=1)).timestamp()
+        os.makedirs(self.log_dir, exist_ok=True)
+        suffix = {'text': 'log', 'jsonl': 'jsonl'}
+        for fmt in self.formats:
+            path = os.path.join(self.log_dir, f'admin_actions_{day.strftime("%Y-%m-%d")}.{suffix[fmt]}')
+            self._files[fmt] = open(path, 'a', encoding='utf-8')
+
+    def _sync(self):
+        if self._dirty:
+            for f in self._files.values():
+                os.fsync(f.fileno())
+            self._dirty = False
+        self._last_fsync = time.monotonic()
+
+    def _close_files(self):
+        if self._files:
+            self._sync()
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+
+audit_store = AuditStore() if AUDIT_DB else None
+audit_log = AuditLogWriter(store=audit_store)
+atexit.register(audit_log.close)
+
+
+# Логирование действий
+def log_action(admin_name, hall_id, action, details=''):
+    """Записывает действие администратора в лог-файл (асинхронно, через AuditLogWriter)"""
+    audit_log.write({
+        'ts': time.time(),
+        'admin': admin_name,
+        'hall': hall_id,
+        'action': action,
+        'details': details,
+    })
+
+class _CoalesceSlot:
+    """Состояние одного устройства в LatestValueCoalescer"""
+
+    __slots__ = ('cond', 'seq', 'pending', 'sending', 'applied_seq', 'applied',
+                 'last_sent', 'sends', 'superseded')
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.seq = 0
+        self.pending = None      # (seq, value, send) — самое новое неотправленное значение
+        self.sending = False
+        self.applied_seq = 0
+        self.applied = None      # (value, result, error) последней отправки
+        self.last_sent = 0.0
+        self.sends = 0
+        self.superseded = 0
+
+
+class LatestValueCoalescer:
+    """Объединение частых установок значения на одно устройство (last-write-wins).
+
+    Для каждого ключа устройства хранится только самое новое ожидающее
+    значение. Первый вызов без отправки в полёте становится ведущим: выдерживает
+    min_interval с прошлой отправки и отправляет последнее значение. Вызовы,
+    чьё значение заменили более новым, получают результат той отправки,
+    которая их перекрыла. send(value, merged) вызывается ровно один раз на
+    применённое значение; merged — сколько запросов оно закрыло.
+    """
+
+    def __init__(self, min_interval=VOLUME_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._slots = {}
+
+    def _slot(self, key):
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = _CoalesceSlot()
+            return slot
+
+    def submit(self, key, value, send):
+        """Поставить значение устройству key; вернуть (применённое значение, результат send, superseded)"""
+        slot = self._slot(key)
+        with slot.cond:
+            slot.seq += 1
+            my_seq = slot.seq
+            if slot.pending is not None:
+                slot.superseded += 1
+            slot.pending = (my_seq, value, send)
+            while slot.applied_seq < my_seq and slot.sending:
+                slot.cond.wait()
+            leader = slot.applied_seq < my_seq
+            if leader:
+                slot.sending = True
+
+        if leader:
+            self._lead(slot)
+
+        with slot.cond:
+            applied_seq = slot.applied_seq
+            applied_value, result, error = slot.applied
+        if error is not None:
+            raise error
+        return applied_value, result, applied_seq != my_seq
+
+    def _lead(self, slot):
+        """Ведущий: выдержать интервал, забрать последнее значение и отправить его"""
+        try:
+            with slot.cond:
+                delay = slot.last_sent + self.min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            with slot.cond:
+                seq, value, send = slot.pending
+                slot.pending = None
+                merged = seq - slot.applied_seq
+            result = error = None
+            try:
+                result = send(value, merged)
+            except Exception as e:
+                error = e
+            with slot.cond:
+                slot.applied_seq = seq
+                slot.applied = (value, result, error)
+                slot.last_sent = time.monotonic()
+                slot.sends += 1
+        finally:
+            with slot.cond:
+                slot.sending = False
+                slot.cond.notify_all()
+
+    def stats(self):
+        with self._lock:
+            slots = dict(self._slots)
+        result = {}
+        for key, slot in slots.items():
+            with slot.cond:
+                result[str(key)] = {
+                    'requests': slot.seq,
+                    'sends': slot.sends,
+                    'superseded': slot.superseded,
+                    'pending': slot.pending is not None,
+                    'last_value': slot.applied[0] if slot.applied else None,
+                }
+        return {'min_interval': self.min_interval, 'devices': result}
+
+
+# Установка громкости: один коалесер на все устройства (ключ — устройство)
+volume_coalescer = LatestValueCoalescer()
+
+class UnixSocketManager(PubSubManager):
+    """Шина событий Socket.IO между процессами одного хоста через UNIX-сокет.
+
+    Процесс, захвативший flock на path + '.lock', становится брокером:
+    слушает сокет и пересылает каждое опубликованное сообщение всем
+    подписчикам. Остальные процессы подключаются к нему; если брокер
+    завершился, блокировку освобождает ОС и брокером становится первый
+    процесс, заметивший обрыв. Сообщения — JSON, по одному в строке.
+    Каждому подписчику брокер пишет из своего потока через очередь
+    SOCKETIO_BUS_QUEUE: зависший воркер не задерживает рассылку остальным,
+    а при переполнении его очереди отключается.
+    """
+
+    name = 'unix'
+
+    def __init__(self, path, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self._lock_file = None
+        self._pub = None
+        self._pub_lock = threading.Lock()
+        self._subscribers = {}  # соединение подписчика -> очередь строк на отправку
+        self._subscribers_lock = threading.Lock()
+
+    # ---- брокер ----
+
+    def _claim_broker(self):
+        """Стать брокером, если его ещё нет (неблокирующий flock)"""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.path + '.lock', 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        try:
+            os.unlink(self.path)  # сокет от завершившегося брокера
+        except FileNotFoundError:
+            pass
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        server.listen(64)
+        self._lock_file = lock_file
+        threading.Thread(target=self._broker_accept, args=(server,), name='socketio-bus', daemon=True).start()
+        print(f"Шина Socket.IO: брокер на {self.path} (pid {os.getpid()})")
+        return True
+
+    def _broker_accept(self, server):
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=self._broker_client, args=(conn,), daemon=True).start()
+
+    def _broker_client(self, conn):
+        reader = conn.makefile('rb')
+        try:
+            role = reader.readline().strip()
+            if role == b'SUB':
+                conn.settimeout(ICMP_SOCKET_TIMEOUT)
+                outbox = queue.Queue(SOCKETIO_BUS_QUEUE)
+                threading.Thread(target=self._broker_send, args=(conn, outbox),
+                                 name='socketio-bus-send', daemon=True).start()
+                with self._subscribers_lock:
+                    self._subscribers[conn] = outbox
+                reader.read()  # до закрытия подписчиком или _drop_subscriber
+            else:
+                for line in reader:
+                    with self._subscribers_lock:
+                        subscribers = list(self._subscribers.items())
+                    for sub, outbox in subscribers:
+                        try:
+                            outbox.put_nowait(line)
+                        except queue.Full:
+                            print("Шина Socket.IO: подписчик не успевает читать, отключаем")
+                            self._drop_subscriber(sub)
+        except OSError:
+            pass
+        finally:
+            self._drop_subscriber(conn)
+            reader.close()
+            conn.close()
+
+    def _broker_send(self, conn, outbox):
+        """Поток отправки одному подписчику; None в очереди — завершить"""
+        while True:
+            line = outbox.get()
+            if line is None:
+                return
+            try:
+                conn.sendall(line)
+            except OSError:
+                self._drop_subscriber(conn)
+                return
+
+    def _drop_subscriber(self, conn):
+        """Убрать подписчика из рассылки и разорвать соединение (его поток чтения завершится)"""
+        with self._subscribers_lock:
+            outbox = self._subscribers.pop(conn, None)
+        if outbox is None:
+            return
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            outbox.put_nowait(None)
+        except queue.Full:
+            pass  # поток отправки завершится на ошибке sendall после shutdown
+
+    # ---- клиент ----
+
+    def _connect(self, role, attempts=None):
+        attempt = 0
+        while True:
+            self._claim_broker()
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+                sock.sendall(role + b'\n')
+                return sock
+            except OSError:
+                sock.close()
+                attempt += 1
+                if attempts is not None and attempt >= attempts:
+                    raise
+                time.sleep(min(0.1 * attempt, 2))
+
+    def _publish(self, data):
+        line = (self.json.dumps(data) + '\n').encode('utf-8')
+        with self._pub_lock:
+            for _ in range(2):
+                try:
+                    if self._pub is None:
+                        self._pub = self._connect(b'PUB', attempts=5)
+                    self._pub.sendall(line)
+                    return
+                except OSError as e:
+                    if self._pub is not None:
+                        self._pub.close()
+                    self._pub = None
+                    error = e
+            print(f"Шина Socket.IO: не удалось опубликовать событие: {error}")
+
+    def _listen(self):
+        while True:
+            sock = self._connect(b'SUB')
+            reader = sock.makefile('rb')
+            try:
+                for line in reader:
+                    yield line.decode('utf-8')
+            except OSError:
+                pass
+            finally:
+                reader.close()
+                sock.close()
+            time.sleep(0.1)  # брокер пропал — следующий _connect попробует занять его место
+
+
+def socketio_bus_options(url=SOCKETIO_MESSAGE_QUEUE):
+    """Параметры SocketIO для шины событий между процессами"""
+    if not url:
+        return {}
+    if url.startswith('unix://'):
+        return {'client_manager': UnixSocketManager(url[len('unix://'):])}
+    return {'message_queue': url}
+
+
+# Flask приложение
+app = Flask(__name__)
+app.config['SECRET_KEY'] = 'barco-multi-hall-secret-key-2026'
+app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+app.config['SESSION_COOKIE_SECURE'] = False
+socketio = SocketIO(app, cors_allowed_origins="*",
+                    async_mode=None if SOCKETIO_ASYNC_MODE == 'auto' else SOCKETIO_ASYNC_MODE,
+                    manage_session=False, transports=SOCKETIO_TRANSPORTS, **socketio_bus_options())
+hall_status = HallStatusPublisher(status_cache, socketio)
+log_broadcaster = LogBroadcaster(socketio)
+tms_breakers.on_change = lambda state: socketio.emit('breaker_state', state)
+
+class HallsConfigStore:
+    """Конфигурация залов в памяти с перечитыванием при изменении файла.
+
+    Файл проверяется (stat) не чаще раза в check_interval секунд; при
+    изменении mtime или размера он перечитывается, а подписчики получают
+    старый и новый список залов. Если новый файл некорректен, остаётся
+    последняя успешно загруженная конфигурация.
+    """
+
+    def __init__(self, path=HALLS_CONFIG_PATH, check_interval=HALLS_CONFIG_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._config = {}
+        self._halls = []
+        self._signature = None
+        self._next_check = 0.0
+        self._listeners = []
+
+    def halls(self):
+        self.maybe_reload()
+        return self._halls
+
+    def config(self):
+        self.maybe_reload()
+        return self._config
+
+    def subscribe(self, listener):
+        """listener(old_halls, new_halls) вызывается после каждого перечитывания"""
+        self._listeners.append(listener)
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        with self._lock:
+            if now < self._next_check:
+                return False
+            self._next_check = now + self.check_interval
+            try:
+                st = os.stat(self.path)
+            except OSError as e:
+                if self._signature is None:
+                    print(f"Ошибка загрузки конфигурации: {e}")
+                    self._signature = 'missing'
+                return False
+            signature = (st.st_mtime_ns, st.st_size)
+            if signature == self._signature:
+                return False
+            self._signature = signature
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                halls = config['halls']
+            except Exception as e:
+                print(f"Ошибка загрузки конфигурации: {e}")
+                return False
+            old_halls = self._halls
+            self._config = config
+            self._halls = halls
+
+        if old_halls:
+            print(f"Конфигурация залов перечитана: {self.path}")
+        for listener in self._listeners:
+            listener(old_halls, halls)
+        return True
+
+
+halls_store = HallsConfigStore()
+
+
+# Загрузка конфигурации залов
+def load_halls_config():
+    """Список залов из кеша конфигурации (без чтения файла на каждый запрос)"""
+    return halls_store.halls()
+
+# Словарь контроллеров для каждого зала
+controllers = {}
+
+def create_controller(hall):
+    """Контроллер зала для выбранного движка (CONTROLLER_ENGINE) на хосте TMS зала"""
+    host = tms_hosts.for_hall(hall)
+    status_source = lambda tms_id, max_age: device_status(tms_id, max_age, host.base_url)
+    if CONTROLLER_ENGINE == 'async' and aiohttp is not None:
+        return AsyncControllerBridge(async_engine, AsyncBarcoController(
+            async_engine,
+            hall_id=hall['id'],
+            host=hall['ip'],
+            port=hall['port'],
+            tms_id=hall.get('tms_id'),
+            status_source=status_source,
+            tms_client=host.client
+        ))
+    return BarcoController(
+        hall_id=hall['id'],
+        host=hall['ip'],
+        port=hall['port'],
+        tms_id=hall.get('tms_id'),
+        status_source=status_source,
+        tms_client=host.client
+    )
+
+def init_controllers():
+    """Инициализация контроллеров для каждого зала"""
+    halls = load_halls_config()
+    print(f"Загружено залов из конфигурации: {len(halls)}")
+    if CONTROLLER_ENGINE == 'async' and aiohttp is None:
+        print("Предупреждение: CONTROLLER_ENGINE=async требует пакет aiohttp. Используется потоковый движок.")
+    for hall in halls:
+        hall_id = hall['id']
+        print(f"  Инициализация зала: {hall_id} -> {hall['ip']}:{hall['port']}")
+        controllers[hall_id] = create_controller(hall)
+    print(f"Инициализировано {len(controllers)} залов")
+    print(f"Ключи в controllers: {list(controllers.keys())}")
+
+
+def _controller_key(hall):
+    """Параметры зала, при изменении которых контроллер нужно пересоздать"""
+    return hall['ip'], hall['port'], hall.get('tms_id'), hall.get('tms_base')
+
+
+def sync_controllers(old_halls, new_halls):
+    """Инкрементальное обновление контроллеров после перечитывания конфигурации.
+
+    Добавляются новые залы, удаляются исчезнувшие, пересоздаются только
+    контроллеры с изменившимися ip/port/tms_id; остальные соединения не трогаются.
+    """
+    old = {hall['id']: hall for hall in old_halls}
+    new = {hall['id']: hall for hall in new_halls}
+
+    for hall_id in old.keys() - new.keys():
+        controller = controllers.pop(hall_id, None)
+        icmp_manager.forget(hall_id)
+        if controller is not None and not icmp_manager.started:
+            threading.Thread(target=controller.disconnect, daemon=True).start()
+        print(f"  Зал удалён: {hall_id}")
+
+    for hall_id, hall in new.items():
+        previous = old.get(hall_id)
+        if previous is not None and hall_id in controllers and _controller_key(previous) == _controller_key(hall):
+            continue
+        replaced = controllers.get(hall_id)
+        controllers[hall_id] = create_controller(hall)
+        print(f"  Зал {'обновлён' if replaced else 'добавлен'}: {hall_id} -> {hall['ip']}:{hall['port']}")
+        if icmp_manager.started:
+            icmp_manager.ensure(hall_id)
+        elif replaced is not None:
+            threading.Thread(target=replaced.disconnect, daemon=True).start()
+
+
+# ============ Последовательности команд ============
+
+# Последовательности по умолчанию (имя -> шаги), общие для всех протоколов. Шаг выполняется,
+# когда завершены все шаги из его after; шаги без взаимных зависимостей идут параллельно.
+# Завершение сеанса — прежние шаги сервера (stop -> лампа -> clear -> свет) и кнопки
+# интерфейса (шторка, громкость CP750 30 и вход non_sync); отличия протокола или зала
+# задаются в halls_config.json
+_SHUTDOWN_STEPS = [
+    {'id': 'stop', 'op': 'stop', 'wait': 'player_stopped'},
+    {'id': 'dowser_close', 'op': 'tms', 'path': '/api/{tms_id}/dowser', 'json': {'closed': True},
+     'after': ['stop']},
+    {'id': 'lamp_off', 'op': 'lamp_off', 'wait': 'lamp_dark', 'after': ['stop']},
+    {'id': 'cp750_volume', 'op': 'tms', 'path': '/api/cp750/{cp750_id}/fader',
+     'json': {'value': 30, 'force': False}, 'requires': 'cp750_id', 'after': ['stop']},
+    {'id': 'cp750_input', 'op': 'tms', 'path': '/api/cp750/{cp750_id}/input-mode',
+     'json': {'mode': 'non_sync'}, 'requires': 'cp750_id', 'after': ['cp750_volume']},
+    {'id': 'clear', 'op': 'clear', 'after': ['lamp_off']},
+    {'id': 'lights_on', 'op': 'light_on', 'after': ['lamp_off']},
+]
+DEFAULT_SEQUENCES = {'shutdown': _SHUTDOWN_STEPS}
+
+
+def _sequence_tms_step(controller, hall, step):
+    """Запрос к TMS из шага последовательности: успех — HTTP 2xx и не {"ok": false}"""
+    client = tms_hosts.for_hall(hall).client
+    method = step.get('method', 'POST')
+    r = client.request(method, step['path'].format(**_sequence_fields(hall)), json=step.get('json'),
+                       latency_class=None if method == 'GET' else client.control_class)
+    try:
+        result = r.json()
+    except ValueError:
+        result = None
+    if not isinstance(result, dict):
+        result = {}
+    success = r.ok and result.get('ok', True) is not False and result.get('success', True) is not False
+    if success:
+        return True, 'OK'
+    return False, result.get('error') or result.get('detail') or f'HTTP {r.status_code}'
+
+
+def _sequence_fields(hall):
+    return {'hall_id': hall['id'], 'tms_id': hall.get('tms_id', hall['id']), 'cp750_id': hall.get('cp750_id', '')}
+
+
+# Операции шагов: имя -> f(controller, hall, step) -> (success, message)
+SEQUENCE_OPS = {
+    'stop': lambda c, hall, step: c.stop(),
+    'play': lambda c, hall, step: c.play(),
+    'lamp_off': lambda c, hall, step: c.lamp_off(),
+    'clear': lambda c, hall, step: c.clear(),
+    'light_on': lambda c, hall, step: c.light_on(),
+    'light_off': lambda c, hall, step: c.light_off(),
+    'volume': lambda c, hall, step: c.set_volume(step['level']),
+    'icmp': lambda c, hall, step: c.send_command(step['command']),
+    'tms': _sequence_tms_step,
+}
+
+# Операции только по ICMP: без подключения к проектору шаг пропускается, остальные
+# шаги (TMS, stop/lamp_off с fallback на ICMP) выполняются как обычно
+SEQUENCE_ICMP_OPS = {'clear', 'light_on', 'light_off', 'volume', 'icmp'}
+
+# Ожидание состояния после шага: имя -> (предикат, таймаут по умолчанию)
+SEQUENCE_WAITS = {
+    'player_stopped': (player_stopped, SHUTDOWN_STOP_TIMEOUT),
+    'lamp_dark': (lamp_dark, SHUTDOWN_LAMP_TIMEOUT),
+}
+
+
+class CompiledSequence:
+    """Проверенная последовательность зала: шаги в топологическом порядке и уровни параллельности"""
+
+    __slots__ = ('name', 'hall', 'steps', 'levels')
+
+    def __init__(self, name, hall, steps, levels):
+        self.name = name
+        self.hall = hall
+        self.steps = steps
+        self.levels = levels
+
+
+def _merge_sequence(base, overrides):
+    """Шаги зала поверх шагов протокола: по id заменяются поля, skip: true удаляет шаг"""
+    steps = {step['id']: dict(step) for step in base}
+    for override in overrides:
+        step_id = override.get('id') or override.get('op')
+        if override.get('skip'):
+            removed = steps.pop(step_id, None)
+            # Зависимые шаги наследуют зависимости удалённого, порядок сохраняется
+            for step in steps.values():
+                if removed is not None and step_id in step.get('after', ()):
+                    step['after'] = [a for a in step['after'] if a != step_id] + list(removed.get('after', ()))
+            continue
+        steps[step_id] = dict(steps.get(step_id, {}), **override)
+    return list(steps.values())
+
+
+def compile_sequence(name, hall, steps):
+    """Проверка шагов и топологическая сортировка; ValueError при ошибке описания"""
+    by_id = {}
+    for raw in steps:
+        step_id = raw.get('id') or raw.get('op')
+        op = raw.get('op')
+        if step_id in by_id:
+            raise ValueError(f'шаг {step_id} описан дважды')
+        if op not in SEQUENCE_OPS:
+            raise ValueError(f'шаг {step_id}: неизвестная операция {op}')
+        if raw.get('wait') and raw['wait'] not in SEQUENCE_WAITS:
+            raise ValueError(f"шаг {step_id}: неизвестное ожидание {raw['wait']}")
+        if op == 'tms':
+            fields = {f for _, f, _, _ in string.Formatter().parse(raw.get('path') or '') if f}
+            if not raw.get('path') or fields - {'hall_id', 'tms_id', 'cp750_id'}:
+                raise ValueError(f"шаг {step_id}: некорректный path {raw.get('path')}")
+        if op == 'icmp' and not raw.get('command'):
+            raise ValueError(f'шаг {step_id}: нет command')
+        if op == 'volume' and raw.get('level') is None:
+            raise ValueError(f'шаг {step_id}: нет level')
+        step = dict(raw, id=step_id, after=tuple(raw.get('after') or ()))
+        if step.get('wait'):
+            step['timeout'] = float(raw.get('timeout', SEQUENCE_WAITS[step['wait']][1]))
+        by_id[step_id] = step
+
+    for step in by_id.values():
+        for dep in step['after']:
+            if dep not in by_id:
+                raise ValueError(f"шаг {step['id']}: неизвестная зависимость {dep}")
+
+    levels = []
+    placed = set()
+    while len(placed) < len(by_id):
+        level = [i for i, step in by_id.items() if i not in placed and set(step['after']) <= placed]
+        if not level:
+            raise ValueError('циклическая зависимость: ' + ', '.join(sorted(by_id.keys() - placed)))
+        levels.append(level)
+        placed.update(level)
+    ordered = tuple(by_id[i] for level in levels for i in level)
+    return CompiledSequence(name, dict(hall), ordered, levels)
+
+
+class SequenceEngine:
+    """Именованные последовательности команд залов из halls_config.json.
+
+    Источник шагов: sequences[протокол][имя] в корне конфигурации, иначе
+    DEFAULT_SEQUENCES[имя]; поверх — sequences[имя] зала (по id шага). Всё
+    компилируется при загрузке конфигурации; ошибочное описание не
+    заменяет последнее корректное. run() выполняет шаги по готовности
+    зависимостей в пуле до SEQUENCE_PARALLELISM потоков и замеряет каждый.
+    """
+
+    def __init__(self, parallelism=SEQUENCE_PARALLELISM):
+        self.parallelism = parallelism
+        self._lock = threading.Lock()
+        self._compiled = {}     # hall_id -> {name: CompiledSequence}
+        self.errors = {}        # 'hall_id/name' -> текст ошибки
+
+    def load(self, config):
+        configured = config.get('sequences') or {}
+        compiled = {}
+        errors = {}
+        for hall in config.get('halls', []):
+            protocol = hall.get('protocol', 'barco')
+            base = dict(DEFAULT_SEQUENCES)
+            base.update(configured.get(protocol) or {})
+            overrides = hall.get('sequences') or {}
+            hall_sequences = compiled[hall['id']] = {}
+            for name in base.keys() | overrides.keys():
+                try:
+                    hall_sequences[name] = compile_sequence(
+                        name, hall, _merge_sequence(base.get(name, []), overrides.get(name, [])))
+                except (ValueError, TypeError, KeyError, AttributeError) as e:
+                    errors[f"{hall['id']}/{name}"] = str(e)
+                    print(f"Ошибка последовательности {name} зала {hall['id']}: {e}")
+                    previous = self._compiled.get(hall['id'], {}).get(name)
+                    if previous is not None:
+                        hall_sequences[name] = previous
+        with self._lock:
+            self._compiled = compiled
+            self.errors = errors
+
+    def get(self, hall_id, name):
+        with self._lock:
+            return self._compiled.get(hall_id, {}).get(name)
+
+    def describe(self):
+        with self._lock:
+            return {
+                'halls': {
+                    hall_id: {name: {'levels': seq.levels,
+                                     'steps': [{k: v for k, v in step.items()} for step in seq.steps]}
+                              for name, seq in hall_sequences.items()}
+                    for hall_id, hall_sequences in self._compiled.items()
+                },
+                'errors': dict(self.errors),
+            }
+
+    def run(self, hall_id, name, on_step=None):
+        """Выполнить последовательность зала: (success, steps, elapsed).
+
+        on_step(result) вызывается по завершении каждого шага. Шаг
+        выполняется и после неудачи зависимостей (как при ручном
+        завершении сеанса), кроме шагов с "require_success": true.
+        """
+        sequence = self.get(hall_id, name)
+        if sequence is None:
+            raise KeyError(f'последовательность {name} для зала {hall_id} не найдена')
+        controller = controllers.get(hall_id)
+        started = time.monotonic()
+        by_id = {step['id']: step for step in sequence.steps}
+        waiting = {step['id']: set(step['after']) for step in sequence.steps}
+        results = {}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(by_id), self.parallelism)),
+                                thread_name_prefix=f'seq-{hall_id}') as pool:
+            running = {}
+
+            def submit_ready():
+                for step_id in [i for i, deps in waiting.items() if not deps]:
+                    del waiting[step_id]
+                    step = by_id[step_id]
+                    failed = [d for d in step['after'] if not results[d]['success']]
+                    running[pool.submit(self._run_step, controller, sequence.hall, step, started,
+                                        failed if step.get('require_success') else None)] = step_id
+
+            submit_ready()
+            while running:
+                done, _ = wait_futures(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step_id = running.pop(future)
+                    results[step_id] = future.result()
+                    if on_step is not None:
+                        on_step(results[step_id])
+                    for deps in waiting.values():
+                        deps.discard(step_id)
+                submit_ready()
+
+        steps = [results[step['id']] for step in sequence.steps]
+        return all(r['success'] for r in steps), steps, time.monotonic() - started
+
+    @staticmethod
+    def _run_step(controller, hall, step, sequence_started, failed_deps):
+        started = time.monotonic()
+        result = {'action': step['id'], 'op': step['op'], 'started': round(started - sequence_started, 3)}
+        if failed_deps:
+            success, message = False, 'Пропущено: ошибка шага ' + ', '.join(failed_deps)
+        elif step.get('requires') and not hall.get(step['requires']):
+            success, message = True, f"Пропущено: у зала нет {step['requires']}"
+            result['skipped'] = True
+        elif controller is None:
+            success, message = False, 'Зал не найден'
+        elif step['op'] in SEQUENCE_ICMP_OPS and not controller.connected:
+            success, message = False, 'Пропущено: нет ICMP-подключения'
+            result['skipped'] = True
+        else:
+            try:
+                success, message = SEQUENCE_OPS[step['op']](controller, hall, step)
+            except Exception as e:
+                success, message = False, f'Ошибка: {e}'
+            if step.get('wait'):
+                w = controller._wait_state(step['id'], SEQUENCE_WAITS[step['wait']][0], step['timeout'])
+                result['waited'] = w['waited']
+                result['wait_outcome'] = w['outcome']
+        result.update(success=success, message=message, elapsed=round(time.monotonic() - started, 3))
+        return result
 
 
-# Мемные приветствия для администраторов
-def load_greetings():
-    """Загружает приветствия из файла"""
-    try:
-        with open('greetings.txt', 'r', encoding='utf-8') as f:
-            greetings = [line.strip() for line in f if line.strip()]
-            return greetings if greetings else ["Добро пожаловать! 🎬"]
-    except FileNotFoundError:
-        print("Предупреждение: Файл greetings.txt не найден. Используются приветствия по умолчанию.")
-        return [
-            "Приветствую, повелитель пикселей! 🎬",
-            "О великий киномеханик, ваше величество! 👑",
-            "Добро пожаловать в царство 24 кадров в секунду! 🎞️"
-        ]
+sequences = SequenceEngine()
 
-GREETINGS = load_greetings()
 
-# Логирование действий
-def log_action(admin_name, hall_id, action, details=''):
-    """Записывает действие администратора в лог-файл"""
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    log_entry = f"[{timestamp}] Админ: {admin_name} | Зал: {hall_id} | Действие: {action}"
-    if details:
-        log_entry += f" | {details}"
-    
-    # Запись в файл
-    log_dir = 'logs'
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    
-    log_file = os.path.join(log_dir, f'admin_actions_{datetime.now().strftime("%Y-%m-%d")}.log')
-    with open(log_file, 'a', encoding='utf-8') as f:
-        f.write(log_entry + '\n')
-    
-    print(log_entry)
+# Постоянные ICMP-соединения (запускаются вместе с сервером)
+icmp_manager = IcmpConnectionManager(controllers)
 
-# Flask приложение
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'barco-multi-hall-secret-key-2026'
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-app.config['SESSION_COOKIE_SECURE'] = False
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', manage_session=False)
+_init_lock = threading.Lock()
+_initialized = False
 
-# Загрузка конфигурации залов
-def load_halls_config():
-    try:
-        with open('halls_config.json', 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            return config['halls']
-    except Exception as e:
-        print(f"Ошибка загрузки конфигурации: {e}")
-        return []
 
-# Словарь контроллеров для каждого зала
-controllers = {}
+def init_app():
+    """Инициализация при запуске: контроллеры залов, последовательности, подписки на
+    перечитывание конфигурации.
+
+    Импорт модуля ничего не читает и не печатает; init_app() вызывают startup()
+    (__main__, хук gunicorn) и первый HTTP-запрос. Повторные вызовы ничего не делают.
+    """
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        init_controllers()
+        sequences.load(halls_store.config())
+        halls_store.subscribe(sync_controllers)
+        halls_store.subscribe(lambda old_halls, new_halls: sequences.load(halls_store.config()))
+        _initialized = True
 
-def init_controllers():
-    """Инициализация контроллеров для каждого зала"""
-    halls = load_halls_config()
-    print(f"Загружено залов из конфигурации: {len(halls)}")
-    for hall in halls:
-        hall_id = hall['id']
-        print(f"  Инициализация зала: {hall_id} -> {hall['ip']}:{hall['port']}")
-        controllers[hall_id] = BarcoController(
-            hall_id=hall_id,
-            host=hall['ip'],
-            port=hall['port'],
-            tms_id=hall.get('tms_id')
-        )
-    print(f"Инициализировано {len(controllers)} залов")
-    print(f"Ключи в controllers: {list(controllers.keys())}")
 
-# Инициализация при запуске
-init_controllers()
+@app.before_request
+def refresh_halls_config():
+    """Проверка изменения halls_config.json (не чаще HALLS_CONFIG_CHECK_INTERVAL)"""
+    init_app()
+    halls_store.maybe_reload()
 
 
 def emit_log(hall_id, message, level='info'):
-    """Отправка лога через WebSocket"""
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    socketio.emit('log', {
-        'hall_id': hall_id,
-        'message': message,
-        'level': level,
-        'timestamp': timestamp
-    })
-    print(f"[{hall_id}] {message}")
+    """Отправка лога через WebSocket (пачками, в комнату зала — см. LogBroadcaster)"""
+    log_broadcaster.emit(hall_id, message, level)
 
 
 @app.route('/')
@@ -329,11 +4013,12 @@ def index():
     """Главная страница с управлением всеми залами"""
     # Проверка авторизации
     if 'admin_name' not in session:
-        return render_template('login.html', greeting=random.choice(GREETINGS))
+        return render_template('login.html', greeting=random_greeting())
     
     halls = load_halls_config()
     admin_name = session.get('admin_name', 'Неизвестный')
-    return render_template('halls.html', halls=halls, admin_name=admin_name)
+    return render_template('halls.html', halls=halls, admin_name=admin_name,
+                           socketio_transports=SOCKETIO_TRANSPORTS)
 
 @app.route('/login', methods=['POST'])
 def login():
@@ -383,39 +4068,110 @@ def get_halls():
             'tms_id': hall.get('tms_id', hall['id']),
             'protocol': hall.get('protocol', 'barco'),
             'cp750_id': hall.get('cp750_id'),
-            'connected': False
+            'connected': bool(controllers.get(hall['id']) and controllers[hall['id']].connected)
         })
     return jsonify(result)
 
 
+@app.route('/api/tms/stats')
+def tms_stats():
+    """Статистика хостов TMS (пул, таймауты, кеш статуса, SSE, breaker) и каналов push."""
+    if 'admin_name' not in session:
+        return jsonify({'success': False, 'message': 'Не авторизован'}), 401
+    stats = {'default_base': tms.base_url, 'hosts': tms_hosts.stats()}
+    stats['status_stream'] = status_hub.stats()
+    stats['status_push'] = hall_status.stats()
+    stats['log_broadcast'] = log_broadcaster.stats()
+    stats['volume_coalescer'] = volume_coalescer.stats()
+    return jsonify(stats)
+
+
+def proxy_response(body, status_code, content_type='application/json', etag=None, compressed=None):
+    """Ответ из готовых байт тела — без разбора и повторной сериализации JSON.
+
+    Успешный GET получает ETag (переданный или sha1 тела) и 304 на
+    If-None-Match. Тело сжимается gzip, если клиент его принимает и оно не
+    меньше PROXY_GZIP_MIN_SIZE; compressed() возвращает уже сжатое тело.
+    """
+    compressible = PROXY_GZIP and len(body) >= PROXY_GZIP_MIN_SIZE
+    use_gzip = compressible and request.accept_encodings['gzip'] > 0
+    response = Response(body, status=status_code, content_type=content_type)
+    if compressible:
+        response.vary.add('Accept-Encoding')
+    if status_code == 200 and request.method in ('GET', 'HEAD'):
+        etag = etag or hashlib.sha1(body).hexdigest()[:20]
+        # У сжатого представления свой ETag, чтобы кеши не путали варианты
+        response.set_etag(f'{etag}-gz' if use_gzip else etag)
+        response.cache_control.no_cache = True
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+    if use_gzip:
+        response.set_data(compressed() if compressed else _gzip_body(body))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+@functools.lru_cache(maxsize=64)
+def _gzip_body(body):
+    """Сжатое тело прокси-ответа: опрос, возвращающий то же тело, сжимается один раз"""
+    return gzip.compress(body, PROXY_GZIP_LEVEL)
+
+
+def tms_passthrough(r):
+    """Ответ TMS клиенту как есть: тело, статус, Content-Type и ETag.
+
+    Тело читается целиком, а не потоком (iter_content): это короткие JSON
+    статуса и команд, а ETag (sha1 тела, если TMS его не прислал), ответ 304
+    и решение о gzip требуют всего тела. Потоком проксируется только SSE
+    (/api/status/stream).
+    """
+    etag = r.headers.get('ETag')
+    return proxy_response(r.content, r.status_code, r.headers.get('Content-Type', 'application/json'),
+                          etag=unquote_etag(etag)[0] if etag else None)
+
+
 @app.route('/api/status/live')
 def status_live():
-    """Прокси для агрегированного статуса (JSON, с Lamp/Dowser для Barco)."""
-    try:
-        r = requests.get(f"{EXTERNAL_API_BASE}/api/status/live", timeout=5)
-        return jsonify(r.json()), r.status_code
-    except Exception as e:
-        return jsonify({'ok': False, 'error': str(e)}), 502
+    """Агрегированный статус (JSON, с Lamp/Dowser для Barco) из общего кеша.
+
+    Тело снимка отдаётся как есть; поддерживает If-None-Match (304) и gzip.
+    """
+    snapshot = status_cache.get()
+    return proxy_response(snapshot.body, snapshot.status_code, snapshot.content_type,
+                          etag=snapshot.etag, compressed=snapshot.gzipped)
 
 
 # ============ CP750 API Endpoints ============
 
 @app.route('/api/cp750/status/all')
 def cp750_status_all():
-    """Получить статус всех CP750 аудиопроцессоров"""
-    try:
-        r = requests.get(f"{EXTERNAL_API_BASE}/api/cp750/status/all", timeout=5)
-        return jsonify(r.json()), r.status_code
-    except Exception as e:
-        return jsonify({'ok': False, 'error': str(e)}), 502
+    """Получить статус всех CP750 аудиопроцессоров (со всех хостов TMS залов)"""
+    hosts = tms_hosts.active()
+    if len(hosts) == 1:
+        try:
+            return tms_passthrough(hosts[0].client.get("/api/cp750/status/all"))
+        except Exception as e:
+            return jsonify({'ok': False, 'error': str(e)}), 502
+
+    parts = []
+    for host, future in tms_hosts.gather(lambda h: h.client.get("/api/cp750/status/all"), hosts):
+        try:
+            r = future.result(timeout=0)
+            parts.append((host, r.status_code, r.json()))
+        except FutureTimeout:
+            parts.append((host, None, None))
+        except Exception as e:
+            parts.append((host, 502, {'error': str(e)}))
+    merged = merge_tms_devices(parts)
+    return jsonify(merged), 200 if merged['ok'] else 502
 
 
 @app.route('/api/cp750/<cp_id>/status')
 def cp750_status(cp_id):
     """Получить статус конкретного CP750"""
     try:
-        r = requests.get(f"{EXTERNAL_API_BASE}/api/cp750/{cp_id}/status", timeout=5)
-        return jsonify(r.json()), r.status_code
+        return tms_passthrough(tms_for(cp_id).get(f"/api/cp750/{cp_id}/status"))
     except Exception as e:
         return jsonify({'ok': False, 'error': str(e)}), 502
 
@@ -431,22 +4187,27 @@ def cp750_fader(cp_id):
     value = data.get('value', 50)
     force = data.get('force', False)
     
-    try:
-        r = requests.post(
-            f"{EXTERNAL_API_BASE}/api/cp750/{cp_id}/fader",
-            json={'value': value, 'force': force},
-            timeout=5
-        )
+    def send(payload, merged):
+        r = tms_for(cp_id).control(f"/api/cp750/{cp_id}/fader", json=payload)
         result = r.json()
         
-        # Логирование
-        log_action(admin_name, cp_id, 'CP750_FADER', f'Уровень: {value}')
+        # Логирование: одна запись на применённое значение
+        details = f'Уровень: {payload["value"]}'
+        if merged > 1:
+            details += f' (объединено запросов: {merged})'
+        log_action(admin_name, cp_id, 'CP750_FADER', details)
         
         # Emit через WebSocket
         hall_id = cp_id.replace('_cp750', '').lower()
-        emit_log(hall_id, f'CP750 Громкость: {value}', 'success' if result.get('ok', True) else 'error')
-        
-        return jsonify({'success': True, 'result': result}), r.status_code
+        emit_log(hall_id, f'CP750 Громкость: {payload["value"]}', 'success' if result.get('ok', True) else 'error')
+        return r.status_code, result
+    
+    try:
+        # Частые изменения слайдера объединяются: отправляется только последнее значение
+        applied, (status_code, result), superseded = volume_coalescer.submit(
+            ('cp750', cp_id), {'value': value, 'force': force}, send)
+        return jsonify({'success': True, 'result': result, 'value': applied['value'],
+                        'superseded': superseded}), status_code
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 502
 
@@ -462,10 +4223,9 @@ def cp750_mute(cp_id):
     mute = data.get('mute', False)
     
     try:
-        r = requests.post(
-            f"{EXTERNAL_API_BASE}/api/cp750/{cp_id}/mute",
-            json={'mute': mute},
-            timeout=5
+        r = tms_for(cp_id).control(
+            f"/api/cp750/{cp_id}/mute",
+            json={'mute': mute}
         )
         result = r.json()
         
@@ -493,10 +4253,9 @@ def cp750_input_mode(cp_id):
     mode = data.get('mode', 'dig_1')
     
     try:
-        r = requests.post(
-            f"{EXTERNAL_API_BASE}/api/cp750/{cp_id}/input-mode",
-            json={'mode': mode},
-            timeout=5
+        r = tms_for(cp_id).control(
+            f"/api/cp750/{cp_id}/input-mode",
+            json={'mode': mode}
         )
         result = r.json()
         
@@ -525,10 +4284,9 @@ def projector_stop(device_id):
     admin_name = session['admin_name']
     
     try:
-        r = requests.post(f"{EXTERNAL_API_BASE}/api/{device_id}/stop", timeout=10)
-        result = r.json()
+        r = tms_for(device_id).post(f"/api/{device_id}/stop")
         log_action(admin_name, device_id, 'STOP', '')
-        return jsonify(result), r.status_code
+        return tms_passthrough(r)
     except Exception as e:
         return jsonify({'ok': False, 'error': str(e)}), 502
 
@@ -547,14 +4305,12 @@ def projector_lamp(device_id, action):
     try:
         # Используем формат {"on": true/false}
         lamp_on = (action == 'on')
-        r = requests.post(
-            f"{EXTERNAL_API_BASE}/api/{device_id}/lamp",
+        r = tms_for(device_id).post(
+            f"/api/{device_id}/lamp",
             json={'on': lamp_on},
-            timeout=10
         )
-        result = r.json()
         log_action(admin_name, device_id, f'LAMP_{action.upper()}', '')
-        return jsonify(result), r.status_code
+        return tms_passthrough(r)
     except Exception as e:
         return jsonify({'ok': False, 'error': str(e)}), 502
 
@@ -573,14 +4329,12 @@ def projector_dowser(device_id, action):
     try:
         # Используем формат {"closed": true/false}
         closed = (action == 'close')
-        r = requests.post(
-            f"{EXTERNAL_API_BASE}/api/{device_id}/dowser",
+        r = tms_for(device_id).post(
+            f"/api/{device_id}/dowser",
             json={'closed': closed},
-            timeout=10
         )
-        result = r.json()
         log_action(admin_name, device_id, f'DOWSER_{action.upper()}', '')
-        return jsonify(result), r.status_code
+        return tms_passthrough(r)
     except Exception as e:
         return jsonify({'ok': False, 'error': str(e)}), 502
 
@@ -589,39 +4343,194 @@ def projector_dowser(device_id, action):
 
 @app.route('/api/status/stream')
 def status_stream():
-    """Прокси для SSE стрима статусов (auto-update)."""
-    try:
-        upstream = requests.get(f"{EXTERNAL_API_BASE}/api/status/stream", stream=True, timeout=5)
-    except Exception as e:
-        return jsonify({'ok': False, 'error': str(e)}), 502
+    """SSE стрим статусов (auto-update) из общей подписки на TMS."""
+    sub = status_hub.subscribe()
 
     def generate():
         try:
-            for chunk in upstream.iter_content(chunk_size=None):
-                if chunk:
-                    yield chunk
+            while True:
+                try:
+                    event = sub.queue.get(timeout=SSE_HEARTBEAT)
+                except queue.Empty:
+                    yield b': keepalive\n\n'
+                    continue
+                if event is None:
+                    return
+                yield event
         finally:
-            try:
-                upstream.close()
-            except Exception:
-                pass
+            status_hub.unsubscribe(sub)
 
-    ct = upstream.headers.get('Content-Type', 'text/event-stream')
-    return Response(stream_with_context(generate()), mimetype=ct)
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/<hall_id>/connect', methods=['POST'])
 def connect_hall(hall_id):
-    """Внешний API режим — физическое подключение не требуется."""
+    """Включить постоянное ICMP-подключение зала (переподключение без ожидания backoff)."""
     if 'admin_name' not in session:
         return jsonify({'success': False, 'message': 'Не авторизован'}), 401
-    return jsonify({'success': True, 'message': 'API режим: сокет-подключение не требуется'})
+    if not icmp_manager.ensure(hall_id):
+        return jsonify({'success': False, 'message': 'Зал не найден'}), 404
+    log_action(session['admin_name'], hall_id, 'CONNECT', '')
+    state = icmp_manager.stats().get(hall_id, {})
+    return jsonify({'success': True, 'message': 'Подключение ICMP активно', 'connection': state})
 
 @app.route('/api/<hall_id>/disconnect', methods=['POST'])
 def disconnect_hall(hall_id):
-    """Внешний API режим — просто подтверждаем."""
+    """Отключить ICMP-соединение зала и автопереподключение."""
+    if 'admin_name' not in session:
+        return jsonify({'success': False, 'message': 'Не авторизован'}), 401
+    if hall_id not in controllers:
+        return jsonify({'success': False, 'message': 'Зал не найден'}), 404
+    icmp_manager.pause(hall_id)
+    log_action(session['admin_name'], hall_id, 'DISCONNECT', '')
+    return jsonify({'success': True, 'message': 'Отключено'})
+
+
+@app.route('/api/breakers')
+def breakers_status():
+    """Состояние circuit breakers пути TMS -> ICMP по хостам и устройствам"""
+    if 'admin_name' not in session:
+        return jsonify({'success': False, 'message': 'Не авторизован'}), 401
+    return jsonify(tms_breakers.stats())
+
+
+def _audit_time(value):
+    """Граница выборки журнала: unix-время или ISO-дата/время (местное)"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def _audit_cursor(value):
+    """Курсор страницы журнала: '<ts>:<id>' последней выданной записи"""
+    if not value:
+        return None
+    ts, row_id = value.rsplit(':', 1)
+    return float(ts), int(row_id)
+
+
+@app.route('/api/audit')
+def audit_query():
+    """Журнал действий: фильтры admin, hall, action, since, until, q (текст в деталях).
+
+    Страницы от новых записей к старым: limit и cursor из next_cursor предыдущей
+    страницы. format=jsonl — все подходящие записи потоком JSON Lines.
+    """
+    if 'admin_name' not in session:
+        return jsonify({'success': False, 'message': 'Не авторизован'}), 401
+    if audit_store is None:
+        return jsonify({'success': False, 'message': 'Журнал в SQLite отключён (AUDIT_DB)'}), 503
+    args = request.args
+    try:
+        filters = {
+            'admin': args.get('admin'),
+            'hall': args.get('hall'),
+            'action': args.get('action'),
+            'since': _audit_time(args.get('since')),
+            'until': _audit_time(args.get('until')),
+            'text': args.get('q'),
+        }
+        cursor = _audit_cursor(args.get('cursor'))
+        limit = max(1, min(int(args.get('limit', AUDIT_PAGE_SIZE)), AUDIT_PAGE_MAX))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Неверный параметр: {e}'}), 400
+    audit_store.ensure()
+
+    if args.get('format') == 'jsonl':
+        rows = audit_store.query(cursor=cursor, **filters)
+        return Response(stream_with_context(json.dumps(row, ensure_ascii=False) + '\n' for row in rows),
+                        mimetype='application/x-ndjson')
+
+    def generate():
+        rows = audit_store.query(cursor=cursor, limit=limit + 1, **filters)
+        count = 0
+        last = None
+        more = False
+        yield '{"items": ['
+        for row in rows:
+            if count == limit:
+                more = True
+                break
+            yield (',' if count else '') + json.dumps(row, ensure_ascii=False)
+            count += 1
+            last = row
+        rows.close()
+        next_cursor = f"{last['ts']!r}:{last['id']}" if more else None
+        yield f'], "count": {count}, "next_cursor": {json.dumps(next_cursor)}}}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+@app.route('/api/audit/stats')
+def audit_stats():
+    """Объём журнала в SQLite и состояние импорта старых файлов"""
+    if 'admin_name' not in session:
+        return jsonify({'success': False, 'message': 'Не авторизован'}), 401
+    if audit_store is None:
+        return jsonify({'success': False, 'message': 'Журнал в SQLite отключён (AUDIT_DB)'}), 503
+    return jsonify(audit_store.stats())
+
+
+@app.route('/api/audit/import', methods=['POST'])
+def audit_import():
+    """Повторно импортировать дневные файлы журнала (без дубликатов)"""
+    if 'admin_name' not in session:
+        return jsonify({'success': False, 'message': 'Не авторизован'}), 401
+    if audit_store is None:
+        return jsonify({'success': False, 'message': 'Журнал в SQLite отключён (AUDIT_DB)'}), 503
+    started = audit_store.start_import()
+    log_action(session['admin_name'], '-', 'AUDIT_IMPORT', '' if started else 'уже выполняется')
+    return jsonify({'success': started, 'import': dict(audit_store.import_state)}), 202 if started else 409
+
+
+@app.route('/api/latency')
+def latency_stats():
+    """Гистограммы задержек по классам вызовов и текущие адаптивные таймауты.
+
+    ?class=icmp.rtt — один класс; ?buckets=1 — со счётчиками корзин.
+    """
+    if 'admin_name' not in session:
+        return jsonify({'success': False, 'message': 'Не авторизован'}), 401
+    name = request.args.get('class')
+    if name and name not in latency.names():
+        return jsonify({'success': False, 'message': 'Неизвестный класс', 'classes': latency.names()}), 404
+    return jsonify(latency.stats(name, buckets=request.args.get('buckets') == '1'))
+
+
+# Метрики, которые дешевле посчитать при выдаче /metrics
+metrics.gauge('barco_sse_subscribers', 'Активные SSE-стримы /api/status/stream',
+              collect=lambda: {(): status_hub.stats()['subscribers']})
+metrics.gauge('barco_status_room_clients', 'Клиенты Socket.IO, подписанные на статус зала', ('hall',),
+              collect=lambda: {(hall_id,): n for hall_id, n in hall_status.stats()['rooms'].items()})
+metrics.gauge('barco_icmp_connected', 'Открыто ли ICMP-соединение зала', ('hall',),
+              collect=lambda: {(hall_id,): int(bool(c.connected)) for hall_id, c in list(controllers.items())})
+metrics.gauge('barco_breaker_open', 'Circuit breaker TMS: 0 — closed, 1 — half_open, 2 — open', ('name',),
+              collect=lambda: {(name,): {'closed': 0, 'half_open': 1, 'open': 2}[b['state']]
+                               for group in tms_breakers.stats().values() for name, b in group.items()})
+metrics.gauge('barco_command_queue_depth', 'Команды в очереди зала', ('hall',),
+              collect=lambda: {(hall_id,): c.actor.depth() for hall_id, c in list(controllers.items())
+                               if getattr(c, 'actor', None) is not None})
+metrics.gauge('barco_audit_queue', 'Записи журнала действий, ожидающие записи на диск',
+              collect=lambda: {(): audit_log.pending()})
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    if not METRICS_PUBLIC and 'admin_name' not in session:
+        return jsonify({'success': False, 'message': 'Не авторизован'}), 401
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/api/connections')
+def connections_status():
+    """Состояние ICMP-соединений залов и счётчики переподключений."""
     if 'admin_name' not in session:
         return jsonify({'success': False, 'message': 'Не авторизован'}), 401
-    return jsonify({'success': True, 'message': 'Отключено (логически)'})
+    return jsonify(icmp_manager.stats())
 
 @app.route('/api/<hall_id>/play', methods=['POST'])
 def api_play(hall_id):
@@ -660,36 +4569,567 @@ def api_stop(hall_id):
     return jsonify({'success': success, 'message': response})
 
 
+def _sequence_step_line(result):
+    """Строка журнала зала о завершённом шаге последовательности"""
+    line = f"{result['action']}: {result['message']} ({result['elapsed']:.2f}с"
+    if 'waited' in result:
+        line += f", ожидание состояния {result['waited']:.2f}с — {result['wait_outcome']}"
+    return line + ')'
+
+
+def run_hall_sequence(hall_id, name, admin_name, action, title):
+    """Последовательность зала с журналом: шаги — в лог зала по мере завершения"""
+    emit_log(hall_id, f'=== {title} ===', 'info')
+    success, steps, elapsed = sequences.run(
+        hall_id, name,
+        on_step=lambda r: emit_log(hall_id, _sequence_step_line(r), 'success' if r['success'] else 'error'))
+    log_action(admin_name, hall_id, action,
+               f'Результат: {"успешно" if success else "с ошибками"} ({elapsed:.2f}с)')
+    emit_log(hall_id, f'=== {title}: {"ГОТОВО" if success else "С ОШИБКАМИ"} ({elapsed:.2f}с) ===',
+             'success' if success else 'warning')
+    return success, steps, elapsed
+
+
 @app.route('/api/<hall_id>/shutdown-session', methods=['POST'])
 def shutdown_session(hall_id):
-    """Полное завершение сеанса"""
+    """Полное завершение сеанса: последовательность 'shutdown' зала (см. SequenceEngine)"""
     if 'admin_name' not in session:
         return jsonify({'success': False, 'message': 'Не авторизован'}), 401
-    
-    admin_name = session['admin_name']
     controller = controllers.get(hall_id)
-    if not controller:
+    if controller is None or sequences.get(hall_id, 'shutdown') is None:
         return jsonify({'success': False, 'message': 'Зал не найден'}), 404
-    
-    if not controller.connected:
-        return jsonify({'success': False, 'message': 'Не подключено'})
-    
-    emit_log(hall_id, '=== ЗАВЕРШЕНИЕ СЕАНСА ===', 'info')
-    
-    success, results = controller.shutdown_session()
-    
-    # Логирование действия
-    log_action(admin_name, hall_id, 'SHUTDOWN_SESSION',
-              f'Результат: {"успешно" if success else "с ошибками"}')
-    
-    for action, result, response in results:
-        level = 'success' if result else 'error'
-        emit_log(hall_id, f'{action}: {response}', level)
-    
-    emit_log(hall_id, '=== СЕАНС ЗАВЕРШЕН ===' if success else '=== ЗАВЕРШЕНО С ОШИБКАМИ ===',
-             'success' if success else 'warning')
-    
-    return jsonify({'success': success, 'message': 'Сеанс завершен' if success else 'Завершено с ошибками'})
+
+    success, steps, elapsed = run_hall_sequence(hall_id, 'shutdown', session['admin_name'],
+                                                'SHUTDOWN_SESSION', 'ЗАВЕРШЕНИЕ СЕАНСА')
+    return jsonify({'success': success, 'message': 'Сеанс завершен' if success else 'Завершено с ошибками',
+                    'elapsed': round(elapsed, 3), 'steps': steps})
+
+
+@app.route('/api/<hall_id>/sequence/<name>', methods=['POST'])
+def run_sequence(hall_id, name):
+    """Выполнить именованную последовательность зала из конфигурации"""
+    if 'admin_name' not in session:
+        return jsonify({'success': False, 'message': 'Не авторизован'}), 401
+    controller = controllers.get(hall_id)
+    if controller is None or sequences.get(hall_id, name) is None:
+        return jsonify({'success': False, 'message': 'Последовательность не найдена'}), 404
+
+    success, steps, elapsed = run_hall_sequence(hall_id, name, session['admin_name'],
+                                                f'SEQUENCE_{name.upper()}', f'ПОСЛЕДОВАТЕЛЬНОСТЬ {name}')
+    return jsonify({'success': success, 'elapsed': round(elapsed, 3), 'steps': steps})
+
+
+@app.route('/api/sequences')
+def list_sequences():
+    """Скомпилированные последовательности залов (шаги, уровни параллельности) и ошибки описания"""
+    if 'admin_name' not in session:
+        return jsonify({'success': False, 'message': 'Не авторизован'}), 401
+    return jsonify(sequences.describe())
+
+
+# Групповые операции: имя -> (действие для лога, требуется ICMP-подключение, вызов)
+BULK_OPERATIONS = {
+    'shutdown-session': ('SHUTDOWN_SESSION', False, None),  # последовательность 'shutdown'
+    'stop': ('STOP', False, lambda c: c.stop()),
+    'lamp-off': ('LAMP_OFF', False, lambda c: c.lamp_off()),
+    'lights-on': ('LIGHT_ON', True, lambda c: c.light_on()),
+}
+
+
+def _run_bulk_operation(hall_id, operation):
+    """Выполнение групповой операции для одного зала: (success, message, steps, elapsed)"""
+    _, needs_icmp, call = BULK_OPERATIONS[operation]
+    controller = controllers.get(hall_id)
+    if not controller:
+        return False, 'Зал не найден', [], 0.0
+    if needs_icmp and not controller.connected:
+        return False, 'Не подключено', [], 0.0
+
+    started = time.monotonic()
+    try:
+        if operation == 'shutdown-session':
+            success, steps, elapsed = sequences.run(hall_id, 'shutdown')
+            return success, 'Сеанс завершен' if success else 'Завершено с ошибками', steps, elapsed
+        success, response = call(controller)
+    except Exception as e:
+        return False, f'Ошибка: {e}', [], time.monotonic() - started
+    return success, response, [], time.monotonic() - started
+
+
+@app.route('/api/bulk', methods=['POST'])
+def bulk_operation():
+    """Групповая операция для нескольких залов параллельно.
+
+    Тело: {"operation": "shutdown-session" | "stop" | "lamp-off" | "lights-on",
+           "hall_ids": ["hall1", ...] или "all": true — все залы,
+           "concurrency": N (не больше BULK_CONCURRENCY)}
+    Результат по каждому залу отправляется в WebSocket-лог по мере готовности.
+    """
+    if 'admin_name' not in session:
+        return jsonify({'success': False, 'message': 'Не авторизован'}), 401
+
+    admin_name = session['admin_name']
+    data = request.get_json(silent=True) or {}
+    operation = data.get('operation')
+    if operation not in BULK_OPERATIONS:
+        return jsonify({'success': False,
+                        'message': f'Неизвестная операция. Доступны: {", ".join(BULK_OPERATIONS)}'}), 400
+
+    # Все залы — только по явному "all": true, чтобы пустой или забытый hall_ids
+    # не превратился в операцию над всем кинотеатром
+    if data.get('all') is True:
+        hall_ids = list(controllers)
+    else:
+        hall_ids = data.get('hall_ids')
+        if not isinstance(hall_ids, list) or not hall_ids:
+            return jsonify({'success': False,
+                            'message': 'Укажите hall_ids (непустой список залов) или "all": true'}), 400
+    unknown = [h for h in hall_ids if not isinstance(h, str) or h not in controllers]
+    if unknown:
+        return jsonify({'success': False, 'message': f'Неизвестные залы: {", ".join(map(str, unknown))}'}), 400
+    hall_ids = list(dict.fromkeys(hall_ids))
+    try:
+        concurrency = int(data.get('concurrency', BULK_CONCURRENCY))
+    except (TypeError, ValueError):
+        concurrency = BULK_CONCURRENCY
+    concurrency = max(1, min(concurrency, BULK_CONCURRENCY, len(hall_ids) or 1))
+
+    action = BULK_OPERATIONS[operation][0]
+    started = time.monotonic()
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bulk') as pool:
+        futures = {pool.submit(_run_bulk_operation, hall_id, operation): hall_id for hall_id in hall_ids}
+        for future in as_completed(futures):
+            hall_id = futures[future]
+            success, message, steps, elapsed = future.result()
+            results[hall_id] = {
+                'success': success,
+                'message': message,
+                'steps': steps,
+                'elapsed': round(elapsed, 3),
+            }
+
+            log_action(admin_name, hall_id, action,
+                       f'Групповая операция: {"успешно" if success else "с ошибками"} ({message})')
+            for step in steps:
+                emit_log(hall_id, f"{step['action']}: {step['message']}",
+                         'success' if step['success'] else 'error')
+            emit_log(hall_id, f'Групповая операция {operation}: {message}', 'success' if success else 'error')
+
+    all_success = all(r['success'] for r in results.values())
+    return jsonify({
+        'success': all_success,
+        'operation': operation,
+        'elapsed': round(time.monotonic() - started, 3),
+        'results': results,
+    })
+
+
+class ShowScheduler:
+    """Автоматическое завершение сеансов по расписанию окончаний.
+
+    Один поток держит кучу (heapq) событий и спит до ближайшего из них или
+    до перечитывания расписания, так что простаивающий планировщик не
+    тратит CPU. Наступившее событие выполняется в пуле как групповая
+    операция для одного зала (BULK_OPERATIONS); одновременно — не больше
+    одного действия на зал. Опоздавшие события и окончания, за которыми
+    сразу начинается следующий сеанс, пропускаются. Всё пишется в журнал
+    от имени SCHEDULER_IDENTITY. При нескольких процессах работает только
+    тот, что захватил flock на lock_path.
+    """
+
+    TEARDOWN = ('shutdown-session', 'stop', 'lamp-off')
+
+    def __init__(self, path=SCHEDULE_PATH, tms_path=SCHEDULE_TMS_PATH, refresh=SCHEDULE_REFRESH,
+                 misfire_grace=SCHEDULE_MISFIRE_GRACE, overlap_gap=SCHEDULE_OVERLAP_GAP,
+                 lock_path=SCHEDULER_LOCK):
+        self.path = path
+        self.tms_path = tms_path
+        self.refresh = refresh
+        self.misfire_grace = misfire_grace
+        self.overlap_gap = overlap_gap
+        self.lock_path = lock_path
+        self.day_start = datetime.strptime(SCHEDULE_DAY_START, '%H:%M').time()
+        self._cond = threading.Condition()
+        self._heap = []          # (at, seq, event_id, generation)
+        self._events = {}        # event_id -> событие текущего расписания
+        self._fired = {}         # event_id -> at: уже обработанные (переживают перечитывание)
+        self._running = {}       # hall_id -> event_id выполняющегося действия
+        self._generation = 0
+        self._seq = itertools.count()
+        self._next_reload = 0.0
+        self._thread = None
+        self._lock_file = None
+        self._pool = ThreadPoolExecutor(max_workers=BULK_CONCURRENCY, thread_name_prefix='schedule')
+        self.source = None
+        self.loaded_at = None
+        self.error = None
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='show-scheduler', daemon=True)
+                self._thread.start()
+
+    def _claim(self):
+        """Стать единственным активным планировщиком среди процессов (неблокирующий flock)"""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        print(f"Планировщик сеансов активен (pid {os.getpid()})")
+        return True
+
+    def _run(self):
+        while not self._claim():
+            time.sleep(self.refresh)
+        while True:
+            if time.time() >= self._next_reload:
+                self.reload()
+            with self._cond:
+                now = time.time()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    _, _, event_id, generation = heapq.heappop(self._heap)
+                    if generation == self._generation:
+                        due.append(self._events[event_id])
+                if not due:
+                    wake = min(self._next_reload, self._heap[0][0] if self._heap else self._next_reload)
+                    # Не дольше минуты: перевод системных часов не сдвинет срабатывание надолго
+                    self._cond.wait(min(max(wake - now, 0.0), 60.0))
+                    continue
+            for event in due:
+                self._fire(event)
+
+    # ---- расписание ----
+
+    def reload(self):
+        """Перечитать расписание; возвращает (ok, сообщение)"""
+        self._next_reload = time.time() + self.refresh
+        try:
+            source, raw = self._load_raw()
+            events = self._parse(raw)
+        except Exception as e:
+            self.error = str(e)
+            print(f"Ошибка загрузки расписания: {e}")
+            return False, str(e)
+
+        now = time.time()
+        with self._cond:
+            self._generation += 1
+            previous = self._events
+            self._events = {}
+            self._heap = []
+            self._fired = {k: at for k, at in self._fired.items() if at > now - 2 * 86400}
+            for event in events:
+                if event['id'] in self._fired:
+                    # Уже обработано: остаётся прежнее состояние и результат
+                    self._events[event['id']] = previous.get(event['id'], event)
+                    continue
+                self._events[event['id']] = event
+                if event['at'] < now - self.misfire_grace:
+                    event['status'] = 'missed'
+                    event['message'] = 'Время окончания прошло до загрузки расписания'
+                    continue
+                heapq.heappush(self._heap, (event['at'], next(self._seq), event['id'], self._generation))
+            self.source = source
+            self.loaded_at = datetime.now().isoformat(timespec='seconds')
+            self.error = None
+            pending = sum(1 for e in self._events.values() if e['status'] == 'pending')
+            self._cond.notify()
+        return True, f'Событий: {len(events)}, ожидают: {pending}'
+
+    def _load_raw(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return f'file:{self.path}', json.load(f)
+        hosts = tms_hosts.active()
+        if len(hosts) == 1:
+            r = hosts[0].client.get(self.tms_path)
+            r.raise_for_status()
+            return f'tms:{self.tms_path}', r.json()
+
+        # Несколько TMS: расписания хостов сводятся в одно; при ошибке любого хоста
+        # остаётся прежнее расписание целиком, чтобы не потерять события его залов
+        merged = {'events': []}
+        for host, future in tms_hosts.gather(lambda h: h.client.get(self.tms_path), hosts, timeout=None):
+            r = future.result()
+            r.raise_for_status()
+            raw = r.json()
+            if isinstance(raw, dict):
+                merged.setdefault('date', raw.get('date'))
+                raw = raw.get('events') or raw.get('shows') or []
+            merged['events'].extend(raw)
+        return f"tms:{self.tms_path} (хостов TMS: {len(hosts)})", merged
+
+    def _business_day(self, raw):
+        if isinstance(raw, dict) and raw.get('date'):
+            return datetime.strptime(raw['date'], '%Y-%m-%d').date()
+        now = datetime.now()
+        return (now - timedelta(days=1)).date() if now.time() < self.day_start else now.date()
+
+    def _resolve(self, value, day):
+        """'HH:MM[:SS]' в сутках сеансов или ISO-дата и время -> unix-время"""
+        if 'T' in value or ' ' in value.strip():
+            return datetime.fromisoformat(value).timestamp()
+        t = datetime.strptime(value, '%H:%M:%S' if value.count(':') == 2 else '%H:%M').time()
+        moment = datetime.combine(day, t)
+        if t < self.day_start:
+            moment += timedelta(days=1)
+        return moment.timestamp()
+
+    def _parse(self, raw):
+        """События из расписания: {"date", "events"|"shows": [{"hall_id"|"tms_id", "end", "start", "action", "title"}]}"""
+        items = (raw.get('events') or raw.get('shows') or []) if isinstance(raw, dict) else raw
+        day = self._business_day(raw)
+        halls = load_halls_config()
+        hall_ids = {h['id'] for h in halls}
+        by_tms = {h.get('tms_id', h['id']): h['id'] for h in halls}
+
+        events = []
+        for item in items:
+            hall_id = item.get('hall_id') or by_tms.get(item.get('tms_id') or item.get('device_id'))
+            action = item.get('action', SCHEDULE_ACTION)
+            if hall_id not in hall_ids or not item.get('end'):
+                print(f"Расписание: пропущена запись без зала или времени окончания: {item}")
+                continue
+            if action not in BULK_OPERATIONS:
+                print(f"Расписание: неизвестное действие {action} для {hall_id}")
+                continue
+            at = self._resolve(item['end'], day)
+            events.append({
+                'id': f"{hall_id}@{datetime.fromtimestamp(at).isoformat(timespec='minutes')}:{action}",
+                'hall_id': hall_id,
+                'title': item.get('title', ''),
+                'end': datetime.fromtimestamp(at).isoformat(timespec='seconds'),
+                'at': at,
+                'start_at': self._resolve(item['start'], day) if item.get('start') else None,
+                'action': action,
+                'status': 'pending',
+                'message': '',
+            })
+
+        # Окончание сеанса, за которым в том же зале сразу начинается (или уже идёт) другой
+        for event in events:
+            if event['action'] not in self.TEARDOWN:
+                continue
+            for other in events:
+                if (other is not event and other['hall_id'] == event['hall_id']
+                        and other['start_at'] is not None
+                        and other['start_at'] <= event['at'] + self.overlap_gap < other['at']):
+                    event['status'] = 'skipped'
+                    event['message'] = f"Следующий сеанс начинается в {datetime.fromtimestamp(other['start_at']):%H:%M}"
+                    break
+        return events
+
+    # ---- выполнение ----
+
+    def _fire(self, event):
+        hall_id = event['hall_id']
+        with self._cond:
+            self._fired[event['id']] = event['at']
+            late = time.time() - event['at']
+            if event['status'] == 'skipped':
+                pass  # перекрытие со следующим сеансом найдено при загрузке; в журнал — в момент окончания
+            elif late > self.misfire_grace:
+                event['status'], event['message'] = 'missed', f'Опоздание {late:.0f} с'
+            elif hall_id in self._running:
+                event['status'], event['message'] = 'skipped', 'Предыдущее действие зала ещё выполняется'
+            else:
+                event['status'] = 'running'
+                self._running[hall_id] = event['id']
+        if event['status'] != 'running':
+            metric_scheduled.inc(hall=hall_id, action=event['action'], outcome=event['status'])
+            log_action(SCHEDULER_IDENTITY, hall_id, 'SCHEDULE_SKIP', f"{event['end']}: {event['message']}")
+            emit_log(hall_id, f"Планировщик: {event['action']} пропущено ({event['message']})", 'warning')
+            return
+        self._pool.submit(self._execute, event)
+
+    def _execute(self, event):
+        hall_id = event['hall_id']
+        action = BULK_OPERATIONS[event['action']][0]
+        emit_log(hall_id, f"=== ПЛАНИРОВЩИК: окончание {event['title'] or 'сеанса'} ({event['end'][11:16]}) ===", 'info')
+        try:
+            success, message, steps, elapsed = _run_bulk_operation(hall_id, event['action'])
+        except Exception as e:
+            success, message, steps, elapsed = False, f'Ошибка: {e}', [], 0.0
+        finally:
+            with self._cond:
+                self._running.pop(hall_id, None)
+
+        log_action(SCHEDULER_IDENTITY, hall_id, action,
+                   f"По расписанию ({event['end']}): {'успешно' if success else 'с ошибками'} ({message})")
+        for step in steps:
+            emit_log(hall_id, f"{step['action']}: {step['message']}", 'success' if step['success'] else 'error')
+        emit_log(hall_id, f'Планировщик: {message}', 'success' if success else 'error')
+        metric_scheduled.inc(hall=hall_id, action=event['action'], outcome='done' if success else 'failed')
+        with self._cond:
+            event['status'] = 'done' if success else 'failed'
+            event['message'] = message
+            event['elapsed'] = round(elapsed, 3)
+
+    def snapshot(self):
+        with self._cond:
+            events = sorted(self._events.values(), key=lambda e: e['at'])
+            pending = next((e for e in events if e['status'] == 'pending'), None)
+            return {
+                'enabled': self._thread is not None,
+                'active': self._lock_file is not None,
+                'source': self.source,
+                'loaded_at': self.loaded_at,
+                'error': self.error,
+                'next': pending['id'] if pending else None,
+                'events': [{k: v for k, v in e.items() if k not in ('at', 'start_at')} for e in events],
+            }
+
+
+# Планировщик сеансов; запускается в __main__ / post_worker_init при SCHEDULER_ENABLED
+show_scheduler = ShowScheduler()
+
+
+@app.route('/api/schedule')
+def schedule_view():
+    """Расписание окончаний сеансов и состояние событий планировщика"""
+    if 'admin_name' not in session:
+        return jsonify({'success': False, 'message': 'Не авторизован'}), 401
+    return jsonify(show_scheduler.snapshot())
+
+
+@app.route('/api/schedule/reload', methods=['POST'])
+def schedule_reload():
+    """Перечитать расписание немедленно"""
+    if 'admin_name' not in session:
+        return jsonify({'success': False, 'message': 'Не авторизован'}), 401
+    success, message = show_scheduler.reload()
+    log_action(session['admin_name'], '-', 'SCHEDULE_RELOAD', message)
+    return jsonify({'success': success, 'message': message, 'schedule': show_scheduler.snapshot()})
+
+
+# ============ Прогрев при запуске ============
+
+# Прогрев: хосты TMS и ICMP-соединения залов (при ICMP_AUTOCONNECT) открываются
+# параллельно, не больше WARMUP_PARALLELISM одновременно, до первой команды оператора
+WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', '1') == '1'
+WARMUP_PARALLELISM = int(os.environ.get('WARMUP_PARALLELISM', '8'))
+
+
+class StartupWarmup:
+    """Прогрев всех залов сразу после запуска, чтобы холодный старт не доставался
+    первой команде оператора.
+
+    Для каждого хоста TMS запрашивается снимок статуса: DNS, TCP, соединение
+    в пуле и заполненный кеш статуса. Для каждого зала без ICMP-соединения оно
+    открывается с включением ACK; открытое (в том числе супервизором) не трогается. Задачи выполняются в пуле из parallelism потоков; время
+    каждой — в отчёте (GET /api/warmup).
+    """
+
+    def __init__(self, parallelism=WARMUP_PARALLELISM):
+        self.parallelism = parallelism
+        self._lock = threading.Lock()
+        self.report = None
+
+    def run(self, connect_icmp=ICMP_AUTOCONNECT):
+        with self._lock:
+            started = time.monotonic()
+            halls = load_halls_config()
+            hosts = tms_hosts.active()
+            with ThreadPoolExecutor(max_workers=max(1, self.parallelism), thread_name_prefix='warmup') as pool:
+                host_futures = {host.base_url: pool.submit(self._warm_host, host) for host in hosts}
+                hall_futures = {hall['id']: pool.submit(self._warm_hall, hall, connect_icmp) for hall in halls}
+            host_results = {base: future.result() for base, future in host_futures.items()}
+            hall_results = {}
+            for hall in halls:
+                result = hall_results[hall['id']] = hall_futures[hall['id']].result()
+                host = host_results[tms_hosts.for_hall(hall).base_url]
+                result['tms_ms'] = host['elapsed_ms']
+                result['tms_device'] = hall.get('tms_id', hall['id']) in host['device_ids']
+                print(f"Прогрев {hall['id']}: ICMP {result['icmp']} за {result['icmp_ms']} мс, "
+                      f"TMS {'готов' if host['ok'] else 'недоступен'} за {host['elapsed_ms']} мс")
+            for host in host_results.values():
+                host.pop('device_ids')
+
+            elapsed = round(time.monotonic() - started, 3)
+            print(f"Прогрев завершён за {elapsed} с: залов {len(halls)}, хостов TMS {len(hosts)}")
+            self.report = {
+                'finished_at': datetime.now().isoformat(timespec='seconds'),
+                'elapsed': elapsed,
+                'parallelism': self.parallelism,
+                'hosts': host_results,
+                'halls': hall_results,
+            }
+            return self.report
+
+    @staticmethod
+    def _warm_host(host):
+        started = time.monotonic()
+        snapshot = host.status_cache.get(0)
+        data = snapshot.data if isinstance(snapshot.data, dict) else {}
+        result = {
+            'ok': snapshot.ok,
+            'status': snapshot.status_code,
+            'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+            'device_ids': {d.get('id') for d in data.get('devices') or []} if snapshot.ok else set(),
+        }
+        if not snapshot.ok:
+            result['error'] = data.get('error') or f"HTTP {snapshot.status_code}"
+        return result
+
+    @staticmethod
+    def _warm_hall(hall, connect_icmp):
+        started = time.monotonic()
+        controller = controllers.get(hall['id'])
+        result = {'ok': True, 'icmp': 'skipped'}
+        if controller is None:
+            result.update(ok=False, error='Зал не найден')
+        elif controller.connected:
+            result['icmp'] = 'connected'
+        elif connect_icmp:
+            # Соединение мог открыть супервизор (или открывает прямо сейчас, держа блокировку):
+            # его не переподключаем
+            success, message = controller.connect(if_disconnected=True)
+            result.update(ok=success, icmp='connected' if success else 'failed', ack=controller.ack_enabled)
+            if not success:
+                result['error'] = message
+        result['icmp_ms'] = round((time.monotonic() - started) * 1000, 1)
+        return result
+
+
+warmup = StartupWarmup()
+
+
+def startup():
+    """Запуск сервера (__main__, хук gunicorn): инициализация, прогрев залов,
+    ICMP-супервизоры и планировщик сеансов"""
+    init_app()
+    if WARMUP_ENABLED:
+        warmup.run()
+    if ICMP_AUTOCONNECT:
+        icmp_manager.start()
+    if SCHEDULER_ENABLED:
+        show_scheduler.start()
+
+
+@app.route('/api/warmup')
+def warmup_status():
+    """Отчёт последнего прогрева: время по хостам TMS и залам"""
+    if 'admin_name' not in session:
+        return jsonify({'success': False, 'message': 'Не авторизован'}), 401
+    return jsonify(warmup.report or {'message': 'Прогрев не выполнялся'})
+
+
+@app.route('/api/warmup', methods=['POST'])
+def warmup_run():
+    """Повторить прогрев (например, после замены оборудования зала)"""
+    if 'admin_name' not in session:
+        return jsonify({'success': False, 'message': 'Не авторизован'}), 401
+    report = warmup.run()
+    log_action(session['admin_name'], '-', 'WARMUP', f"{report['elapsed']} с")
+    return jsonify(report)
 
 
 @app.route('/api/<hall_id>/light/<action>', methods=['POST'])
@@ -740,16 +5180,24 @@ def set_volume(hall_id):
     if level < 0 or level > 5.5:
         return jsonify({'success': False, 'message': 'Уровень должен быть от 0 до 5.5'})
     
-    success, response = controller.set_volume(level)
-    log_action(admin_name, hall_id, 'VOLUME', f'Уровень: {level}')
-    emit_log(hall_id, f'Громкость {level}: {response}', 'success' if success else 'error')
+    def send(value, merged):
+        success, response = controller.set_volume(value)
+        details = f'Уровень: {value}'
+        if merged > 1:
+            details += f' (объединено запросов: {merged})'
+        log_action(admin_name, hall_id, 'VOLUME', details)
+        emit_log(hall_id, f'Громкость {value}: {response}', 'success' if success else 'error')
+        return success, response
     
-    return jsonify({'success': success, 'message': response, 'level': level})
+    # Серия изменений громкости объединяется: в зал уходит только последнее значение
+    level, (success, response), superseded = volume_coalescer.submit(('icmp', hall_id), level, send)
+    return jsonify({'success': success, 'message': response, 'level': level, 'superseded': superseded})
 
 
 @socketio.on('connect')
 def handle_connect():
     """Обработка подключения WebSocket"""
+    metric_socketio_clients.inc()
     emit('connected', {'message': 'WebSocket подключен'})
     print('WebSocket клиент подключен')
 
@@ -757,20 +5205,58 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     """Обработка отключения WebSocket"""
+    metric_socketio_clients.inc(-1)
+    hall_status.leave(request.sid)
     print('WebSocket клиент отключен')
 
 
+@socketio.on('join_hall')
+def handle_join_hall(data):
+    """Подписка клиента на статус и журнал выбранного зала.
+
+    Клиент получает полный статус, затем дельты; журнал — записи после
+    log_since (или весь backlog зала), затем новые пачки 'log_batch'.
+    """
+    data = data or {}
+    hall_id = data.get('hall_id')
+    if not hall_id:
+        return
+    emit('status_full', hall_status.join(request.sid, hall_id))
+    emit('log_batch', log_broadcaster.catch_up(hall_id, data.get('log_since'), data.get('log_epoch')))
+
+
+@socketio.on('join_all_halls')
+def handle_join_all_halls(data=None):
+    """Подписка на журнал всех залов (консоль дежурного)"""
+    data = data or {}
+    join_room(LogBroadcaster.ALL_ROOM)
+    emit('log_batch', log_broadcaster.catch_up(None, data.get('log_since'), data.get('log_epoch')))
+
+
+@socketio.on('leave_all_halls')
+def handle_leave_all_halls(data=None):
+    """Отписка от журнала всех залов"""
+    leave_room(LogBroadcaster.ALL_ROOM)
+
+
+@socketio.on('leave_hall')
+def handle_leave_hall(data=None):
+    """Отписка клиента от статуса зала"""
+    hall_status.leave(request.sid)
+
+
 if __name__ == '__main__':
     print("=" * 50)
     print("Barco ICMP Multi-Hall Control - Запуск сервера")
     print("=" * 50)
+    startup()
     print(f"Загружено залов: {len(controllers)}")
     for hall_id, controller in controllers.items():
         print(f"  - {hall_id}: {controller.host}:{controller.port}")
     print()
     print("Сервер запущен на:")
-    print("  http://127.0.0.1:5059")
-    print("  http://0.0.0.0:5059")
+    print(f"  http://127.0.0.1:{PORT}")
+    print(f"  http://0.0.0.0:{PORT}")
     print("=" * 50)
     
-    socketio.run(app, host='0.0.0.0', port=5059, debug=False)
+    socketio.run(app, host='0.0.0.0', port=PORT, debug=False)
@@ -0,0 +1,52 @@
+"""
+Конфигурация gunicorn для продакшен-запуска:
+
+    gunicorn -c gunicorn.conf.py barco_multi_hall:app
+
+Всегда один воркер eventlet: контроллеры залов, ICMP-соединения, очереди
+команд, планировщик и журнал действий живут в одном процессе. Каждый
+воркер gunicorn открыл бы свои соединения с проекторами (проектор обычно
+принимает одно) и держал бы свои очереди команд, поэтому GUNICORN_WORKERS
+больше 1 не применяется. Один воркер eventlet обслуживает сотни клиентов.
+"""
+
+import os
+
+# Класс воркера: eventlet (по умолчанию) или gevent (нужен gevent-websocket)
+WORKER_CLASSES = {
+    'eventlet': 'eventlet',
+    'gevent': 'geventwebsocket.gunicorn.workers.GeventWebSocketWorker',
+}
+_worker = os.environ.get('GUNICORN_WORKER_CLASS', 'eventlet')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5059')}"
+worker_class = WORKER_CLASSES[_worker]
+workers = 1
+if int(os.environ.get('GUNICORN_WORKERS', '1')) != 1:
+    print("GUNICORN_WORKERS игнорируется: залы и ICMP-соединения обслуживает один воркер")
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+# SSE и WebSocket держат соединения часами: timeout здесь — только heartbeat воркера
+timeout = 120
+graceful_timeout = 10
+keepalive = 5
+accesslog = None
+errorlog = '-'
+
+# Режим Socket.IO должен совпадать с классом воркера
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', _worker)
+
+
+def post_worker_init(worker):
+    """Воркер после форка инициализирует залы, прогревает TMS и ICMP-соединения
+    и запускает их супервизоры и планировщик сеансов"""
+    import barco_multi_hall
+    barco_multi_hall.startup()
+
+
+def on_starting(server):
+    """-w/--workers в командной строке перекрывает workers выше: возвращаем один воркер"""
+    if server.num_workers != 1:
+        server.log.warning("Число воркеров %s игнорируется: залы обслуживает один воркер", server.num_workers)
+        server.cfg.set('workers', 1)
+        server.num_workers = 1
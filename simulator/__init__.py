@@ -0,0 +1,17 @@
+"""
+Симуляторы внешнего TMS и проекторов Barco ICMP для нагрузочного тестирования
+без реального оборудования.
+
+    python -m simulator --halls 6 --write-config sim_halls.json
+        запустить симуляторы и записать конфигурацию залов для приложения
+
+    python -m simulator.bench --halls 6 --clients 20 --duration 30
+        нагрузочный прогон barco_multi_hall.py против симуляторов
+"""
+
+from .state import Faults, SimulatedCinema
+from .tms import FakeTms
+from .icmp import FakeProjector
+from .site import SimulatedSite
+
+__all__ = ['Faults', 'SimulatedCinema', 'FakeTms', 'FakeProjector', 'SimulatedSite']
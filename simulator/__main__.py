@@ -0,0 +1,62 @@
+"""
+Запуск симуляторов TMS и ICMP как отдельного процесса.
+
+    python -m simulator --halls 6 --tms-port 8089 --icmp-base-port 43748 \
+        --write-config sim_halls.json
+    HALLS_CONFIG=sim_halls.json TMS_API_BASE=http://127.0.0.1:8089 python barco_multi_hall.py
+"""
+
+import argparse
+import time
+
+from .state import Faults
+from .site import SimulatedSite
+
+
+def add_fault_arguments(parser):
+    parser.add_argument('--tms-latency', type=float, default=0.02, help='задержка ответа TMS, сек')
+    parser.add_argument('--tms-jitter', type=float, default=0.01, help='случайная добавка к задержке TMS, сек')
+    parser.add_argument('--tms-failure-rate', type=float, default=0.0, help='доля ответов TMS с HTTP 503')
+    parser.add_argument('--icmp-latency', type=float, default=0.01, help='задержка ответа ICMP, сек')
+    parser.add_argument('--icmp-jitter', type=float, default=0.01, help='случайная добавка к задержке ICMP, сек')
+    parser.add_argument('--icmp-failure-rate', type=float, default=0.0, help='доля ответов NACK')
+    parser.add_argument('--icmp-drop-rate', type=float, default=0.0, help='доля команд с обрывом соединения')
+
+
+def site_from_args(args, tms_port=0, icmp_base_port=0):
+    return SimulatedSite(
+        halls=args.halls,
+        tms_port=tms_port,
+        icmp_base_port=icmp_base_port,
+        tms_faults=Faults(args.tms_latency, args.tms_jitter, args.tms_failure_rate),
+        icmp_faults=Faults(args.icmp_latency, args.icmp_jitter, args.icmp_failure_rate),
+        icmp_drop_rate=args.icmp_drop_rate,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Симуляторы TMS и Barco ICMP')
+    parser.add_argument('--halls', type=int, default=6, help='количество залов')
+    parser.add_argument('--tms-port', type=int, default=8089, help='порт симулятора TMS')
+    parser.add_argument('--icmp-base-port', type=int, default=43748,
+                        help='порт ICMP первого зала (зал i — base + i - 1)')
+    parser.add_argument('--write-config', metavar='PATH', help='записать конфигурацию залов для приложения')
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    site = site_from_args(args, args.tms_port, args.icmp_base_port).start()
+    print(f"TMS: {site.tms.base_url}")
+    for hall_id, projector in zip(site.hall_ids, site.projectors):
+        print(f"  {hall_id}: ICMP 127.0.0.1:{projector.port}")
+    if args.write_config:
+        site.write_config(args.write_config)
+        print(f"Конфигурация залов: {args.write_config}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        site.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""
+Нагрузочный прогон barco_multi_hall.py против симуляторов TMS и ICMP.
+
+Поднимает SimulatedSite на N залов, запускает приложение на свободном порту
+(конфигурация залов — через HALLS_CONFIG) и M симулированных браузеров:
+каждый логинится, подписывается на статус зала по Socket.IO и в цикле
+вызывает маршруты API, как это делает halls.js. В конце — p50/p99 и
+пропускная способность по каждому маршруту.
+
+    python -m simulator.bench --halls 6 --clients 20 --duration 30 --json run.json
+    python -m simulator.bench --halls 6 --clients 20 --baseline run.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from .__main__ import add_fault_arguments, site_from_args
+
+try:
+    import socketio as socketio_client  # python-socketio (клиент) — опционально
+except ImportError:
+    socketio_client = None
+
+
+# Маршруты, которые дёргает симулированный браузер, и их относительный вес
+SCENARIO = (
+    ('GET /api/status/live', 30),
+    ('GET /api/cp750/status/all', 15),
+    ('GET /api/halls', 5),
+    ('POST /api/cp750/<cp_id>/fader', 20),
+    ('POST /api/<hall_id>/volume', 10),
+    ('POST /api/<hall_id>/play', 5),
+    ('POST /api/<tms_id>/stop', 5),
+    ('POST /api/<tms_id>/projector/lamp/<action>', 3),
+    ('POST /api/<hall_id>/light/<action>', 5),
+    ('POST /api/cp750/<cp_id>/mute', 5),
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Замеры по маршрутам: длительности и ошибки"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def record(self, route, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def report(self, duration):
+        result = {}
+        with self._lock:
+            for route, values in sorted(self.samples.items()):
+                values = sorted(values)
+                result[route] = {
+                    'count': len(values),
+                    'errors': self.errors.get(route, 0),
+                    'rps': round(len(values) / duration, 2),
+                    'p50_ms': round(percentile(values, 0.5) * 1000, 2),
+                    'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+                    'max_ms': round(values[-1] * 1000, 2),
+                }
+        return result
+
+
+class BrowserClient:
+    """Один симулированный браузер: сессия HTTP + (по возможности) Socket.IO"""
+
+    def __init__(self, index, base_url, halls, recorder, use_socketio=True):
+        self.index = index
+        self.base_url = base_url
+        self.halls = halls
+        self.recorder = recorder
+        self.http = requests.Session()
+        self.hall = random.choice(halls)
+        self.etag = None
+        self.sio = None
+        self.push_events = 0
+        self.use_socketio = use_socketio and socketio_client is not None
+
+    def start(self):
+        started = time.perf_counter()
+        r = self.http.post(f'{self.base_url}/login', json={'admin_name': f'bench{self.index}'})
+        self.recorder.record('POST /login', time.perf_counter() - started, r.ok)
+        if self.use_socketio:
+            self.sio = socketio_client.Client(reconnection=False)
+            self.sio.on('status_full', self._on_push)
+            self.sio.on('status_delta', self._on_push)
+            started = time.perf_counter()
+            try:
+                self.sio.connect(self.base_url, transports=['polling'])
+                self.sio.emit('join_hall', {'hall_id': self.hall['id']})
+                ok = True
+            except Exception:
+                self.sio = None
+                ok = False
+            self.recorder.record('SOCKETIO connect', time.perf_counter() - started, ok)
+
+    def _on_push(self, data):
+        self.push_events += 1
+
+    def stop(self):
+        if self.sio is not None:
+            try:
+                self.sio.disconnect()
+            except Exception:
+                pass
+
+    def step(self):
+        routes, weights = zip(*SCENARIO)
+        route = random.choices(routes, weights)[0]
+        hall = random.choice(self.halls) if random.random() < 0.2 else self.hall
+        method, template = route.split(' ', 1)
+        path = (template.replace('<hall_id>', hall['id'])
+                        .replace('<tms_id>', hall['tms_id'])
+                        .replace('<cp_id>', hall['cp750_id'])
+                        .replace('<action>', random.choice(('on', 'off'))))
+        body = None
+        headers = {}
+        if template.endswith('/fader'):
+            body = {'value': random.randint(35, 60), 'force': False}
+        elif template.endswith('/volume'):
+            body = {'level': round(random.uniform(3.5, 5.0), 1)}
+        elif template.endswith('/mute'):
+            body = {'mute': random.random() < 0.5}
+        elif template == '/api/status/live' and self.etag:
+            headers['If-None-Match'] = self.etag
+
+        started = time.perf_counter()
+        try:
+            r = self.http.request(method, self.base_url + path, json=body, headers=headers, timeout=30)
+            ok = r.status_code < 400
+            if template == '/api/status/live' and r.status_code == 200:
+                self.etag = r.headers.get('ETag')
+        except requests.RequestException:
+            ok = False
+        self.recorder.record(route, time.perf_counter() - started, ok)
+
+
+def run(args):
+    site = site_from_args(args).start()
+    workdir = tempfile.mkdtemp(prefix='barco-bench-')
+    config_path = site.write_config(os.path.join(workdir, 'halls_config.json'))
+    port = free_port()
+
+    os.environ.update({
+        'HALLS_CONFIG': config_path,
+        'TMS_API_BASE': site.tms.base_url,
+        'AUDIT_LOG_DIR': os.path.join(workdir, 'logs'),
+        'CONTROLLER_ENGINE': args.engine,
+        'ICMP_AUTOCONNECT': '1',
+    })
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import barco_multi_hall as app_module
+
+    app_module.startup()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    threading.Thread(
+        target=lambda: app_module.socketio.run(app_module.app, host='127.0.0.1', port=port,
+                                               debug=False, allow_unsafe_werkzeug=True, log_output=False),
+        name='bench-app', daemon=True).start()
+    base_url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            requests.get(f'{base_url}/api/halls', timeout=1)
+            break
+        except requests.RequestException:
+            time.sleep(0.1)
+
+    halls = site.halls_config()['halls']
+    recorder = Recorder()
+    clients = [BrowserClient(i, base_url, halls, recorder, not args.no_socketio) for i in range(args.clients)]
+    for client in clients:
+        client.start()
+
+    stop_at = time.monotonic() + args.duration
+
+    def drive(client):
+        while time.monotonic() < stop_at:
+            client.step()
+            if args.think_time:
+                time.sleep(random.uniform(0, args.think_time * 2))
+
+    threads = [threading.Thread(target=drive, args=(c,), daemon=True) for c in clients]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    push_events = sum(c.push_events for c in clients)
+    for client in clients:
+        client.stop()
+
+    report = {
+        'config': {
+            'halls': args.halls, 'clients': args.clients, 'duration': round(elapsed, 2),
+            'engine': args.engine, 'socketio': not args.no_socketio and socketio_client is not None,
+        },
+        'routes': recorder.report(elapsed),
+        'total_rps': round(sum(len(v) for v in recorder.samples.values()) / elapsed, 2),
+        'push_events_per_sec': round(push_events / elapsed, 2),
+        'upstream': {'tms_requests': site.tms.requests,
+                     'icmp_commands': sum(p.commands for p in site.projectors)},
+    }
+    site.stop()
+    return report
+
+
+def print_report(report, baseline=None):
+    cfg = report['config']
+    print(f"\nЗалов: {cfg['halls']}, клиентов: {cfg['clients']}, {cfg['duration']} с, "
+          f"движок: {cfg['engine']}, Socket.IO: {'да' if cfg['socketio'] else 'нет'}")
+    header = f"{'Маршрут':42} {'запросов':>9} {'ошибок':>7} {'rps':>8} {'p50 мс':>9} {'p99 мс':>9}"
+    print(header)
+    print('-' * len(header))
+    base_routes = (baseline or {}).get('routes', {})
+    for route, row in report['routes'].items():
+        line = (f"{route:42} {row['count']:9} {row['errors']:7} {row['rps']:8} "
+                f"{row['p50_ms']:9} {row['p99_ms']:9}")
+        base = base_routes.get(route)
+        if base and base['p99_ms']:
+            line += f"   p99 {100 * (row['p99_ms'] - base['p99_ms']) / base['p99_ms']:+.0f}%"
+        print(line)
+    print(f"\nВсего: {report['total_rps']} запросов/с, push-событий статуса: {report['push_events_per_sec']}/с")
+    print(f"Апстрим: TMS {report['upstream']['tms_requests']} запросов, "
+          f"ICMP {report['upstream']['icmp_commands']} команд")
+    if baseline:
+        print(f"Базовый прогон: {baseline['total_rps']} запросов/с "
+              f"({100 * (report['total_rps'] - baseline['total_rps']) / baseline['total_rps']:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон barco_multi_hall.py на симуляторах')
+    parser.add_argument('--halls', type=int, default=6, help='количество залов (N)')
+    parser.add_argument('--clients', type=int, default=10, help='симулированных браузеров (M)')
+    parser.add_argument('--duration', type=float, default=20, help='длительность прогона, сек')
+    parser.add_argument('--think-time', type=float, default=0.05, help='средняя пауза клиента между запросами, сек')
+    parser.add_argument('--engine', choices=('thread', 'async'), default='thread', help='CONTROLLER_ENGINE')
+    parser.add_argument('--no-socketio', action='store_true', help='без подписки на статус по Socket.IO')
+    parser.add_argument('--json', metavar='PATH', help='сохранить результат в JSON (для сравнения)')
+    parser.add_argument('--baseline', metavar='PATH', help='сравнить с сохранённым прогоном')
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    report = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Симулятор проектора Barco ICMP: TCP, команды и ответы разделены ';'.
+"""
+
+import random
+import re
+import socket
+import threading
+
+from .state import Faults
+
+
+class FakeProjector:
+    """TCP-сервер одного зала, отвечающий ACK / NACK на команды ICMP.
+
+    Команды плеера и лампы меняют состояние зала в SimulatedCinema.
+    Перед ответом выдерживается faults.delay(); с вероятностью
+    faults.failure_rate отвечает NACK,2, с вероятностью drop_rate
+    закрывает соединение без ответа (обрыв связи).
+    """
+
+    COMMANDS = {
+        'PLAYER.Play': {'state': 'Play'},
+        'PLAYER.Pause': {'state': 'Pause'},
+        'PLAYER.Stop': {'state': 'Stop'},
+        'PLAYER.Clear': {'state': 'Stop'},
+        'PROJECTOR.Turn Lamp On': {'lamp': 'On'},
+        'PROJECTOR.Turn Lamp Off': {'lamp': 'Off'},
+    }
+
+    def __init__(self, cinema, device_id, host='127.0.0.1', port=0, faults=None, drop_rate=0.0):
+        self.cinema = cinema
+        self.device_id = device_id
+        self.faults = faults or Faults()
+        self.drop_rate = drop_rate
+        self.commands = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(16)
+        self._closed = False
+
+    @property
+    def port(self):
+        return self._sock.getsockname()[1]
+
+    def start(self):
+        threading.Thread(target=self._accept_loop, name=f'fake-icmp-{self.device_id}', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._closed = True
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+
+    def reply(self, command):
+        """Ответ на одну команду (без ';'); None — оборвать соединение"""
+        name = command.split(',', 1)[0].strip()
+        if name == 'ACK':
+            return 'ACK'
+        if self.drop_rate and random.random() < self.drop_rate:
+            return None
+        if self.faults.should_fail():
+            return 'NACK,2'
+        if name in self.COMMANDS:
+            self.cinema.update(self.device_id, **self.COMMANDS[name])
+            return 'ACK'
+        if name == 'tm8710.Send Text':
+            m = re.search(r'fader (\d+)', command)
+            if m:
+                self.cinema.update(self.device_id, volume=int(m.group(1)) / 10)
+            return 'ACK'
+        if name.startswith('EKOS.') or name.startswith('PROJECTOR.') or name.startswith('PLAYER.'):
+            return 'ACK'
+        return 'NACK,1'
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        buffer = b''
+        with conn:
+            while True:
+                try:
+                    chunk = conn.recv(4096)
+                except OSError:
+                    return
+                if not chunk:
+                    return
+                buffer += chunk
+                while b';' in buffer:
+                    raw, buffer = buffer.split(b';', 1)
+                    command = raw.decode('ascii', errors='replace').strip()
+                    if not command:
+                        continue
+                    self.commands += 1
+                    self.faults.delay()
+                    answer = self.reply(command)
+                    if answer is None:
+                        return
+                    try:
+                        conn.sendall(answer.encode('ascii') + b';')
+                    except OSError:
+                        return
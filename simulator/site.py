@@ -0,0 +1,62 @@
+"""
+Симулируемый кинотеатр целиком: один TMS и по проектору ICMP на каждый зал.
+"""
+
+import json
+
+from .icmp import FakeProjector
+from .state import Faults, SimulatedCinema
+from .tms import FakeTms
+
+
+class SimulatedSite:
+    """N залов на localhost: FakeTms + FakeProjector на зал, общая конфигурация залов.
+
+    icmp_base_port=0 — свободные порты; иначе зал i слушает icmp_base_port + i - 1.
+    """
+
+    def __init__(self, halls=6, host='127.0.0.1', tms_port=0, icmp_base_port=0,
+                 tms_faults=None, icmp_faults=None, icmp_drop_rate=0.0, stream_interval=1.0):
+        self.host = host
+        self.hall_ids = [f'hall{i}' for i in range(1, halls + 1)]
+        self.tms_ids = [f'Zal{i}' for i in range(1, halls + 1)]
+        self.cinema = SimulatedCinema(self.tms_ids)
+        self.tms = FakeTms(self.cinema, host, tms_port, tms_faults or Faults(), stream_interval)
+        self.projectors = [
+            FakeProjector(self.cinema, tms_id, host,
+                          icmp_base_port + i if icmp_base_port else 0,
+                          icmp_faults or Faults(), icmp_drop_rate)
+            for i, tms_id in enumerate(self.tms_ids)
+        ]
+
+    def start(self):
+        self.tms.start()
+        for projector in self.projectors:
+            projector.start()
+        return self
+
+    def stop(self):
+        self.tms.stop()
+        for projector in self.projectors:
+            projector.stop()
+
+    def halls_config(self):
+        """Конфигурация залов в формате halls_config.json, указывающая на симуляторы"""
+        return {'halls': [
+            {
+                'id': hall_id,
+                'name': f'Зал {i}',
+                'ip': self.host,
+                'port': projector.port,
+                'tms_id': tms_id,
+                'protocol': 'barco',
+                'cp750_id': f'{tms_id}_cp750',
+            }
+            for i, (hall_id, tms_id, projector) in enumerate(
+                zip(self.hall_ids, self.tms_ids, self.projectors), 1)
+        ]}
+
+    def write_config(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.halls_config(), f, ensure_ascii=False, indent=2)
+        return path
@@ -0,0 +1,126 @@
+"""
+Общее состояние симулируемого кинотеатра: плееры, проекторы и CP750 всех залов.
+Симуляторы TMS и ICMP работают с одним и тем же состоянием, поэтому команда,
+отправленная по ICMP, видна в /api/status/live симулятора TMS.
+"""
+
+import random
+import threading
+import time
+
+
+class Faults:
+    """Задержка, разброс и доля отказов одного симулятора"""
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0):
+        self.latency = latency          # базовая задержка ответа, сек
+        self.jitter = jitter            # случайная добавка 0..jitter, сек
+        self.failure_rate = failure_rate  # доля ответов с ошибкой (0..1)
+
+    def delay(self):
+        pause = self.latency + random.uniform(0, self.jitter)
+        if pause > 0:
+            time.sleep(pause)
+
+    def should_fail(self):
+        return self.failure_rate > 0 and random.random() < self.failure_rate
+
+
+class SimulatedCinema:
+    """Состояние устройств залов, ключ — tms_id зала"""
+
+    def __init__(self, device_ids):
+        self._lock = threading.Lock()
+        self.devices = {}
+        for i, device_id in enumerate(device_ids, 1):
+            self.devices[device_id] = {
+                'id': device_id,
+                'name': f'Barco{i}',
+                'title': f'Simulated Show {i}',
+                'state': 'Play',
+                'started_at': time.time() - random.uniform(0, 3600),
+                'durationMs': 7200000,
+                'lamp': 'On',
+                'dowser': 'Open',
+                'volume': 4.0,
+                'cp750': {
+                    'level': 50,
+                    'mute': False,
+                    'input_mode': 'dig_1',
+                    'format': '71',
+                },
+            }
+
+    def cp750_device(self, cp_id):
+        """tms_id зала по идентификатору CP750 вида '<tms_id>_cp750'"""
+        device_id = cp_id[:-len('_cp750')] if cp_id.endswith('_cp750') else cp_id
+        return device_id if device_id in self.devices else None
+
+    def update(self, device_id, **changes):
+        with self._lock:
+            device = self.devices.get(device_id)
+            if device is None:
+                return False
+            if changes.get('state') == 'Play' and device['state'] != 'Play':
+                device['started_at'] = time.time()
+            device.update(changes)
+            device['updatedAt'] = time.time()
+            return True
+
+    def update_cp750(self, device_id, **changes):
+        with self._lock:
+            device = self.devices.get(device_id)
+            if device is None:
+                return False
+            device['cp750'].update(changes)
+            return True
+
+    def status_live(self):
+        """Снимок в формате /api/status/live"""
+        now = time.time()
+        with self._lock:
+            devices = []
+            for device in self.devices.values():
+                position = 0
+                if device['state'] == 'Play':
+                    position = int((now - device['started_at']) * 1000) % device['durationMs']
+                devices.append({
+                    'id': device['id'],
+                    'name': device['name'],
+                    'title': device['title'],
+                    'state': device['state'],
+                    'positionMs': position,
+                    'durationMs': device['durationMs'],
+                    'lamp': device['lamp'],
+                    'dowser': device['dowser'],
+                    'updatedAt': device.get('updatedAt', now),
+                })
+        return {'ok': True, 'ts': now, 'devices': devices}
+
+    def cp750_status(self, device_id):
+        with self._lock:
+            cp = dict(self.devices[device_id]['cp750'])
+        return {
+            'level': cp['level'],
+            'mute': cp['mute'],
+            'format': cp['format'],
+            'input_mode': cp['input_mode'],
+            'cp750_id': f'{device_id}_cp750',
+        }
+
+    def cp750_status_all(self):
+        devices = []
+        for device_id in list(self.devices):
+            cp = self.cp750_status(device_id)
+            devices.append({
+                'id': cp['cp750_id'],
+                'status': {
+                    'cp750_id': cp['cp750_id'],
+                    'cp750.sys.fader': str(cp['level']),
+                    'cp750.sys.mute': '1' if cp['mute'] else '0',
+                    'cp750.sys.input_mode': cp['input_mode'],
+                    'cp750.state.bitstream_format': cp['format'],
+                    'cp750.state.sample_rate': '48000',
+                },
+            })
+        return {'ok': True, 'devices': devices}
@@ -0,0 +1,164 @@
+"""
+Симулятор внешнего TMS API: маршруты, которые вызывает barco_multi_hall.py.
+"""
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .state import Faults
+
+
+class FakeTms:
+    """HTTP-сервер, отвечающий как TMS, поверх общего SimulatedCinema.
+
+    Каждый ответ задерживается на faults.delay(); с вероятностью
+    faults.failure_rate команда или статус возвращает HTTP 503.
+    /api/status/stream отдаёт снимок статуса раз в stream_interval секунд
+    (chunked, как настоящий TMS).
+    """
+
+    def __init__(self, cinema, host='127.0.0.1', port=0, faults=None, stream_interval=1.0):
+        self.cinema = cinema
+        self.faults = faults or Faults()
+        self.stream_interval = stream_interval
+        self.requests = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    @property
+    def base_url(self):
+        return f'http://{self.server.server_address[0]}:{self.port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-tms', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # ------------------------------------------------------------------
+
+    def handle(self, method, path, body):
+        """Разбор маршрута: (HTTP-код, JSON-ответ)"""
+        cinema = self.cinema
+
+        if method == 'GET':
+            if path == '/api/ping':
+                return 200, {'ok': True, 'ts': time.time()}
+            if path == '/api/status/live':
+                return 200, cinema.status_live()
+            if path == '/api/cp750/status/all':
+                return 200, cinema.cp750_status_all()
+            m = re.fullmatch(r'/api/cp750/([^/]+)/status', path)
+            if m:
+                device_id = cinema.cp750_device(m.group(1))
+                if device_id is None:
+                    return 404, {'ok': False, 'error': 'unknown cp750'}
+                return 200, cinema.cp750_status(device_id)
+            return 404, {'ok': False, 'error': 'not found'}
+
+        m = re.fullmatch(r'/api/cp750/([^/]+)/(fader|mute|input-mode)', path)
+        if m:
+            device_id = cinema.cp750_device(m.group(1))
+            if device_id is None:
+                return 404, {'ok': False, 'error': 'unknown cp750'}
+            action = m.group(2)
+            if action == 'fader':
+                cinema.update_cp750(device_id, level=int(body.get('value', 50)))
+            elif action == 'mute':
+                cinema.update_cp750(device_id, mute=bool(body.get('mute')))
+            else:
+                cinema.update_cp750(device_id, input_mode=body.get('mode', 'dig_1'))
+            return 200, {'ok': True}
+
+        m = re.fullmatch(r'/api/([^/]+)/(.+)', path)
+        if not m or m.group(1) not in cinema.devices:
+            return 404, {'ok': False, 'error': 'not found'}
+        device_id, action = m.groups()
+        changes = {
+            'play': {'state': 'Play'},
+            'pause': {'state': 'Pause'},
+            'stop': {'state': 'Stop'},
+            'projector/lamp/on': {'lamp': 'On'},
+            'projector/lamp/off': {'lamp': 'Off'},
+            'projector/dowser/open': {'dowser': 'Open'},
+            'projector/dowser/close': {'dowser': 'Closed'},
+        }.get(action)
+        if action == 'lamp':
+            changes = {'lamp': 'On' if body.get('on') else 'Off'}
+        elif action == 'dowser':
+            changes = {'dowser': 'Closed' if body.get('closed') else 'Open'}
+        elif action == 'activate-projector-macro':
+            changes = {'Lamp OFF': {'lamp': 'Off'}, 'Lamp ON': {'lamp': 'On'}}.get(body.get('name'), {})
+        if changes is None:
+            return 404, {'ok': False, 'error': 'not found'}
+        cinema.update(device_id, **changes)
+        return 200, {'ok': True}
+
+    def _handler_class(self):
+        sim = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, code, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _dispatch(self, method):
+                sim.requests += 1
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    body = {}
+                path = self.path.split('?', 1)[0]
+                if method == 'GET' and path == '/api/status/stream':
+                    return self._stream()
+                sim.faults.delay()
+                if sim.faults.should_fail():
+                    return self._send_json(503, {'ok': False, 'error': 'simulated failure'})
+                code, payload = sim.handle(method, path, body if isinstance(body, dict) else {})
+                self._send_json(code, payload)
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                try:
+                    while True:
+                        event = f"data: {json.dumps(sim.cinema.status_live(), ensure_ascii=False)}\n\n"
+                        data = event.encode('utf-8')
+                        self.wfile.write(f'{len(data):X}\r\n'.encode() + data + b'\r\n')
+                        self.wfile.flush()
+                        time.sleep(sim.stream_interval)
+                except OSError:
+                    self.close_connection = True
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+        return Handler
@@ -1,12 +1,17 @@
-// WebSocket подключение
-const socket = io();
+// WebSocket подключение (транспорты задаёт сервер: при нескольких процессах — только websocket)
+const socket = io({ transports: window.SOCKETIO_TRANSPORTS || ['polling', 'websocket'] });
 
 let currentHallId = null;
+let logSince = null;
+let logEpoch = null;
 let hallsData = {};
 let sse = null;
 let pollTimer = null;
 let cp750PollTimer = null;
 let cp750Status = {};  // Хранение статуса CP750 для всех залов
+let liveEtag = null;   // ETag последнего полученного снимка /api/status/live
+let liveDevice = null;  // Статус устройства выбранного зала (из push-обновлений)
+let liveVersion = 0;    // Версия статуса зала для контроля пропущенных дельт
 
 // Инициализация при загрузке страницы
 document.addEventListener('DOMContentLoaded', function() {
@@ -18,13 +23,67 @@ socket.on('connected', function(data) {
     console.log('WebSocket connected:', data);
 });
 
-socket.on('log', function(data) {
-    // Показываем логи только для текущего зала
-    if (data.hall_id === currentHallId) {
-        addLog(data.message, data.level, data.timestamp);
+// При (пере)подключении WebSocket — подписка на статус зала вместо поллинга
+socket.on('connect', function() {
+    if (currentHallId) {
+        stopStatusFallback();
+        joinHallRoom();
     }
 });
 
+socket.on('disconnect', function() {
+    if (currentHallId) startStatusFallback();
+});
+
+// Полный статус зала (при входе в комнату или появлении/пропаже устройства)
+socket.on('status_full', function(data) {
+    if (data.hall_id !== currentHallId) return;
+    liveDevice = data.device;
+    liveVersion = data.version;
+    if (liveDevice) renderDevice(liveDevice);
+});
+
+// Только изменившиеся поля статуса зала
+socket.on('status_delta', function(data) {
+    if (data.hall_id !== currentHallId) return;
+    if (!liveDevice || data.version !== liveVersion + 1) {
+        joinHallRoom();  // пропущена дельта — запрашиваем полный статус
+        return;
+    }
+    mergeDelta(liveDevice, data.changed);
+    (data.removed || []).forEach(path => deletePath(liveDevice, path));
+    liveVersion = data.version;
+    renderDevice(liveDevice);
+});
+
+// Смена состояния circuit breaker TMS: команды идут напрямую по ICMP, пока цепь разомкнута
+socket.on('breaker_state', function(data) {
+    const hall = hallsData[currentHallId];
+    if (!hall || (data.name.indexOf('@') !== -1 && data.name.split('@')[0] !== hall.tms_id)) {
+        return;
+    }
+    if (data.state === 'open') {
+        addLog(`TMS недоступен (${data.name}), команды идут напрямую по ICMP`, 'error');
+    } else if (data.state === 'closed') {
+        addLog(`TMS снова доступен (${data.name})`, 'success');
+    }
+});
+
+// Журнал зала приходит пачками; seq последней показанной записи отправляется при
+// повторном входе в комнату, и сервер досылает только пропущенное
+socket.on('log_batch', function(batch) {
+    if (batch.hall_id !== currentHallId) return;
+    if (batch.epoch !== logEpoch) {
+        logEpoch = batch.epoch;
+        logSince = null;
+    }
+    batch.entries.forEach(entry => {
+        if (logSince !== null && entry.seq <= logSince) return;
+        addLog(entry.message, entry.level, entry.timestamp);
+        logSince = entry.seq;
+    });
+});
+
 // Загрузка данных залов
 async function loadHallsData() {
     try {
@@ -64,6 +123,8 @@ async function selectHall() {
     }
     
     currentHallId = hallId;
+    liveEtag = null;
+    logSince = null;
     const hall = hallsData[hallId];
     
     if (!hall) { 
@@ -97,10 +158,35 @@ function setControlsEnabled(enabled) {
     controls.forEach(c => c.disabled = !enabled);
 }
 
-// Запуск опроса статуса
+// Запуск получения статуса: push через комнату зала, SSE/поллинг — если WebSocket недоступен
 function startStatus() {
-    stopStatus();
-    // Подключаем SSE как основной канал
+    stopStatusFallback();
+    liveDevice = null;
+    liveVersion = 0;
+    if (socket.connected) {
+        joinHallRoom();
+    } else {
+        startStatusFallback();
+    }
+}
+
+// Остановка получения статуса
+function stopStatus() {
+    socket.emit('leave_hall');
+    stopStatusFallback();
+    stopCP750Status();
+}
+
+// Подписка на статус текущего зала
+function joinHallRoom() {
+    if (currentHallId) {
+        socket.emit('join_hall', { hall_id: currentHallId, log_since: logSince, log_epoch: logEpoch });
+    }
+}
+
+// Резервный канал статуса: SSE + поллинг live
+function startStatusFallback() {
+    stopStatusFallback();
     try {
         sse = new EventSource('/api/status/stream');
         sse.onmessage = (evt) => {
@@ -118,18 +204,40 @@ function startStatus() {
     fetchLive();
 }
 
-// Остановка опроса статуса
-function stopStatus() {
+function stopStatusFallback() {
     if (pollTimer) { clearInterval(pollTimer); pollTimer = null; }
     if (sse) { try { sse.close(); } catch(_) {}; sse = null; }
-    stopCP750Status();
+}
+
+// Рекурсивное применение дельты к статусу
+function mergeDelta(target, changed) {
+    Object.entries(changed || {}).forEach(([key, value]) => {
+        if (value && typeof value === 'object' && !Array.isArray(value) &&
+            target[key] && typeof target[key] === 'object' && !Array.isArray(target[key])) {
+            mergeDelta(target[key], value);
+        } else {
+            target[key] = value;
+        }
+    });
+}
+
+// Удаление поля по пути ['status', 'Lamp']
+function deletePath(target, path) {
+    let obj = target;
+    for (let i = 0; i < path.length - 1; i++) {
+        obj = obj?.[path[i]];
+        if (!obj || typeof obj !== 'object') return;
+    }
+    delete obj[path[path.length - 1]];
 }
 
 // Запрос статуса через поллинг
 async function fetchLive() {
     try {
-        const r = await fetch('/api/status/live');
-        if (!r.ok) return;
+        const headers = liveEtag ? { 'If-None-Match': liveEtag } : {};
+        const r = await fetch('/api/status/live', { headers, cache: 'no-store' });
+        if (r.status === 304 || !r.ok) return;  // 304 — снимок не изменился
+        liveEtag = r.headers.get('ETag');
         const data = await r.json();
         applyStatus(data);
     } catch (_) {}
@@ -141,7 +249,11 @@ function applyStatus(data) {
     const hall = hallsData[currentHallId];
     const dev = data.devices.find(d => d.id === hall.tms_id || d.name === hall.name);
     if (!dev) return;
+    renderDevice(dev);
+}
 
+// Отображение статуса устройства зала
+function renderDevice(dev) {
     const stateEl = document.getElementById('playback-state');
     const titleEl = document.getElementById('playback-title');
     const posEl = document.getElementById('playback-position');
@@ -192,143 +304,27 @@ function shutdownSession() {
     modal.style.display = 'flex';
 }
 
-// Подтверждение завершения сеанса
+// Подтверждение завершения сеанса: последовательность 'shutdown' выполняется на сервере
+// (шаги и их порядок — в halls_config.json), ход выполнения приходит в журнал зала
 async function confirmShutdown() {
     const modal = document.getElementById('confirm-modal');
     modal.style.display = 'none';
     
     if (!currentHallId) return;
     
-    const hall = hallsData[currentHallId];
-    const tmsId = hall.tms_id || currentHallId;
-    const cp750Id = hall.cp750_id;
-    
     const btn = document.getElementById('shutdown-btn');
     const originalText = btn.textContent;
     btn.disabled = true;
     btn.textContent = '⏳ Завершение...';
     
-    addLog('=== ЗАВЕРШЕНИЕ СЕАНСА ===', 'info');
-    
-    let hasErrors = false;
-    
-    // Вспомогательная функция для безопасного парсинга JSON
-    async function safeJsonParse(response) {
-        try {
-            const text = await response.text();
-            if (!text || text.trim() === '') return null;
-            return JSON.parse(text);
-        } catch (e) {
-            return null;
-        }
-    }
-    
-    // 1. Остановка воспроизведения
-    try {
-        addLog('Остановка воспроизведения...', 'info');
-        const r = await fetch(`/api/${tmsId}/stop`, { method: 'POST' });
-        const data = await safeJsonParse(r);
-        if (r.ok || (data && data.ok)) {
-            addLog('✓ Воспроизведение остановлено', 'success');
-        } else {
-            addLog('✗ Ошибка остановки: ' + (data?.detail || data?.error || 'unknown'), 'error');
-            hasErrors = true;
-        }
-    } catch (e) {
-        addLog('✗ Ошибка остановки: ' + e.message, 'error');
-        hasErrors = true;
-    }
-    
-    // 2. Закрытие шторки (Dowser)
     try {
-        addLog('Закрытие шторки...', 'info');
-        const r = await fetch(`/api/${tmsId}/projector/dowser/close`, { method: 'POST' });
-        const data = await safeJsonParse(r);
-        if (r.ok || (data && data.ok)) {
-            addLog('✓ Шторка закрыта', 'success');
-        } else {
-            addLog('✗ Ошибка закрытия шторки: ' + (data?.detail || data?.error || 'unknown'), 'error');
-            hasErrors = true;
+        const r = await fetch(`/api/${currentHallId}/shutdown-session`, { method: 'POST' });
+        const data = await r.json().catch(() => null);
+        if (!r.ok && !data?.steps) {
+            addLog('✗ Ошибка завершения сеанса: ' + (data?.message || `HTTP ${r.status}`), 'error');
         }
     } catch (e) {
-        addLog('✗ Ошибка закрытия шторки: ' + e.message, 'error');
-        hasErrors = true;
-    }
-    
-    // 3. Выключение лампы
-    try {
-        addLog('Выключение лампы...', 'info');
-        let r;
-        // Временное решение для Зал2 - через макрос
-        if (currentHallId === 'hall2') {
-            r = await fetch('http://192.168.198.21:8089/api/Zal2/activate-projector-macro', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ name: 'Lamp OFF' })
-            });
-        } else {
-            r = await fetch(`/api/${tmsId}/projector/lamp/off`, { method: 'POST' });
-        }
-        const data = await safeJsonParse(r);
-        if (r.ok || (data && data.ok)) {
-            addLog('✓ Лампа выключена', 'success');
-        } else {
-            addLog('✗ Ошибка выключения лампы: ' + (data?.detail || data?.error || 'unknown'), 'error');
-            hasErrors = true;
-        }
-    } catch (e) {
-        addLog('✗ Ошибка выключения лампы: ' + e.message, 'error');
-        hasErrors = true;
-    }
-    
-    // 4. Установка громкости CP750 на 30
-    if (cp750Id) {
-        try {
-            addLog('Установка громкости CP750 → 30...', 'info');
-            const r = await fetch(`/api/cp750/${cp750Id}/fader`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ value: 30, force: false })
-            });
-            const data = await safeJsonParse(r);
-            if (r.ok || (data && (data.success || data.ok))) {
-                addLog('✓ Громкость CP750 установлена на 30', 'success');
-            } else {
-                addLog('✗ Ошибка установки громкости: ' + (data?.detail || data?.error || 'unknown'), 'error');
-                hasErrors = true;
-            }
-        } catch (e) {
-            addLog('✗ Ошибка установки громкости: ' + e.message, 'error');
-            hasErrors = true;
-        }
-        
-        // 5. Переключение входа CP750 на non_sync
-        try {
-            addLog('Переключение входа CP750 → non_sync...', 'info');
-            const r = await fetch(`/api/cp750/${cp750Id}/input-mode`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ mode: 'non_sync' })
-            });
-            const data = await safeJsonParse(r);
-            if (r.ok || (data && (data.success || data.ok))) {
-                addLog('✓ Вход CP750 переключен на non_sync', 'success');
-            } else {
-                addLog('✗ Ошибка переключения входа: ' + (data?.detail || data?.error || 'unknown'), 'error');
-                hasErrors = true;
-            }
-        } catch (e) {
-            addLog('✗ Ошибка переключения входа: ' + e.message, 'error');
-            hasErrors = true;
-        }
-    } else {
-        addLog('⚠ CP750 не настроен для этого зала', 'warning');
-    }
-    
-    if (hasErrors) {
-        addLog('=== СЕАНС ЗАВЕРШЕН С ОШИБКАМИ ===', 'warning');
-    } else {
-        addLog('=== СЕАНС УСПЕШНО ЗАВЕРШЕН ===', 'success');
+        addLog('✗ Ошибка завершения сеанса: ' + e.message, 'error');
     }
     
     btn.disabled = false;
@@ -548,6 +544,14 @@ async function setCP750Fader(value) {
         
         if (!data.success) {
             addLog('Ошибка CP750: ' + (data.error || data.message), 'error');
+        } else if (data.superseded && data.value !== undefined) {
+            // Значение перекрыто более новым (с другой вкладки или быстрым повтором) -
+            // показываем то, что реально применено, если слайдер с тех пор не трогали
+            const slider = document.getElementById('cp750-fader');
+            if (parseInt(slider.value) === parseInt(value)) {
+                slider.value = data.value;
+                updateCP750FaderDisplay(data.value);
+            }
         }
     } catch (error) {
         addLog('Ошибка CP750: ' + error.message, 'error');
@@ -0,0 +1,58 @@
+"""
+Общие фикстуры тестов: приложение импортируется с короткими таймаутами,
+залы и TMS — симуляторы из пакета simulator на свободных портах localhost.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# До импорта barco_multi_hall: конфигурация читается при импорте модуля
+_LOG_DIR = tempfile.mkdtemp(prefix='barco-tests-')
+os.environ.setdefault('AUDIT_LOG_DIR', _LOG_DIR)
+os.environ.setdefault('AUDIT_DB', os.path.join(_LOG_DIR, 'audit.db'))
+os.environ.setdefault('ICMP_AUTOCONNECT', '0')
+os.environ.setdefault('WARMUP_ENABLED', '0')
+os.environ.setdefault('ICMP_REPLY_TIMEOUT', '0.5')
+os.environ.setdefault('SHUTDOWN_POLL_INTERVAL', '0.05')
+os.environ.setdefault('SHUTDOWN_FALLBACK_DELAY', '0.1')
+
+from simulator.site import SimulatedSite  # noqa: E402
+from simulator.state import Faults  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import barco_multi_hall
+    return barco_multi_hall
+
+
+@pytest.fixture
+def site():
+    """Один зал: FakeTms и FakeProjector без задержек и отказов"""
+    site = SimulatedSite(halls=1, tms_faults=Faults(), icmp_faults=Faults(), stream_interval=0.2).start()
+    yield site
+    site.stop()
+
+
+@pytest.fixture
+def hall(site):
+    """Конфигурация зала симулятора со своим tms_base"""
+    hall = dict(site.halls_config()['halls'][0])
+    hall['tms_base'] = site.tms.base_url
+    return hall
+
+
+@pytest.fixture
+def controller(app_module, hall):
+    """Подключённый BarcoController зала симулятора"""
+    controller = app_module.create_controller(hall)
+    success, message = controller.connect()
+    assert success, message
+    yield controller
+    controller.disconnect()
@@ -0,0 +1,98 @@
+"""
+Асинхронный движок (CONTROLLER_ENGINE=async): очередь команд зала в цикле
+и контроллер против симуляторов.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+
+def test_queue_orders_by_priority_without_threads(app_module):
+    async def scenario():
+        release = asyncio.Event()
+        executed = []
+
+        async def execute(command):
+            await release.wait()
+            executed.append(command)
+            return True, 'ACK'
+
+        commands = app_module.AsyncCommandQueue('test', execute, idle_timeout=0.1)
+        threads = threading.active_count()
+        first = commands.submit('PLAYER.Play')
+        await asyncio.sleep(0.05)  # Play уже у исполнителя
+        volume = [commands.submit(f'tm8710.Send Text,"tm8710.sys.fader {i}"') for i in range(3)]
+        stop = commands.submit('PLAYER.Stop')
+        assert threading.active_count() == threads
+        release.set()
+        for future in [first, stop] + volume:
+            assert await future == (True, 'ACK')
+        await asyncio.sleep(0.2)
+        return executed, commands.stats()
+
+    executed, stats = asyncio.run(scenario())
+    assert executed[:2] == ['PLAYER.Play', 'PLAYER.Stop']
+    assert stats['executed'] == 5
+    assert not stats['worker_running']  # исполнитель завершился после простоя
+
+
+def test_queue_full_and_deadline(app_module):
+    async def scenario():
+        release = asyncio.Event()
+
+        async def execute(command):
+            await release.wait()
+            return True, 'ACK'
+
+        commands = app_module.AsyncCommandQueue('test', execute, maxsize=1)
+        commands.submit('PLAYER.Play')
+        await asyncio.sleep(0.05)
+        late = commands.submit('PLAYER.Clear', deadline=time.monotonic() + 0.05)
+        rejected = commands.submit('PLAYER.Stop')
+        assert (await rejected)[1] == 'Очередь команд зала переполнена'
+        await asyncio.sleep(0.1)
+        release.set()
+        return await late, commands.stats()
+
+    (success, message), stats = asyncio.run(scenario())
+    assert not success
+    assert 'крайний срок' in message
+    assert stats['rejected'] == 1
+    assert stats['expired'] == 1
+
+
+@pytest.fixture
+def async_controller(app_module, hall, monkeypatch):
+    monkeypatch.setattr(app_module, 'CONTROLLER_ENGINE', 'async')
+    controller = app_module.create_controller(hall)
+    success, message = controller.connect()
+    assert success, message
+    yield controller
+    controller.disconnect()
+
+
+def test_async_controller_commands(app_module, site, async_controller):
+    assert isinstance(async_controller, app_module.AsyncControllerBridge)
+    assert async_controller.send_command('PLAYER.Play') == (True, 'ACK')
+    assert site.cinema.status_live()['devices'][0]['state'] == 'Play'
+    assert async_controller.actor.stats()['executed'] == 1
+
+
+def test_async_tms_command_is_measured(app_module, site, async_controller):
+    metric = app_module.metric_tms_request
+    key = (async_controller.tms.host, 'background', 'POST', '200')
+
+    def count():
+        histogram = dict(metric.samples()).get(key)
+        return histogram.totals()[2] if histogram is not None else 0
+
+    before = count()
+    requests_before = site.tms.requests
+    assert async_controller.stop()[0]
+    assert site.tms.requests == requests_before + 1
+    assert count() == before + 1
@@ -0,0 +1,138 @@
+"""
+AuditStore: импорт дневных файлов журнала, повторы и выборка.
+"""
+
+import json
+import sqlite3
+import time
+
+import pytest
+
+
+def _text_line(ts, admin, hall, action, details=''):
+    stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))
+    line = f'[{stamp}] Админ: {admin} | Зал: {hall} | Действие: {action}'
+    return line + (f' | {details}' if details else '') + '\n'
+
+
+def _day(ts):
+    return time.strftime('%Y-%m-%d', time.localtime(ts))
+
+
+def _wait_import(store):
+    deadline = time.monotonic() + 10
+    while store.import_state.get('running') and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert not store.import_state.get('running')
+    return store.import_state
+
+
+@pytest.fixture
+def store(app_module, tmp_path):
+    store = app_module.AuditStore(str(tmp_path / 'audit.db'), str(tmp_path))
+    yield store
+    store.close()
+
+
+def test_import_keeps_identical_actions(store, tmp_path):
+    ts = time.time() - 3 * 86400
+    (tmp_path / f'admin_actions_{_day(ts)}.log').write_text(
+        _text_line(ts, 'Иван', 'hall1', 'STOP', 'Успешно') * 2
+        + 'не запись журнала\n'
+        + _text_line(ts + 1, 'Иван', 'hall1', 'PLAY', 'Успешно'),
+        encoding='utf-8')
+
+    store.ensure()
+    state = _wait_import(store)
+
+    assert state['imported'] == 3
+    assert [row['action'] for row in store.query()] == ['PLAY', 'STOP', 'STOP']
+
+
+def test_reimport_is_idempotent(store, tmp_path):
+    ts = time.time() - 86400
+    (tmp_path / f'admin_actions_{_day(ts)}.log').write_text(_text_line(ts, 'A', 'hall1', 'STOP'), encoding='utf-8')
+    store.ensure()
+    _wait_import(store)
+
+    assert store.start_import()
+    state = _wait_import(store)
+    assert state['imported'] == 0
+    assert state['duplicates'] == 1
+    assert store.stats()['entries'] == 1
+
+
+def test_jsonl_preferred_over_text_of_same_day(store, tmp_path):
+    ts = time.time() - 2 * 86400
+    record = {'ts': ts, 'admin': 'A', 'hall': 'hall2', 'action': 'PLAY', 'details': ''}
+    (tmp_path / f'admin_actions_{_day(ts)}.jsonl').write_text(json.dumps(record) + '\n', encoding='utf-8')
+    (tmp_path / f'admin_actions_{_day(ts)}.log').write_text(_text_line(ts, 'A', 'hall2', 'PLAY'), encoding='utf-8')
+
+    store.ensure()
+    state = _wait_import(store)
+
+    assert state['files'] == 1
+    rows = list(store.query())
+    assert len(rows) == 1
+    assert rows[0]['ts'] == pytest.approx(ts)
+
+
+def test_live_rows_are_not_imported_again(store, tmp_path):
+    store.ensure()
+    _wait_import(store)
+    now = time.time()
+    store.insert([{'ts': now, 'admin': 'B', 'hall': 'hall3', 'action': 'STOP', 'details': ''}])
+    # Та же запись в файле дня: AuditLogWriter пишет и в файл, и в базу
+    (tmp_path / f'admin_actions_{_day(now)}.log').write_text(_text_line(now, 'B', 'hall3', 'STOP'), encoding='utf-8')
+
+    assert store.start_import()
+    state = _wait_import(store)
+
+    assert state['imported'] == 0
+    assert store.stats()['entries'] == 1
+
+
+def test_incomplete_last_line_is_skipped(store, tmp_path):
+    ts = time.time() - 86400
+    (tmp_path / f'admin_actions_{_day(ts)}.log').write_text(
+        _text_line(ts, 'A', 'hall1', 'STOP') + _text_line(ts, 'A', 'hall1', 'PLAY').rstrip('\n'),
+        encoding='utf-8')
+    store.ensure()
+    assert _wait_import(store)['imported'] == 1
+
+
+def test_query_filters_and_cursor(store):
+    store.ensure()
+    _wait_import(store)
+    base = time.time() - 100
+    store.insert([{'ts': base + i, 'admin': 'A' if i % 2 else 'B', 'hall': 'hall1',
+                   'action': 'STOP', 'details': f'#{i}'} for i in range(5)])
+
+    page = list(store.query(admin='A', limit=1))
+    assert [row['details'] for row in page] == ['#3']
+    rest = list(store.query(admin='A', cursor=(page[-1]['ts'], page[-1]['id'])))
+    assert [row['details'] for row in rest] == ['#1']
+    assert [row['details'] for row in store.query(text='#4')] == ['#4']
+
+
+def test_base_without_source_column_is_migrated(app_module, tmp_path):
+    path = tmp_path / 'old.db'
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE audit (id INTEGER PRIMARY KEY, ts REAL NOT NULL, admin TEXT NOT NULL,
+                            hall TEXT NOT NULL, action TEXT NOT NULL, details TEXT NOT NULL DEFAULT '');
+        CREATE TABLE audit_meta (key TEXT PRIMARY KEY, value TEXT);
+        INSERT INTO audit_meta VALUES ('logs_import', '2026-10-01T00:00:00');
+        INSERT INTO audit (ts, admin, hall, action) VALUES (1000.0, 'A', 'hall1', 'STOP');
+    """)
+    conn.commit()
+    conn.close()
+    (tmp_path / 'admin_actions_1970-01-01.log').write_text(_text_line(1000.0, 'A', 'hall1', 'STOP'),
+                                                           encoding='utf-8')
+
+    store = app_module.AuditStore(str(path), str(tmp_path))
+    store.ensure()
+    store.start_import()
+    _wait_import(store)
+
+    assert store.stats()['entries'] == 1   # уже перенесённая запись не дублируется
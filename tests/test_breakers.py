@@ -0,0 +1,83 @@
+"""
+Circuit breakers пути TMS -> ICMP: переходы состояний и fallback контроллера.
+"""
+
+import time
+
+
+def test_breaker_transitions(app_module):
+    changes = []
+    breaker = app_module.CircuitBreaker('tms', failure_threshold=2, reset_timeout=0.1,
+                                        on_change=lambda snapshot: changes.append(snapshot['state']))
+    CB = app_module.CircuitBreaker
+
+    assert breaker.allow()
+    breaker.failure('timeout')
+    assert breaker.state == CB.CLOSED
+    breaker.failure('timeout')
+    assert breaker.state == CB.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.15)
+    assert breaker.allow()                  # единственная проба
+    assert breaker.state == CB.HALF_OPEN
+    assert not breaker.allow()
+    breaker.failure('timeout')              # проба не удалась — снова open
+    assert breaker.state == CB.OPEN
+
+    time.sleep(0.15)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == CB.CLOSED
+    assert changes == [CB.OPEN, CB.HALF_OPEN, CB.OPEN, CB.HALF_OPEN, CB.CLOSED]
+    assert breaker.snapshot()['trips'] == 2
+
+
+def test_success_resets_failure_count(app_module):
+    breaker = app_module.CircuitBreaker('tms', failure_threshold=2, reset_timeout=1)
+    breaker.failure('x')
+    breaker.success()
+    breaker.failure('x')
+    assert breaker.state == app_module.CircuitBreaker.CLOSED
+
+
+def test_registry_host_and_device_breakers(app_module):
+    registry = app_module.TmsBreakerRegistry(failure_threshold=1, reset_timeout=60)
+    base = 'http://tms.test'
+
+    registry.failure(base, 'Zal1', 'HTTP 500', host_down=False)
+    assert not registry.allow(base, 'Zal1')
+    assert registry.allow(base, 'Zal2')     # HTTP-ошибка размыкает только устройство
+
+    registry.failure(base, 'Zal2', 'connection refused', host_down=True)
+    assert not registry.allow(base, 'Zal2')
+    assert not registry.allow(base, 'Zal3')  # хост недоступен — все его устройства
+    stats = registry.stats()
+    assert stats['hosts'][base]['state'] == 'open'
+    assert stats['devices'][f'Zal1@{base}']['state'] == 'open'
+
+
+def test_open_breaker_falls_back_to_icmp(app_module, site, controller, monkeypatch):
+    """Пока breaker хоста разомкнут, stop уходит по ICMP без запроса к TMS"""
+    registry = app_module.TmsBreakerRegistry(failure_threshold=1, reset_timeout=60)
+    monkeypatch.setattr(app_module, 'tms_breakers', registry)
+    registry.failure(controller.tms.base_url, controller.tms_id, 'down', host_down=True)
+
+    requests_before = site.tms.requests
+    commands_before = site.projectors[0].commands
+    assert controller.stop() == (True, 'ACK')
+    assert site.tms.requests == requests_before
+    assert site.projectors[0].commands == commands_before + 1
+
+
+def test_tms_failures_open_breaker(app_module, site, controller, monkeypatch):
+    registry = app_module.TmsBreakerRegistry(failure_threshold=2, reset_timeout=60)
+    monkeypatch.setattr(app_module, 'tms_breakers', registry)
+    site.tms.faults.failure_rate = 1.0     # TMS отвечает 503
+
+    for _ in range(2):
+        assert controller.stop()[0]         # fallback по ICMP
+    assert registry.stats()['devices'][f'{controller.tms_id}@{controller.tms.base_url}']['state'] == 'open'
+    requests_before = site.tms.requests
+    assert controller.stop()[0]
+    assert site.tms.requests == requests_before
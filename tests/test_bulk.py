@@ -0,0 +1,55 @@
+"""
+Групповые операции POST /api/bulk: выбор залов и выполнение на симуляторе.
+"""
+
+import pytest
+
+
+@pytest.fixture
+def client(app_module):
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin_name'] = 'Тестовый админ'
+    return client
+
+
+@pytest.fixture
+def halls(app_module, controller, monkeypatch):
+    """В приложении один зал — подключённый контроллер симулятора"""
+    monkeypatch.setattr(app_module, 'controllers', {controller.hall_id: controller})
+    return [controller.hall_id]
+
+
+@pytest.mark.parametrize('body', [
+    {'operation': 'stop'},
+    {'operation': 'stop', 'hall_ids': []},
+    {'operation': 'stop', 'hall_ids': 'hall1'},
+    {'operation': 'stop', 'all': 'yes'},
+])
+def test_halls_must_be_listed_explicitly(client, halls, body):
+    resp = client.post('/api/bulk', json=body)
+    assert resp.status_code == 400
+    assert not resp.get_json()['success']
+
+
+def test_unknown_hall_and_operation_rejected(client, halls):
+    resp = client.post('/api/bulk', json={'operation': 'stop', 'hall_ids': [halls[0], 'nowhere']})
+    assert resp.status_code == 400
+    assert 'nowhere' in resp.get_json()['message']
+    assert client.post('/api/bulk', json={'operation': 'explode', 'all': True}).status_code == 400
+
+
+def test_requires_login(app_module, halls):
+    resp = app_module.app.test_client().post('/api/bulk', json={'operation': 'stop', 'all': True})
+    assert resp.status_code == 401
+
+
+@pytest.mark.parametrize('selection', ['hall_ids', 'all'])
+def test_stop_runs_on_selected_halls(client, halls, site, selection):
+    body = {'operation': 'stop', 'hall_ids': halls} if selection == 'hall_ids' else {'operation': 'stop', 'all': True}
+    resp = client.post('/api/bulk', json=body)
+    assert resp.status_code == 200
+    result = resp.get_json()
+    assert result['success']
+    assert list(result['results']) == halls
+    assert site.cinema.status_live()['devices'][0]['state'] == 'Stop'
@@ -0,0 +1,83 @@
+"""
+LatestValueCoalescer: частые установки громкости одному устройству.
+"""
+
+import threading
+import time
+
+import pytest
+
+
+def test_single_submit_sends_once(app_module):
+    coalescer = app_module.LatestValueCoalescer(min_interval=0)
+    sent = []
+    result = coalescer.submit('cp1', 40, lambda value, merged: sent.append((value, merged)) or 'ok')
+    assert result == (40, 'ok', False)
+    assert sent == [(40, 1)]
+
+
+def test_burst_applies_latest_value(app_module):
+    """Пока идёт отправка, промежуточные значения заменяются последним"""
+    coalescer = app_module.LatestValueCoalescer(min_interval=0)
+    sent = []
+    first_sending = threading.Event()
+    release = threading.Event()
+
+    def send(value, merged):
+        sent.append((value, merged))
+        if len(sent) == 1:
+            first_sending.set()
+            release.wait(2)
+        return f'set {value}'
+
+    results = {}
+
+    def submit(value):
+        results[value] = coalescer.submit('cp1', value, send)
+
+    leader = threading.Thread(target=submit, args=(10,))
+    leader.start()
+    assert first_sending.wait(2)
+    followers = [threading.Thread(target=submit, args=(value,)) for value in (20, 30, 40)]
+    for thread in followers:
+        thread.start()
+        time.sleep(0.02)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(2)
+
+    assert sent == [(10, 1), (40, 3)]
+    assert results[10] == (10, 'set 10', False)
+    assert results[40] == (40, 'set 40', False)
+    assert results[20] == results[30] == (40, 'set 40', True)
+    stats = coalescer.stats()['devices']['cp1']
+    assert stats['requests'] == 4
+    assert stats['sends'] == 2
+    assert stats['superseded'] == 2
+
+
+def test_min_interval_between_sends(app_module):
+    coalescer = app_module.LatestValueCoalescer(min_interval=0.2)
+    sent_at = []
+    send = lambda value, merged: sent_at.append(time.monotonic())
+    coalescer.submit('cp1', 1, send)
+    coalescer.submit('cp1', 2, send)
+    assert sent_at[1] - sent_at[0] >= 0.19
+
+
+def test_keys_are_independent(app_module):
+    coalescer = app_module.LatestValueCoalescer(min_interval=0.5)
+    started = time.monotonic()
+    coalescer.submit('cp1', 1, lambda value, merged: None)
+    coalescer.submit('cp2', 1, lambda value, merged: None)
+    assert time.monotonic() - started < 0.4
+
+
+def test_send_error_is_raised(app_module):
+    coalescer = app_module.LatestValueCoalescer(min_interval=0)
+
+    def send(value, merged):
+        raise RuntimeError('cp750 offline')
+
+    with pytest.raises(RuntimeError):
+        coalescer.submit('cp1', 1, send)
@@ -0,0 +1,80 @@
+"""
+Очередь команд зала (CommandActor): приоритеты, переполнение, крайний срок.
+"""
+
+import threading
+import time
+
+
+def _blocking_actor(app_module, maxsize=32):
+    """Актор, исполнитель которого ждёт release перед каждой командой"""
+    release = threading.Event()
+    executed = []
+
+    def execute(command):
+        release.wait(5)
+        executed.append(command)
+        return True, 'ACK'
+
+    return app_module.CommandActor('test', execute, maxsize=maxsize, idle_timeout=1), release, executed
+
+
+def test_stop_overtakes_queued_volume(app_module):
+    actor, release, executed = _blocking_actor(app_module)
+    first = actor.submit('PLAYER.Play')
+    time.sleep(0.05)  # Play уже у исполнителя
+    volume = [actor.submit(f'tm8710.Send Text,"tm8710.sys.fader {i}"') for i in range(3)]
+    stop = actor.submit('PLAYER.Stop')
+    release.set()
+    for future in [first, stop] + volume:
+        assert future.result(2) == (True, 'ACK')
+    assert executed[0] == 'PLAYER.Play'
+    assert executed[1] == 'PLAYER.Stop'
+    assert executed[2:] == [f'tm8710.Send Text,"tm8710.sys.fader {i}"' for i in range(3)]
+
+
+def test_explicit_priority_overrides_command_table(app_module):
+    actor, release, executed = _blocking_actor(app_module)
+    actor.submit('PLAYER.Play')
+    time.sleep(0.05)
+    normal = actor.submit('PLAYER.Clear')
+    urgent = actor.submit('EKOS.Send Text,"x"', priority=app_module.PRIORITY_URGENT)
+    release.set()
+    normal.result(2)
+    urgent.result(2)
+    assert executed[1:] == ['EKOS.Send Text,"x"', 'PLAYER.Clear']
+
+
+def test_full_queue_rejects_immediately(app_module):
+    actor, release, _ = _blocking_actor(app_module, maxsize=1)
+    actor.submit('PLAYER.Play')
+    time.sleep(0.05)
+    queued = actor.submit('PLAYER.Clear')
+    rejected = actor.submit('PLAYER.Stop')
+    assert rejected.result(0) == (False, 'Очередь команд зала переполнена')
+    release.set()
+    assert queued.result(2) == (True, 'ACK')
+    assert actor.stats()['rejected'] == 1
+
+
+def test_expired_command_is_not_sent(app_module):
+    actor, release, executed = _blocking_actor(app_module)
+    actor.submit('PLAYER.Play')
+    time.sleep(0.05)
+    late = actor.submit('PLAYER.Clear', deadline=time.monotonic() + 0.05)
+    time.sleep(0.1)
+    release.set()
+    success, message = late.result(2)
+    assert not success
+    assert 'крайний срок' in message
+    assert 'PLAYER.Clear' not in executed
+    assert actor.stats()['expired'] == 1
+
+
+def test_call_times_out(app_module):
+    actor, release, _ = _blocking_actor(app_module)
+    try:
+        assert actor.call('PLAYER.Play', timeout=0.1) == (False, 'Команда не выполнена за отведённое время')
+    finally:
+        release.set()
+
@@ -0,0 +1,67 @@
+"""
+HallsConfigStore: перечитывание halls_config.json и инкрементальное обновление контроллеров.
+"""
+
+import json
+import os
+
+import pytest
+
+HALL1 = {'id': 'hall1', 'name': 'Зал 1', 'ip': '127.0.0.1', 'port': 43001}
+HALL2 = {'id': 'hall2', 'name': 'Зал 2', 'ip': '127.0.0.1', 'port': 43002}
+
+
+def _write(path, halls, mtime):
+    path.write_text(json.dumps({'halls': halls}), encoding='utf-8')
+    os.utime(path, (mtime, mtime))  # mtime меняется и при записи в ту же секунду
+
+
+def test_reload_on_change_keeps_last_valid(app_module, tmp_path):
+    path = tmp_path / 'halls_config.json'
+    _write(path, [HALL1], 1000)
+    store = app_module.HallsConfigStore(str(path), check_interval=0)
+    changes = []
+    store.subscribe(lambda old, new: changes.append(([h['id'] for h in old], [h['id'] for h in new])))
+
+    assert [h['id'] for h in store.halls()] == ['hall1']
+    assert not store.maybe_reload()  # файл не менялся
+
+    _write(path, [HALL1, HALL2], 2000)
+    assert [h['id'] for h in store.halls()] == ['hall1', 'hall2']
+
+    path.write_text('{"halls": [', encoding='utf-8')
+    os.utime(path, (3000, 3000))
+    assert [h['id'] for h in store.halls()] == ['hall1', 'hall2']
+    assert changes == [([], ['hall1']), (['hall1'], ['hall1', 'hall2'])]
+
+
+def test_check_interval_limits_stat(app_module, tmp_path):
+    path = tmp_path / 'halls_config.json'
+    _write(path, [HALL1], 1000)
+    store = app_module.HallsConfigStore(str(path), check_interval=60)
+    store.halls()
+    _write(path, [HALL2], 2000)
+    assert [h['id'] for h in store.halls()] == ['hall1']
+
+
+@pytest.fixture
+def controllers(app_module, monkeypatch):
+    controllers = {}
+    monkeypatch.setattr(app_module, 'controllers', controllers)
+    app_module.sync_controllers([], [HALL1, HALL2])
+    return controllers
+
+
+def test_sync_keeps_unchanged_controllers(app_module, controllers):
+    hall1, hall2 = controllers['hall1'], controllers['hall2']
+    hall3 = dict(HALL2, id='hall3', port=43003)
+
+    app_module.sync_controllers([HALL1, HALL2], [dict(HALL1, name='Переименован'), dict(HALL2, port=43020), hall3])
+
+    assert controllers['hall1'] is hall1           # имя не влияет на соединение
+    assert controllers['hall2'] is not hall2       # новый порт — новый контроллер
+    assert controllers['hall2'].port == 43020
+    assert set(controllers) == {'hall1', 'hall2', 'hall3'}
+
+    app_module.sync_controllers([HALL1, HALL2, hall3], [HALL1])
+    assert set(controllers) == {'hall1'}
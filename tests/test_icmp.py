@@ -0,0 +1,74 @@
+"""
+Кадры Barco ICMP (IcmpReader) и команды BarcoController против FakeProjector.
+"""
+
+import socket
+import threading
+
+import pytest
+
+
+def test_reader_splits_frames_across_chunks(app_module):
+    left, right = socket.socketpair()
+    with left, right:
+        reader = app_module.IcmpReader(left)
+        right.sendall(b'AC')
+        threading.Timer(0.05, right.sendall, args=(b'K;;NACK,2;PART',)).start()
+        assert reader.read_frame(1.0) == 'ACK'
+        assert reader.read_frame(1.0) == 'NACK,2'  # пустой кадр ';;' пропускается
+        with pytest.raises(socket.timeout):
+            reader.read_frame(0.1)
+        right.sendall(b'IAL;')
+        assert reader.read_frame(1.0) == 'PARTIAL'
+
+
+def test_reader_reports_closed_connection(app_module):
+    left, right = socket.socketpair()
+    with left:
+        reader = app_module.IcmpReader(left)
+        right.close()
+        with pytest.raises(ConnectionError):
+            reader.read_frame(1.0)
+
+
+def test_command_ack_and_nack(site, controller):
+    assert controller.ack_enabled
+    assert controller.send_command('PLAYER.Stop') == (True, 'ACK')
+    assert site.cinema.status_live()['devices'][0]['state'] == 'Stop'
+
+    site.projectors[0].faults.failure_rate = 1.0
+    success, message = controller.send_command('PLAYER.Play')
+    assert not success
+    assert message.startswith('NACK')
+
+
+def test_late_reply_is_skipped(site, controller):
+    """Ответ, пришедший после таймаута, пропускается и не достаётся следующей команде"""
+    projector = site.projectors[0]
+    projector.faults.latency = 0.8  # дольше ICMP_REPLY_TIMEOUT (0.5 с в тестах)
+    success, message = controller.send_command('PLAYER.Play')
+    assert not success
+    assert 'таймаут' in message
+    assert controller.connected
+    assert controller.late_replies == 1
+
+    projector.faults.latency = 0.0
+    projector.faults.failure_rate = 1.0
+    success, message = controller.send_command('PLAYER.Stop')
+    assert not success
+    assert message.startswith('NACK')  # свой ответ, а не поздний ACK на Play
+    assert controller.late_replies == 0
+
+
+def test_second_timeout_reconnects(site, controller):
+    site.projectors[0].faults.latency = 2.0
+    assert not controller.send_command('PLAYER.Play')[0]
+    assert controller.connected
+    assert not controller.send_command('PLAYER.Stop')[0]
+    assert not controller.connected
+    assert controller.late_replies == 0
+
+
+def test_send_without_connection(controller):
+    controller.disconnect()
+    assert controller.send_command('PLAYER.Stop') == (False, 'Не подключено к устройству')
@@ -0,0 +1,65 @@
+"""
+LogBroadcaster: пачки журнала по комнатам залов и догрузка пропущенного.
+"""
+
+import threading
+import time
+
+
+class RecordingSocketIO:
+    """Вместо SocketIO: запоминает отправленные события"""
+
+    def __init__(self):
+        self.events = []
+        self.sent = threading.Event()
+
+    def emit(self, event, data, to=None):
+        self.events.append((event, data, to))
+        self.sent.set()
+
+
+def _wait_entries(broadcaster, count):
+    deadline = time.monotonic() + 2
+    while broadcaster.stats()['entries'] < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert broadcaster.stats()['entries'] == count
+
+
+def test_batches_per_hall_room(app_module):
+    sio = RecordingSocketIO()
+    broadcaster = app_module.LogBroadcaster(sio, interval=0.1, max_batch=100, backlog=10)
+    for i in range(3):
+        broadcaster.emit('hall1', f'шаг {i}')
+    broadcaster.emit('hall2', 'stop', 'success')
+    _wait_entries(broadcaster, 4)
+
+    by_hall = {data['hall_id']: (data, to) for event, data, to in sio.events}
+    assert [event for event, _, _ in sio.events] == ['log_batch', 'log_batch']
+    data, rooms = by_hall['hall1']
+    assert [e['message'] for e in data['entries']] == ['шаг 0', 'шаг 1', 'шаг 2']
+    assert rooms == [app_module.HallStatusPublisher.room('hall1'), app_module.LogBroadcaster.ALL_ROOM]
+    assert data['epoch'] == broadcaster.epoch
+    assert by_hall['hall2'][0]['entries'][0]['level'] == 'success'
+
+
+def test_full_batch_is_sent_without_waiting(app_module):
+    sio = RecordingSocketIO()
+    broadcaster = app_module.LogBroadcaster(sio, interval=5, max_batch=2)
+    broadcaster.emit('hall1', 'a')
+    broadcaster.emit('hall1', 'b')
+    assert sio.sent.wait(1)
+
+
+def test_catch_up_after_reconnect(app_module):
+    broadcaster = app_module.LogBroadcaster(RecordingSocketIO(), interval=0.01, backlog=3)
+    for i in range(5):
+        broadcaster.emit('hall1', f'#{i}')
+    broadcaster.emit('hall2', 'other')
+
+    seen = broadcaster.catch_up('hall1')['entries']
+    assert [e['message'] for e in seen] == ['#2', '#3', '#4']  # backlog хранит последние 3
+    missed = broadcaster.catch_up('hall1', since=seen[1]['seq'], epoch=broadcaster.epoch)
+    assert [e['message'] for e in missed['entries']] == ['#4']
+    # Другая эпоха (сервер перезапущен) — отдаётся всё хранимое
+    assert len(broadcaster.catch_up('hall1', since=seen[1]['seq'], epoch='old')['entries']) == 3
+    assert [e['hall_id'] for e in broadcaster.catch_up()['entries']][-1] == 'hall2'
@@ -0,0 +1,57 @@
+"""
+Прокси-ответы TMS: ETag и 304, порог и кеш gzip, передача ответа TMS как есть.
+"""
+
+import gzip
+import json
+
+import requests
+
+BODY = json.dumps({'devices': [{'id': f'Zal{i}', 'state': 'Stop'} for i in range(100)]}).encode()
+
+
+def _respond(app_module, body, headers=None, **kwargs):
+    with app_module.app.test_request_context('/api/status/live', headers=headers or {}):
+        return app_module.proxy_response(body, 200, **kwargs)
+
+
+def test_etag_and_not_modified(app_module):
+    first = _respond(app_module, BODY)
+    etag = first.headers['ETag']
+    assert first.status_code == 200
+    assert first.get_data() == BODY
+    assert _respond(app_module, BODY, {'If-None-Match': etag}).status_code == 304
+    assert _respond(app_module, BODY + b' ', {'If-None-Match': etag}).status_code == 200
+
+
+def test_gzip_threshold_and_variant_etag(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'PROXY_GZIP_MIN_SIZE', 1024)
+    accept = {'Accept-Encoding': 'gzip'}
+
+    small = _respond(app_module, b'{"ok": true}', accept)
+    assert 'Content-Encoding' not in small.headers
+
+    packed = _respond(app_module, BODY, accept, etag='abc')
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert packed.headers['ETag'] == '"abc-gz"'
+    assert 'Accept-Encoding' in packed.headers['Vary']
+    assert gzip.decompress(packed.get_data()) == BODY
+    assert _respond(app_module, BODY, dict(accept, **{'If-None-Match': '"abc-gz"'}), etag='abc').status_code == 304
+
+
+def test_repeated_body_is_compressed_once(app_module):
+    app_module._gzip_body.cache_clear()
+    body = BODY + b'\n'
+    for _ in range(3):
+        _respond(app_module, body, {'Accept-Encoding': 'gzip'})
+    info = app_module._gzip_body.cache_info()
+    assert (info.misses, info.hits) == (1, 2)
+
+
+def test_passthrough_keeps_tms_response(app_module, site, hall):
+    r = requests.get(f"{site.tms.base_url}/api/cp750/{hall['cp750_id']}/status", timeout=5)
+    with app_module.app.test_request_context('/api/cp750/x/status'):
+        response = app_module.tms_passthrough(r)
+    assert response.status_code == r.status_code
+    assert response.get_data() == r.content
+    assert response.headers['Content-Type'] == r.headers['Content-Type']
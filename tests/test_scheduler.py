@@ -0,0 +1,87 @@
+"""
+ShowScheduler: срабатывание по расписанию окончаний, пропуски и блокировка между процессами.
+"""
+
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def _at(seconds):
+    return (datetime.now() + timedelta(seconds=seconds)).isoformat(timespec='seconds')
+
+
+@pytest.fixture
+def scheduler(app_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, 'load_halls_config',
+                        lambda: [{'id': 'hall1', 'tms_id': 'Zal1'}, {'id': 'hall2', 'tms_id': 'Zal2'}])
+    monkeypatch.setattr(app_module, 'log_action', lambda *args: None)
+    calls = []
+
+    def run_bulk(hall_id, operation):
+        calls.append((hall_id, operation))
+        return True, 'Готово', [{'action': operation, 'success': True, 'message': 'ok'}], 0.01
+
+    monkeypatch.setattr(app_module, '_run_bulk_operation', run_bulk)
+    path = tmp_path / 'schedule.json'
+    scheduler = app_module.ShowScheduler(path=str(path), refresh=60, misfire_grace=60,
+                                         overlap_gap=120, lock_path=str(tmp_path / 'scheduler.lock'))
+    return scheduler, path, calls
+
+
+def _statuses(scheduler):
+    return {e['hall_id']: (e['status'], e['message']) for e in scheduler.snapshot()['events']}
+
+
+def test_due_event_runs_bulk_operation(scheduler):
+    scheduler, path, calls = scheduler
+    path.write_text(json.dumps({'events': [{'tms_id': 'Zal1', 'end': _at(1), 'action': 'stop'}]}))
+    scheduler.start()
+
+    deadline = time.time() + 5
+    while _statuses(scheduler).get('hall1', ('',))[0] != 'done' and time.time() < deadline:
+        time.sleep(0.05)
+
+    assert calls == [('hall1', 'stop')]
+    assert _statuses(scheduler)['hall1'] == ('done', 'Готово')
+    assert scheduler.snapshot()['active']
+
+
+def test_reload_marks_missed_and_overlapping(scheduler):
+    scheduler, path, calls = scheduler
+    path.write_text(json.dumps({'events': [
+        {'hall_id': 'hall1', 'end': _at(-3600)},
+        {'hall_id': 'hall2', 'end': _at(600), 'action': 'stop'},
+        {'hall_id': 'hall2', 'start': _at(660), 'end': _at(4000), 'action': 'stop'},
+        {'hall_id': 'nowhere', 'end': _at(600)},
+    ]}))
+
+    ok, _ = scheduler.reload()
+
+    assert ok
+    events = scheduler.snapshot()['events']
+    assert [e['status'] for e in events] == ['missed', 'skipped', 'pending']
+    assert events[1]['message'].startswith('Следующий сеанс начинается')
+    assert len(scheduler._heap) == 2  # пропущенное при загрузке событие в куче не ждёт
+
+
+def test_invalid_schedule_keeps_previous(scheduler):
+    scheduler, path, calls = scheduler
+    path.write_text(json.dumps({'events': [{'hall_id': 'hall1', 'end': _at(600)}]}))
+    scheduler.reload()
+    path.write_text('{"events": [')
+
+    ok, message = scheduler.reload()
+
+    assert not ok
+    assert scheduler.snapshot()['error'] == message
+    assert _statuses(scheduler)['hall1'][0] == 'pending'
+
+
+def test_only_one_process_claims_lock(app_module, scheduler):
+    scheduler, _, _ = scheduler
+    other = app_module.ShowScheduler(lock_path=scheduler.lock_path)
+    assert scheduler._claim()
+    assert not other._claim()
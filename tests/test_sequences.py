@@ -0,0 +1,111 @@
+"""
+Последовательности залов: проверка описания, слияние с шагами зала и выполнение на симуляторе.
+"""
+
+import pytest
+
+HALL = {'id': 'hall1', 'tms_id': 'Zal1', 'cp750_id': 'Zal1_cp750'}
+
+
+def test_default_shutdown_levels(app_module):
+    sequence = app_module.compile_sequence('shutdown', HALL, app_module._SHUTDOWN_STEPS)
+    assert sequence.levels[0] == ['stop']
+    assert set(sequence.levels[1]) == {'dowser_close', 'lamp_off', 'cp750_volume'}
+    assert set(sequence.levels[2]) == {'cp750_input', 'clear', 'lights_on'}
+    lamp_off = next(step for step in sequence.steps if step['id'] == 'lamp_off')
+    assert lamp_off['timeout'] == app_module.SHUTDOWN_LAMP_TIMEOUT
+
+
+@pytest.mark.parametrize('steps, error', [
+    ([{'op': 'stop'}, {'op': 'stop'}], 'описан дважды'),
+    ([{'op': 'explode'}], 'неизвестная операция'),
+    ([{'op': 'stop', 'wait': 'forever'}], 'неизвестное ожидание'),
+    ([{'op': 'stop', 'after': ['play']}], 'неизвестная зависимость'),
+    ([{'op': 'tms', 'path': '/api/{device}/stop'}], 'некорректный path'),
+    ([{'op': 'icmp'}], 'нет command'),
+    ([{'op': 'volume'}], 'нет level'),
+    ([{'id': 'a', 'op': 'stop', 'after': ['b']}, {'id': 'b', 'op': 'play', 'after': ['a']}],
+     'циклическая зависимость'),
+])
+def test_compile_rejects_invalid_steps(app_module, steps, error):
+    with pytest.raises(ValueError, match=error):
+        app_module.compile_sequence('broken', HALL, steps)
+
+
+def test_skip_keeps_order_of_dependent_steps(app_module):
+    steps = app_module._merge_sequence(app_module._SHUTDOWN_STEPS, [{'id': 'lamp_off', 'skip': True}])
+    by_id = {step['id']: step for step in steps}
+    assert 'lamp_off' not in by_id
+    assert by_id['clear']['after'] == ['stop']
+    assert by_id['lights_on']['after'] == ['stop']
+
+
+def test_engine_keeps_last_valid_sequence(app_module):
+    engine = app_module.SequenceEngine()
+    engine.load({'halls': [dict(HALL)]})
+    valid = engine.get('hall1', 'shutdown')
+    engine.load({'halls': [dict(HALL, sequences={'shutdown': [{'id': 'stop', 'after': ['nowhere']}]})]})
+    assert engine.get('hall1', 'shutdown') is valid
+    assert 'hall1/shutdown' in engine.errors
+
+
+def test_shutdown_runs_against_simulator(app_module, site, hall, controller, monkeypatch):
+    monkeypatch.setitem(app_module.controllers, hall['id'], controller)
+    engine = app_module.SequenceEngine()
+    engine.load({'halls': [hall]})
+    finished = []
+
+    success, steps, elapsed = engine.run(hall['id'], 'shutdown', on_step=finished.append)
+
+    assert success, steps
+    assert len(finished) == len(steps) == len(app_module._SHUTDOWN_STEPS)
+    by_id = {step['action']: step for step in steps}
+    assert by_id['stop']['wait_outcome'] == 'reached'
+    assert by_id['lamp_off']['wait_outcome'] == 'reached'
+    assert by_id['clear']['started'] >= by_id['lamp_off']['started'] + by_id['lamp_off']['elapsed'] - 0.01
+
+    device = site.cinema.devices[hall['tms_id']]
+    assert device['state'] == 'Stop'
+    assert device['lamp'] == 'Off'
+    assert device['dowser'] == 'Closed'
+    assert device['cp750']['level'] == 30
+    assert device['cp750']['input_mode'] == 'non_sync'
+
+
+def test_required_step_is_skipped_after_failure(app_module, site, hall, controller, monkeypatch):
+    monkeypatch.setitem(app_module.controllers, hall['id'], controller)
+    engine = app_module.SequenceEngine()
+    engine.load({'halls': [dict(hall, sequences={'demo': [
+        {'id': 'bad', 'op': 'icmp', 'command': 'UNKNOWN.Command'},
+        {'id': 'after_bad', 'op': 'clear', 'after': ['bad'], 'require_success': True},
+    ]})]})
+
+    success, steps, _ = engine.run(hall['id'], 'demo')
+
+    assert not success
+    assert steps[0]['message'].startswith('NACK')
+    assert steps[1]['message'] == 'Пропущено: ошибка шага bad'
+
+
+def test_icmp_steps_skipped_without_connection(app_module, site, hall, controller, monkeypatch):
+    """Без ICMP завершение сеанса идёт через TMS, шаги только по ICMP пропускаются"""
+    monkeypatch.setitem(app_module.controllers, hall['id'], controller)
+    controller.disconnect()
+    engine = app_module.SequenceEngine()
+    engine.load({'halls': [hall]})
+
+    success, steps, _ = engine.run(hall['id'], 'shutdown')
+
+    assert not success
+    by_id = {step['action']: step for step in steps}
+    assert by_id['stop']['success'] and by_id['lamp_off']['success']
+    assert by_id['cp750_input']['success']
+    for step_id in ('clear', 'lights_on'):
+        assert by_id[step_id]['message'] == 'Пропущено: нет ICMP-подключения'
+    assert site.cinema.devices[hall['tms_id']]['state'] == 'Stop'
+
+
+def test_protocols_share_default_shutdown(app_module):
+    engine = app_module.SequenceEngine()
+    engine.load({'halls': [dict(HALL), dict(HALL, id='hall2', protocol='dolby')]})
+    assert engine.get('hall1', 'shutdown').levels == engine.get('hall2', 'shutdown').levels
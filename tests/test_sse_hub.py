@@ -0,0 +1,57 @@
+"""
+StatusStreamHub: одна подписка на SSE-стрим TMS для всех клиентов, медленные клиенты.
+"""
+
+import requests
+
+
+class ChunkedUpstream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def iter_content(self, chunk_size=None):
+        return iter(self.chunks)
+
+
+def test_events_split_across_chunks(app_module):
+    upstream = ChunkedUpstream([b'data: {"a"', b': 1}\r\n\r\ndata: 2\n', b'\n', b'\n\n', b'data: tail'])
+    events = list(app_module.StatusStreamHub._iter_events(upstream))
+    assert events == [b'data: {"a": 1}\n\n', b'data: 2\n\n']
+
+
+def test_slow_client_loses_oldest_then_is_dropped(app_module):
+    hub = app_module.StatusStreamHub(lambda: None, queue_size=2, max_skips=2)
+    sub = app_module.StreamSubscriber(2)
+    for i in range(4):
+        hub._offer(sub, f'e{i}')
+    assert not sub.dropped
+    assert [sub.queue.get_nowait() for _ in range(2)] == ['e2', 'e3']
+
+    for i in range(4, 9):
+        hub._offer(sub, f'e{i}')
+    assert sub.dropped
+    assert hub.stats()['dropped_clients'] == 1
+    assert list(sub.queue.queue)[-1] is None  # генератор ответа завершится
+
+
+def test_clients_share_one_upstream(app_module, site):
+    opened = []
+
+    def open_stream():
+        opened.append(1)
+        return requests.get(f'{site.tms.base_url}/api/status/stream', stream=True, timeout=5)
+
+    hub = app_module.StatusStreamHub(open_stream, idle_grace=0.1)
+    first = hub.subscribe()
+    event = first.queue.get(timeout=3)
+    assert event.startswith(b'data:')
+
+    second = hub.subscribe()
+    assert second.queue.get(timeout=1)  # последнее событие сразу
+    first.queue.get(timeout=3)
+    assert len(opened) == 1
+    assert hub.stats()['subscribers'] == 2
+    assert hub.stats()['upstream_connected']
+
+    hub.unsubscribe(first)
+    hub.unsubscribe(second)
@@ -0,0 +1,72 @@
+"""
+StatusCache: объединение одновременных запросов, ttl и /api/status/live с ETag.
+"""
+
+import threading
+import time
+
+import requests
+
+
+class FakeResponse:
+    def __init__(self, body=b'{"devices": []}', status_code=200):
+        self.status_code = status_code
+        self.content = body
+        self.headers = {'Content-Type': 'application/json'}
+
+
+def test_concurrent_misses_share_one_fetch(app_module):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return FakeResponse()
+
+    cache = app_module.StatusCache(fetch, ttl=5, idle_timeout=0.1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get())) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(2)
+
+    assert len(calls) == 1
+    assert len({id(snapshot) for snapshot in results}) == 1
+    stats = cache.stats()
+    assert stats['upstream_fetches'] == 1
+    assert stats['coalesced'] >= 9     # и фоновое обновление, если успело стартовать
+
+
+def test_fresh_snapshot_is_reused(app_module):
+    calls = []
+    cache = app_module.StatusCache(lambda: calls.append(1) or FakeResponse(), ttl=5, idle_timeout=0.1)
+    first = cache.get()
+    assert cache.get() is first
+    assert cache.get(max_age=0) is not first
+    assert len(calls) == 2
+    assert cache.stats()['hits'] >= 1
+
+
+def test_fetch_error_becomes_502_snapshot(app_module):
+    def fetch():
+        raise requests.ConnectionError('connection refused')
+
+    snapshot = app_module.StatusCache(fetch, idle_timeout=0.1).get()
+    assert snapshot.status_code == 502
+    assert snapshot.data['ok'] is False
+
+
+def test_status_live_not_modified(app_module, site, monkeypatch):
+    cache = app_module.StatusCache(lambda: requests.get(f'{site.tms.base_url}/api/status/live', timeout=5),
+                                   ttl=5, idle_timeout=0.1)
+    monkeypatch.setattr(app_module, 'status_cache', cache)
+    client = app_module.app.test_client()
+
+    first = client.get('/api/status/live')
+    assert first.status_code == 200
+    assert first.get_json()['devices']
+    again = client.get('/api/status/live', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.get_data() == b''
+    assert cache.stats()['upstream_fetches'] == 1
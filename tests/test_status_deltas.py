@@ -0,0 +1,65 @@
+"""
+Push статуса залов: diff_status и рассылка полного статуса и дельт по комнатам.
+"""
+
+import time
+
+import pytest
+
+
+class RecordingSocketIO:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, data, to=None, **kwargs):
+        self.events.append((event, data, to))
+
+
+def test_diff_status_nested(app_module):
+    old = {'state': 'Play', 'status': {'Lamp': 'On', 'Dowser': 'Open', 'Temp': 30}, 'list': [1, 2]}
+    new = {'state': 'Play', 'status': {'Lamp': 'Off', 'Dowser': 'Open'}, 'list': [1, 2, 3], 'cp750': 40}
+    changed, removed = app_module.diff_status(old, new)
+    assert changed == {'status': {'Lamp': 'Off'}, 'list': [1, 2, 3], 'cp750': 40}
+    assert removed == [['status', 'Temp']]
+    assert app_module.diff_status(new, new) == ({}, [])
+
+
+@pytest.fixture
+def publisher(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'load_halls_config',
+                        lambda: [{'id': 'hall1', 'name': 'Зал 1', 'tms_id': 'Zal1'},
+                                 {'id': 'hall2', 'name': 'Зал 2', 'tms_id': 'Zal2'}])
+    sio = RecordingSocketIO()
+    publisher = app_module.HallStatusPublisher(cache=None, socketio=sio)
+    publisher._members['sid1'] = 'hall1'  # клиент в комнате зала 1
+    return publisher, sio
+
+
+def _snapshot(app_module, *devices):
+    return app_module.StatusSnapshot.from_data(200, {'devices': list(devices)}, time.monotonic())
+
+
+def test_full_then_delta_per_room(app_module, publisher):
+    publisher, sio = publisher
+    zal1 = {'id': 'Zal1', 'state': 'Play', 'lamp': 'On'}
+    zal2 = {'id': 'Zal2', 'state': 'Stop', 'lamp': 'Off'}
+
+    publisher._publish(_snapshot(app_module, zal1, zal2))
+    publisher._publish(_snapshot(app_module, dict(zal1, lamp='Off'), dict(zal2, state='Play')))
+    publisher._publish(_snapshot(app_module, dict(zal1, lamp='Off'), dict(zal2, state='Play')))
+
+    room = app_module.HallStatusPublisher.room('hall1')
+    assert sio.events == [
+        ('status_full', {'hall_id': 'hall1', 'device': zal1, 'version': 1}, room),
+        ('status_delta', {'hall_id': 'hall1', 'changed': {'lamp': 'Off'}, 'removed': [], 'version': 2}, room),
+    ]
+    # Зал без клиентов не рассылается, но его версия растёт
+    assert publisher._versions['hall2'] == 2
+
+
+def test_device_disappears(app_module, publisher):
+    publisher, sio = publisher
+    publisher._publish(_snapshot(app_module, {'id': 'Zal1', 'state': 'Play'}))
+    publisher._publish(_snapshot(app_module))
+    assert sio.events[-1] == ('status_full', {'hall_id': 'hall1', 'device': None, 'version': 2},
+                              app_module.HallStatusPublisher.room('hall1'))
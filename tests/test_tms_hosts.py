@@ -0,0 +1,93 @@
+"""
+Несколько хостов TMS: выбор хоста по tms_base зала и сводный статус.
+"""
+
+import time
+
+import pytest
+
+from simulator.site import SimulatedSite
+from simulator.state import Faults
+
+
+class Host:
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+
+def test_merge_tms_devices(app_module):
+    merge = app_module.merge_tms_devices
+    a, b, c = Host('http://a'), Host('http://b'), Host('http://c')
+    merged = merge([
+        (a, 200, {'ok': True, 'devices': [{'id': 'Zal1'}]}),
+        (b, 503, {'ok': False, 'error': 'TMS недоступен'}),
+        (c, None, None),
+    ])
+    assert merged == {
+        'ok': True,
+        'devices': [{'id': 'Zal1', 'tms_base': 'http://a'}],
+        'errors': {'http://b': 'TMS недоступен', 'http://c': 'timeout'},
+    }
+    assert merge([(c, 500, None)]) == {'ok': False, 'devices': [], 'errors': {'http://c': 'HTTP 500'}}
+
+
+def test_registry_routes_halls_by_tms_base(app_module, monkeypatch):
+    halls = [
+        {'id': 'hall1', 'tms_id': 'Zal1'},
+        {'id': 'hall2', 'tms_id': 'Zal2', 'cp750_id': 'Zal2_cp750', 'tms_base': 'http://tms2:5000/'},
+        {'id': 'hall3', 'tms_id': 'Zal3', 'tms_base': 'http://tms2:5000'},
+    ]
+    monkeypatch.setattr(app_module, 'load_halls_config', lambda: halls)
+    registry = app_module.TmsRegistry('http://tms1:5000/')
+
+    assert registry.for_hall(halls[0]) is registry.default
+    second = registry.for_hall(halls[1])
+    assert second is registry.for_hall(halls[2])  # завершающий / не создаёт второй хост
+    assert second.base_url == 'http://tms2:5000'
+    assert registry.for_device('Zal2_cp750') is second
+    assert registry.for_device('unknown') is registry.default
+    assert registry.active() == [registry.default, second]
+    assert second.client.status_class == 'tms@tms2:5000.status'
+
+
+def test_gather_does_not_wait_for_slow_host(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'load_halls_config', lambda: [])
+    registry = app_module.TmsRegistry('http://tms1:5000')
+    slow = registry.host('http://tms2:5000')
+
+    started = time.monotonic()
+    results = registry.gather(lambda host: time.sleep(1) if host is slow else 'ok',
+                              [registry.default, slow], timeout=0.2)
+
+    assert time.monotonic() - started < 0.8
+    assert [future.done() for _, future in results] == [True, False]
+
+
+@pytest.fixture
+def second_site():
+    site = SimulatedSite(halls=1, tms_faults=Faults(), icmp_faults=Faults(), stream_interval=0.2).start()
+    yield site
+    site.stop()
+
+
+def test_merged_status_from_two_tms(app_module, site, second_site, monkeypatch):
+    halls = [
+        {'id': 'hall1', 'tms_id': 'Zal1'},
+        {'id': 'hall2', 'tms_id': 'Zal1', 'tms_base': second_site.tms.base_url},
+    ]
+    monkeypatch.setattr(app_module, 'load_halls_config', lambda: halls)
+    registry = app_module.TmsRegistry(site.tms.base_url)
+    cache = app_module.MergedStatusCache(registry)
+
+    snapshot = cache.get()
+
+    assert snapshot.status_code == 200
+    assert sorted(d['tms_base'] for d in snapshot.data['devices']) == sorted(
+        [site.tms.base_url, second_site.tms.base_url])
+    assert cache.get() is snapshot  # снимки хостов не менялись
+
+    second_site.tms.faults.failure_rate = 1.0  # второй TMS отвечает 503
+    degraded = cache.get(max_age=0)
+    assert degraded.data['ok']
+    assert list(degraded.data['errors']) == [second_site.tms.base_url]
+    assert [d['tms_base'] for d in degraded.data['devices']] == [site.tms.base_url]
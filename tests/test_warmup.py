@@ -0,0 +1,38 @@
+"""
+StartupWarmup: прогрев хоста TMS и ICMP-соединений залов без разрыва открытых.
+"""
+
+
+def test_warm_host_fills_status_cache(app_module, site, hall):
+    result = app_module.StartupWarmup._warm_host(app_module.tms_hosts.for_hall(hall))
+    assert result['ok']
+    assert hall['tms_id'] in result['device_ids']
+
+
+def test_open_connection_is_kept(app_module, controller, hall, monkeypatch):
+    monkeypatch.setitem(app_module.controllers, hall['id'], controller)
+    sock = controller.socket
+
+    result = app_module.StartupWarmup._warm_hall(hall, True)
+
+    assert result['icmp'] == 'connected'
+    assert controller.socket is sock
+
+
+def test_connect_if_disconnected_checks_under_lock(controller):
+    """Соединение, открытое между проверкой и connect(), не переподключается"""
+    sock = controller.socket
+    assert controller.connect(if_disconnected=True) == (True, 'Уже подключено')
+    assert controller.socket is sock
+
+
+def test_disconnected_hall_is_connected(app_module, controller, hall, monkeypatch):
+    monkeypatch.setitem(app_module.controllers, hall['id'], controller)
+    controller.disconnect()
+
+    result = app_module.StartupWarmup._warm_hall(hall, True)
+
+    assert result['ok'] and result['icmp'] == 'connected'
+    assert result['ack']
+    assert controller.connected
+    assert app_module.StartupWarmup._warm_hall(dict(hall, id='nowhere'), True)['error'] == 'Зал не найден'